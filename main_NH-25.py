@@ -1,7 +1,10 @@
+from src.startup import StartupProfiler
+profiler = StartupProfiler()
+
 import threading
-import time
 import sys
-from pixtendv2l import PiXtendV2L
+import argparse
+import tomllib
 from webgui import shared_state
 
 # Redirect stdout globally
@@ -9,33 +12,64 @@ from webgui import shared_state
 # sys.stdout = shared_state.PromptLogger()
 # sys.stderr = shared_state.PromptLogger()
 
-from src.utils import load_sensors_from_toml, load_actuators_from_toml
-from src.routines import routines
-
-def start_flask():
-    try:
-        print("[Flask] Starting Flask server...")
-        from webgui.app import app
-        app.run(debug=False, port=5050, host="0.0.0.0")
-    except Exception as e:
-        print(f"[Flask] Failed to start Flask: {e}")
+from src.utils import load_ios_from_toml, load_io_list, get_file_path
+from src.hal import load_backend
+from src.io_registry import IORegistry
+from src.commands import CommandBus
+from src.controller import Controller
+from src.signal_history import SignalHistory
+from webgui.ipc import SharedImage, GuiProcess
 
 def main():
-    # Start Flask in a background thread
-    flask_thread = threading.Thread(target=start_flask, daemon=True)
-    flask_thread.start()
-    
-    time.sleep(2)  # Give Flask time to initialize
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true", help="print duration of the startup phases")
+    args = parser.parse_args()
+    profiler.enabled = args.profile_startup
+    profiler.mark("imports")
+
+    # Commands for the controller (from the GUI); the status is shared before the GUI gets the acknowledgement
+    bus = CommandBus()
+
+    def share_status(command, result):
+        shared_state.is_running = controller.running
+        shared_state.active_routines = set(controller.selected)
+        if command.action in ("start", "reload_parameters"):
+            pl = controller.routines.parameter_list
+            shared_state.prompt_log.set_capacity(int(pl.get("prompt_log_capacity", 1000)))
+
+    bus.listeners.append(share_status)
+
+    # Start the web GUI in its own process (initializes while the IOs are configured), it reads the
+    # shared process image of this process and sends commands (see 'webgui/ipc.py')
+    io_list = load_io_list("read", "io_list.toml")
+    image = SharedImage([meta["name"] for meta in io_list["sensor"]], [meta["name"] for meta in io_list["actuator"]],
+                        sorted(shared_state.available_routines))
+    with open(get_file_path("read", "parameters.toml"), "rb") as f:
+        pl = tomllib.load(f)
+
+    # recent sensor values of the controller, in shared memory for the trend lines of the GUI (no file access)
+    history = SignalHistory.for_window(float(pl.get("history_window_h", 24))*3600, float(pl.get("dataq_sampling_interval", 60.0)),
+                                       [meta["name"] for meta in io_list["sensor"]], shared=True)
+    print(f"Signal history: {len(history.names)} sensors x {history.capacity} samples ({history.nbytes/1e6:.1f} MB)")
+
+    gui = GuiProcess(image, bus, workers=int(pl.get("gui_workers", 8)), history=history)
+    gui.start()
  
-    # Initialize PiXtend and IO
-    pxt = PiXtendV2L()
+    # Initialize PiXtend and IO (real or simulated hardware, see 'hal_backend' in parameters.toml)
+    backend = load_backend(get_file_path("read", "parameters.toml"), get_file_path("read", "simulation.toml"))
+    pxt = backend.create_pxt()
+    profiler.mark("PiXtend")
+
     folder = "read"
     file_name = "io_list.toml"
-    sensors = load_sensors_from_toml(folder, file_name, pxt)
-    actuators = load_actuators_from_toml(folder, file_name, pxt)
+    sensors, actuators = load_ios_from_toml(folder, file_name, pxt)
 
-    sensor_name_list = [s.name for s in sensors]
-    actuator_name_list = [a.name for a in actuators]
+    # resolve sensor and actuator names once
+    io = IORegistry(sensors, actuators)
+    profiler.mark("IO configuration")
+
+    gui.ready_event.wait()
+    profiler.mark("Flask")
 
     # Share state
     shared_state.sensors = sensors
@@ -43,44 +77,32 @@ def main():
     shared_state.sensor_map = {s.name: s for s in sensors}
     shared_state.actuator_map = {a.name: a for a in actuators}
 
-    while True:
-        if shared_state.is_running:
-            start_time = time.time()
-            routines_ = routines(start_time, "parameters.toml", "log_file.csv")
-            shared_state.routines_instance = routines_
-
-            threads = []
-
-            def maybe_add(name, target, args):
-                if name in shared_state.active_routines:
-                    threads.append(threading.Thread(target=target, args=args))
-
-            maybe_add("data_acquisition", routines_.data_acquisition, (sensors, actuators))
-            maybe_add("stabilizer_stirrer", routines_.stabilizer_stirrer, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("evaporator_feed", routines_.evaporator_feed, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("collector_flush", routines_.collector_flush, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("collector_drain", routines_.collector_drain, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("evaporation", routines_.evaporation, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("concentrate_discharge", routines_.concentrate_discharge, (actuators, sensors, actuator_name_list, sensor_name_list))
-            maybe_add("observer", routines_.observer, (sensors, sensor_name_list))
-            maybe_add("print_sensor_values_to_prompt", routines_.print_sensor_values_to_prompt, (sensors, sensor_name_list))
-            maybe_add("print_sensor_values_to_prompt", routines_.CaOH2_refill, args=(actuators, actuator_name_list))
-
-            for t in threads:
-                t.start()
-
-            try:
-                while not routines_.shutdown_event.is_set():
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                routines_.handle_shutdown(pxt)
-
-            for t in threads:
-                t.join()
-            shared_state.is_running = False
-
-        else:
-            time.sleep(1)  # Polling for Start command
+    # routines instance is created once and kept between runs
+    controller = Controller(pxt, io, shared_state.active_routines, shared_state.available_routines)
+    controller.routines.history = history
+    shared_state.routines_instance = controller.routines
+    shared_state.supervisor = controller.supervisor
+    controller.routines.acquisition_listeners.append(gui.publisher.notify)
+
+    # startup profile is reported once, after the first acquired sample
+    def report_startup():
+        controller.started.wait()
+        profiler.mark("waiting for start command", waiting=True)
+        controller.routines.first_sample_event.wait()
+        profiler.mark("first sample")
+        profiler.report()
+
+    if profiler.enabled:
+        threading.Thread(target=report_startup, daemon=True).start()
+
+    try:
+        controller.run(bus)
+    except KeyboardInterrupt:
+        controller.shutdown()
+    finally:
+        gui.stop()
+        image.close()
+        history.close()
 
 if __name__ == "__main__":
     main()
@@ -1,31 +1,44 @@
+from src.startup import StartupProfiler
+profiler = StartupProfiler()
+
 import threading
 import time
+import argparse
+import asyncio
 
-from pixtendv2l import PiXtendV2L
-from src.utils import load_sensors_from_toml, load_actuators_from_toml
+from src.utils import load_ios_from_toml, get_file_path
+from src.hal import load_backend
 from src.routines import routines
+from src.sampler import create_analog_sampler
+from src.process_image import ProcessImage
+from src.io_registry import IORegistry
+from src.async_runtime import AsyncRuntime
 from webgui import shared_state
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true", help="print duration of the startup phases")
+    parser.add_argument("--runtime", choices=["threads", "asyncio"], default="threads", help="run routines in one thread each or as coroutines on one event loop")
+    args = parser.parse_args()
+    profiler.enabled = args.profile_startup
+    profiler.mark("imports")
 
-    # create a PiXtend instance
-    pxt = PiXtendV2L()
+    # create a PiXtend instance (real or simulated hardware, see 'hal_backend' in parameters.toml)
+    backend = load_backend(get_file_path("read", "parameters.toml"), get_file_path("read", "simulation.toml"))
+    pxt = backend.create_pxt()
+    profiler.mark("PiXtend")
 
     # create sensor and actuator instances
     folder = "read"
     file_name = "io_list.toml"
 
-    sensors = load_sensors_from_toml(folder, file_name, pxt)
-    sensor_name_list = []
-    for sensor in sensors:
-        sensor_name_list.append(sensor.name)
-    print(sensor_name_list)
+    sensors, actuators = load_ios_from_toml(folder, file_name, pxt)
 
-    actuators = load_actuators_from_toml(folder, file_name, pxt)
-    actuator_name_list = []
-    for actuator in actuators:
-        actuator_name_list.append(actuator.name)
+    # resolve sensor and actuator names once
+    io = IORegistry(sensors, actuators)
+    print(io.sensor_names)
+    profiler.mark("IO configuration")
 
     # pass sensors and actuators instances to shared_state for accessing in flask app (for GUI)
     shared_state.sensors = sensors
@@ -40,31 +53,70 @@ def main():
     routines_.add_log_file_entry('program_run', 1)
     print("\n Program started")
 
-    # Create threads for all parallel tasks
+    # start PiXtend process image and background sampler for analog inputs (filtered values)
+    pl = routines_.load_parameter_list()
+    process_image = ProcessImage(pxt, float(pl.get("px_cycle_time", 0.03)))
+    process_image.attach(sensors, actuators)
+    process_image.start()
+    sampler = create_analog_sampler(sensors, pxt, pl, process_image, routines_.signals)
+    sampler.start()
+
+    # Routines for all parallel tasks (after checking that all required sensors and actuators exist)
+    routine_names = [
+        "data_acquisition",
+        "stabilizer_stirrer",
+        "evaporator_feed",
+        "collector_flush",
+        "collector_drain",
+        "evaporation",
+        "concentrate_discharge",
+        "observer",
+        "print_sensor_values_to_prompt",
+        "CaOH2_refill",
+    ]
+    routines_.check_required_ios(io, routine_names)
+
+    def report_startup():
+        profiler.mark("routines")
+        routines_.first_sample_event.wait()
+        profiler.mark("first sample")
+        profiler.report()
+
+    def shutdown():
+        routines_.add_log_file_entry('program_run',0)
+        print("\n Program stopped")
+        sampler.stop()
+        process_image.stop()
+        routines_.handle_shutdown(pxt)
+
+    if args.runtime == "asyncio":
+        # all routines as coroutines on one event loop, blocking hardware access in a bounded executor
+        runtime = AsyncRuntime(routines_, io, max_workers=int(pl.get("async_io_workers", 4)))
+        if profiler.enabled:
+            threading.Thread(target=report_startup, daemon=True).start()
+        try:
+            asyncio.run(runtime.run(routine_names))
+        except KeyboardInterrupt:
+            shutdown()
+        return
+
     threads = []
-    threads.append(threading.Thread(target=routines_.data_acquisition, args=(sensors, actuators,)))
-    threads.append(threading.Thread(target=routines_.stabilizer_stirrer, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.evaporator_feed, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.collector_flush, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.collector_drain, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.evaporation, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.concentrate_discharge, args=(actuators, sensors, actuator_name_list, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.observer, args=(sensors, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.print_sensor_values_to_prompt, args=(sensors, sensor_name_list,)))
-    threads.append(threading.Thread(target=routines_.CaOH2_refill, args=(actuators, actuator_name_list,)))
+    for name in routine_names:
+        threads.append(threading.Thread(target=getattr(routines_, name), args=(io,)))
 
     # Start threads
     for thread in threads:
         thread.start()
 
+    if profiler.enabled:
+        report_startup()
+
     # Set up signal handler for graceful shutdown on Ctrl+C
     try:
         while not routines_.shutdown_event.is_set():
             time.sleep(1)  # Main thread is waiting, keeping the program running
     except KeyboardInterrupt:
-        routines_.add_log_file_entry('program_run',0)
-        print("\n Program stopped")
-        routines_.handle_shutdown(pxt)
+        shutdown()
         
     
     # Wait for threads to finish
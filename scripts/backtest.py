@@ -0,0 +1,88 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+import tomllib
+from collections import Counter
+from pathlib import Path
+
+from src.backtest import load_archive, archived_decisions, switching_summary, run_backtest
+from src.utils import get_file_path
+
+
+def load_parameter_sets(file_paths):
+    """
+    One parameter set per TOML file (overrides of 'read/parameters.toml', named after the file).
+    The current parameters are always evaluated as 'baseline'.
+    """
+    sets = [("baseline", {})]
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            sets.append((Path(file_path).stem, {key: str(value) for key, value in tomllib.load(f).items()}))
+    return sets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived measurement files through the routine decision logic.")
+    parser.add_argument("files", nargs="*", help="daily measurement files (default: data/*_measurement_data.csv)")
+    parser.add_argument("--parameters", action="append", default=[], help="TOML file with a candidate parameter set (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--decisions", help="write all replayed actuator decisions to a CSV file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    file_paths = [os.path.abspath(p) for p in (args.files or glob.glob(str(get_file_path("data", "*_measurement_data.csv"))))]
+    if not file_paths:
+        parser.error("no measurement files found")
+    feed, actuator_states = load_archive(file_paths)
+    if not feed:
+        parser.error("no sensor values in the measurement files")
+    start_time, end_time = feed[0][0], feed[-1][0]
+
+    # one worker process per parameter set (each replay has its own working directory and virtual clock)
+    parameter_sets = load_parameter_sets(args.parameters)
+    source_dir = str(get_file_path("read", ""))
+    t_start = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(max(1, min(args.workers, len(parameter_sets)))) as pool:
+        results = pool.starmap(run_backtest, [(name, overrides, file_paths, source_dir) for name, overrides in parameter_sets])
+    real_time = time.perf_counter() - t_start
+
+    if args.decisions:
+        with open(args.decisions, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["parameter_set", "timestamp", "actuator", "state"])
+            for result in results:
+                for t, name, state in result["decisions"]:
+                    writer.writerow([result["name"], f"{t:.1f}", name, state])
+
+    archived = switching_summary(archived_decisions(actuator_states), start_time, end_time)
+    if args.json:
+        print(json.dumps({"archive": {"files": file_paths, "actuators": archived}, "results": results}, indent=2))
+        return
+
+    print(f"\nReplayed {(end_time - start_time)/86400:.2f} days ({len(feed)} acquisition timestamps) "
+          f"with {len(results)} parameter sets in {real_time:.1f} s")
+
+    actuator_names = sorted(set(archived).union(*(result["actuators"] for result in results)))
+    names = ["archive"] + [result["name"] for result in results]
+    summaries = [archived] + [result["actuators"] for result in results]
+    print("\nActuator switch-ons / on-time [h]")
+    print(f"  {'':12s}" + "".join(f"{name:>18s}" for name in names))
+    for actuator in actuator_names:
+        cells = []
+        for summary in summaries:
+            entry = summary.get(actuator, {"switches": 0, "on_time_s": 0.0})
+            cells.append(f"{entry['switches']:>9d} {entry['on_time_s']/3600:8.2f}")
+        print(f"  {actuator:12s}" + "".join(cells))
+
+    print("\nDetected events / alarm edges")
+    for result in results:
+        alarms = ", ".join(f"{tag} {n}" for tag, n in sorted(Counter(tag for _, tag, _ in result["alarm_edges"]).items()))
+        print(f"  {result['name']:16s} events {result['detected_events']:4d}   {alarms or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import io as io_module
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from src import hal
+from src.clock import WallClock
+from src.commands import CommandBus
+from src.simulated_hal import SimulatedBackend
+from src.simulation import prepare_work_dir
+from src.utils import load_ios_from_toml, get_file_path
+from webgui import shared_state
+from webgui.ipc import SharedImage, ImagePublisher, CommandServer, ControllerLink, GuiProcess
+
+
+# requests of a GUI client (page, live data and prompt log, as polled by the browser)
+PATHS = ("/", "/api/data", "/api/prompt?after=0")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def generate_load(port, duration, clients, result_queue):
+    """
+    HTTP clients requesting the GUI as fast as possible (runs in its own process).
+    """
+    counts = {"requests": 0, "errors": 0}
+    lock = threading.Lock()
+    t_end = time.monotonic() + duration
+
+    def client(i):
+        n, errors = 0, 0
+        while time.monotonic() < t_end:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{PATHS[n % len(PATHS)]}", timeout=5) as response:
+                    response.read()
+            except OSError:
+                errors += 1
+            n += 1
+        with lock:
+            counts["requests"] += n
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result_queue.put(counts)
+
+
+def control_load(sensors, duration, period=0.02, n_periodic=8):
+    """
+    Control workload of the controller process: periodic routines waiting on the clock (lateness of each
+    wake-up) and continuous acquisition cycles (one thread per sensor reading, as in 'data_acquisition').
+    """
+    clock = WallClock()
+    stop_event = threading.Event()
+    lateness, cycle_times = [], []
+    lock = threading.Lock()
+
+    def periodic():
+        t_next = time.perf_counter() + period
+        while not stop_event.is_set():
+            clock.wait(stop_event, max(t_next - time.perf_counter(), 0))
+            with lock:
+                lateness.append(time.perf_counter() - t_next)
+            t_next += period
+
+    def acquisition():
+        while not stop_event.is_set():
+            t_start = time.perf_counter()
+            threads = [threading.Thread(target=sensor.read_value) for sensor in sensors]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            cycle_times.append(time.perf_counter() - t_start)
+
+    threads = [threading.Thread(target=periodic) for _ in range(n_periodic)] + [threading.Thread(target=acquisition)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    return lateness, cycle_times
+
+
+def statistics(samples, prefix):
+    values = np.asarray(samples)*1000
+    return {f"{prefix}_mean_ms": float(values.mean()), f"{prefix}_p95_ms": float(np.percentile(values, 95)),
+            f"{prefix}_p99_ms": float(np.percentile(values, 99)), f"{prefix}_max_ms": float(values.max())}
+
+
+class ThreadedGui:
+    def __init__(self, image, port):
+        """
+        GUI served from a thread of the controller process (layout before the GUI process) for comparison.
+        """
+        from webgui.server import PooledWSGIServer
+        from webgui.app import app
+        commands, replies = queue.Queue(), queue.Queue()
+        self.publisher = ImagePublisher(image)
+        self.command_server = CommandServer(commands, replies, self.publisher, CommandBus())
+        shared_state.link = ControllerLink(image, commands, replies)
+        self.server = PooledWSGIServer("127.0.0.1", port, app)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.publisher.start()
+        self.command_server.start()
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.command_server.stop()
+        self.publisher.stop()
+
+
+def run_scenario(name, sensors, image, duration, clients, gui_mode):
+    port = free_port()
+    if gui_mode == "thread":
+        gui = ThreadedGui(image, port)
+        gui.start()
+    else:
+        gui = GuiProcess(image, CommandBus(), host="127.0.0.1", port=port)
+        gui.start()
+        gui.ready_event.wait()
+    time.sleep(0.5)
+
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    load = None
+    if clients:
+        load = context.Process(target=generate_load, args=(port, duration, clients, result_queue))
+        load.start()
+        time.sleep(0.5)  # clients started
+
+    with contextlib.redirect_stdout(io_module.StringIO()):
+        lateness, cycle_times = control_load(sensors, duration)
+
+    counts = {"requests": 0, "errors": 0}
+    if load is not None:
+        counts = result_queue.get()
+        load.join()
+    gui.stop()
+
+    result = {"scenario": name, "requests_per_s": counts["requests"]/duration, "http_errors": counts["errors"]}
+    result.update(statistics(lateness, "lateness"))
+    result.update(statistics(cycle_times, "acquisition"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Effect of HTTP load on the control loop timing: GUI in a thread of "
+                                                 "the controller process vs. GUI in its own process (simulated hardware).")
+    parser.add_argument("--duration", type=float, default=10.0, help="duration of each scenario [s]")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="scale of the simulated EZO latencies (1: real devices)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase of the p95 lateness under load")
+    parser.add_argument("--floor-ms", type=float, default=0.5, help="increases below this are not counted (timer resolution)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if os.cpu_count() == 1:
+        print("WARNING: single CPU core, the GUI process and the HTTP clients compete with the controller for the CPU", file=sys.stderr)
+
+    source_dir = str(get_file_path("read", ""))
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_work_dir(work_dir, {"hal_backend": "simulated"}, source_dir)
+        os.chdir(work_dir)
+        try:
+            backend = SimulatedBackend.from_toml(get_file_path("read", "simulation.toml"))
+            backend.latency_scale = args.latency_scale
+            hal.set_backend(backend)
+            with contextlib.redirect_stdout(io_module.StringIO()):
+                sensors, actuators = load_ios_from_toml("read", "io_list.toml", backend.create_pxt())
+            shared_state.sensors, shared_state.actuators = sensors, actuators
+            shared_state.sensor_map = {s.name: s for s in sensors}
+            shared_state.actuator_map = {a.name: a for a in actuators}
+            shared_state.is_running = True
+
+            image = SharedImage([s.name for s in sensors], [a.name for a in actuators], sorted(shared_state.available_routines))
+            try:
+                for name, clients, gui_mode in (("no load", 0, "process"), ("load, GUI thread", args.clients, "thread"),
+                                                ("load, GUI process", args.clients, "process")):
+                    print(f"{name} ...", file=sys.stderr)
+                    results.append(run_scenario(name, sensors, image, args.duration, clients, gui_mode))
+            finally:
+                image.close()
+        finally:
+            os.chdir(cwd)
+
+    idle, threaded, separate = results
+    limit = idle["lateness_p95_ms"]*(1 + args.tolerance) + args.floor_ms
+    passed = separate["lateness_p95_ms"] <= limit
+
+    if args.json:
+        print(json.dumps({"results": results, "limit_p95_ms": limit, "passed": passed}, indent=2))
+    else:
+        print(f"\n{'scenario':20s} {'req/s':>8s} {'late p95':>9s} {'late p99':>9s} {'late max':>9s} {'acq mean':>9s} {'acq p95':>9s}  [ms]")
+        for r in results:
+            print(f"{r['scenario']:20s} {r['requests_per_s']:8.0f} {r['lateness_p95_ms']:9.3f} {r['lateness_p99_ms']:9.3f} "
+                  f"{r['lateness_max_ms']:9.3f} {r['acquisition_mean_ms']:9.3f} {r['acquisition_p95_ms']:9.3f}")
+        print(f"\nGUI process under load: p95 lateness {separate['lateness_p95_ms']:.3f} ms (limit {limit:.3f} ms) "
+              f"-> {'no measurable effect' if passed else 'EFFECT OF HTTP LOAD'}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import time
+import tomllib
+
+from src.utils import Sensor, Actuator, get_file_path
+from src.process_image import ProcessImage
+from src.simulated_hal import SimulatedPiXtend
+
+
+# number of calls per measurement
+N = 200000
+
+
+def time_per_call(function, *args):
+    t_start = time.perf_counter()
+    for _ in range(N):
+        function(*args)
+    return (time.perf_counter() - t_start)/N*1e9
+
+
+def run_benchmark(pxt, sensors, actuators, label):
+    print(f"\n{label}")
+    for sensor in sensors:
+        print(f"  read  {sensor.name:6s} ({sensor.type:6s} {sensor.address:12s}): {time_per_call(sensor.read_value):8.1f} ns/call")
+    for actuator in actuators:
+        print(f"  write {actuator.name:6s} ({actuator.type:6s} {actuator.address:12s}): {time_per_call(actuator.set_state, True):8.1f} ns/call")
+
+
+# load PiXtend IOs from io list (EZO sensors are skipped, their cost is dominated by the I2C timeouts)
+with open(get_file_path("read", "io_list.toml"), "rb") as f:
+    io_list = tomllib.load(f)
+
+pxt = SimulatedPiXtend()  # plain attributes, no SPI communication
+sensors = [Sensor(s, pxt) for s in io_list["sensor"] if "PX" in s["type"]]
+actuators = [Actuator(a, pxt) for a in io_list["actuator"]]
+
+# baseline: attribute lookup by address string (lower bound for any dispatch)
+print(f"\nBaseline getattr(pxt, address): {time_per_call(getattr, pxt, 'analog_in1'):8.1f} ns/call")
+
+run_benchmark(pxt, sensors, actuators, "Compiled accessors, direct PiXtend access")
+
+process_image = ProcessImage(pxt)
+process_image.attach(sensors, actuators)
+run_benchmark(pxt, sensors, actuators, "Compiled accessors, process image")
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tomllib
+
+from src import hal
+from src.utils import Sensor, Actuator, get_file_path
+from src.simulated_hal import SimulatedBackend
+from src.io_registry import IORegistry
+from src.routines import routines
+from src.async_runtime import AsyncRuntime
+
+
+# shortened control parameters so that all routines switch actuators during the benchmark
+BENCHMARK_PARAMETERS = {
+    "dataq_sampling_interval": "2",
+    "initial_wait_time":       "0",
+    "tau_M0111_runtime":       "2",
+    "tau_M0111_delay":         "1",
+    "tau_M0112_runtime":       "2",
+    "tau_M0112_delay":         "1",
+    "tau_M0101_interval":      "10",
+    "tau_M0101_runtime":       "3",
+    "tau_M0101_delay":         "2",
+    "tau_M0102_interval":      "15",
+    "tau_M0102_runtime":       "3",
+    "tau_M0201_interval":      "20",
+    "tau_M0201_runtime":       "10",
+    "tau_M0203_interval":      "30",
+    "tau_M0203_runtime":       "2",
+    "tau_M0203_delay":         "5",
+}
+
+ROUTINE_NAMES = [
+    "data_acquisition",
+    "stabilizer_stirrer",
+    "evaporator_feed",
+    "collector_flush",
+    "collector_drain",
+    "evaporation",
+    "concentrate_discharge",
+    "observer",
+    "print_sensor_values_to_prompt",
+    "CaOH2_refill",
+]
+
+PROBE_PERIOD = 0.1   # period of the jitter probe [s]
+
+
+class SimulatedPlant:
+    def __init__(self, pxt, step_time=0.1):
+        """
+        Minimal plant model: random inflow events into the collector tube, pumps move liquid
+        from collector to stabilizer to evaporator, evaporation lowers the evaporator level.
+        """
+        self.pxt = pxt
+        self.step_time = step_time
+        self.collector = 0.0
+        self.stabilizer = 25.0
+        self.evaporator = 10.0
+        self.stop_event = threading.Event()
+        self.pxt.digital_in0 = True  # concentrate tank not full
+
+    def step(self):
+        pxt = self.pxt
+        if random.random() < self.step_time/8.0:  # one inflow event every 8 s on average
+            self.collector += 0.5
+        if pxt.digital_out3:  # collector drain
+            drained = min(self.collector, 0.5*self.step_time)
+            self.collector -= drained
+            self.stabilizer += drained
+        if pxt.digital_out2:  # evaporator feed
+            self.stabilizer -= 0.2*self.step_time
+            self.evaporator += 0.2*self.step_time
+        if pxt.digital_out7:  # evaporation
+            self.evaporator -= 0.01*self.step_time
+
+        pxt.analog_in1 = self.stabilizer
+        pxt.analog_in2 = self.collector
+        pxt.analog_in3 = self.evaporator
+
+    def run(self):
+        while not self.stop_event.wait(self.step_time):
+            self.step()
+
+
+def create_plant(work_dir):
+    """
+    Copy configuration into a temporary working directory (the real log and data files are not touched)
+    and create simulated sensors and actuators.
+    """
+    shutil.copytree(get_file_path("read", ""), os.path.join(work_dir, "read"))
+    os.makedirs(os.path.join(work_dir, "data"))
+    with open(os.path.join(work_dir, "data", "log_file.csv"), "w") as f:
+        f.write("datetime,tag,value\n")
+
+    parameter_file = os.path.join(work_dir, "read", "parameters.toml")
+    with open(parameter_file) as f:
+        text = f.read()
+    for key, value in BENCHMARK_PARAMETERS.items():
+        text = re.sub(rf'^{key}(\s*)= "[^"]*"', rf'{key}\1= "{value}"', text, flags=re.M)
+    with open(parameter_file, "w") as f:
+        f.write(text)
+
+    os.chdir(work_dir)
+    with open(get_file_path("read", "io_list.toml"), "rb") as f:
+        io_list = tomllib.load(f)
+
+    # simulated PiXtend and EZO devices (real EZO command latencies)
+    backend = SimulatedBackend.from_toml(get_file_path("read", "simulation.toml"))
+    hal.set_backend(backend)
+    pxt = backend.create_pxt()
+
+    # identity calibration for analog inputs: the plant model writes engineering values
+    sensors = [Sensor(dict(meta, quad_gain="0", gain="1", offset="0"), pxt) for meta in io_list["sensor"]]
+    actuators = [Actuator(meta, pxt) for meta in io_list["actuator"]]
+
+    return pxt, IORegistry(sensors, actuators)
+
+
+class Probe:
+    def __init__(self):
+        """
+        Periodic task scheduled like a routine: records how late it wakes up (timing jitter)
+        and the number of OS threads.
+        """
+        self.lateness = []
+        self.max_threads = 0
+
+    def record(self, expected):
+        self.lateness.append(time.perf_counter() - expected)
+        self.max_threads = max(self.max_threads, threading.active_count())
+
+
+def usage():
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+def current_rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def summary(probe, cpu_time, wall_time):
+    lateness = sorted(probe.lateness)
+    n = len(lateness)
+    return {
+        "cpu_percent": 100.0*cpu_time/wall_time,
+        "rss_mb": current_rss_kb()/1024,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+        "max_threads": probe.max_threads,
+        "jitter_mean_ms": 1000*sum(lateness)/n,
+        "jitter_p99_ms": 1000*lateness[min(n - 1, int(0.99*n))],
+        "jitter_max_ms": 1000*lateness[-1],
+    }
+
+
+def run_threads(r, io, duration):
+    probe = Probe()
+
+    def probe_loop():
+        expected = time.perf_counter() + PROBE_PERIOD
+        while not r.shutdown_event.is_set():
+            time.sleep(max(0.0, expected - time.perf_counter()))
+            probe.record(expected)
+            expected += PROBE_PERIOD
+
+    threads = [threading.Thread(target=getattr(r, name), args=(io,)) for name in ROUTINE_NAMES]
+    threads.append(threading.Thread(target=probe_loop))
+
+    cpu_start, wall_start = usage(), time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    result = summary(probe, usage() - cpu_start, time.perf_counter() - wall_start)
+
+    r.shutdown_event.set()
+    r.signals.close()
+    for thread in threads:
+        thread.join()
+    return result
+
+
+def run_asyncio(r, io, duration):
+    probe = Probe()
+    runtime = AsyncRuntime(r, io)
+    result = {}
+
+    async def probe_loop():
+        expected = time.perf_counter() + PROBE_PERIOD
+        while not r.shutdown_event.is_set():
+            await asyncio.sleep(max(0.0, expected - time.perf_counter()))
+            probe.record(expected)
+            expected += PROBE_PERIOD
+
+    async def main():
+        cpu_start, wall_start = usage(), time.perf_counter()
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(runtime.run(ROUTINE_NAMES))
+            tasks.create_task(probe_loop())
+            await asyncio.sleep(duration)
+            result.update(summary(probe, usage() - cpu_start, time.perf_counter() - wall_start))
+            r.shutdown_event.set()
+            r.signals.close()
+
+    asyncio.run(main())
+    return result
+
+
+def run_model(model, duration, queue):
+    # routine output is not part of the benchmark
+    sys.stdout = open(os.devnull, "w")
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pxt, io = create_plant(work_dir)
+        plant = SimulatedPlant(pxt)
+        plant_thread = threading.Thread(target=plant.run)
+        plant_thread.start()
+
+        r = routines(time.time(), "parameters.toml", "log_file.csv")
+        if model == "threads":
+            result = run_threads(r, io, duration)
+        else:
+            result = run_asyncio(r, io, duration)
+
+        plant.stop_event.set()
+        plant_thread.join()
+        os.chdir("/")
+
+    queue.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare thread-per-routine and asyncio runtime on a simulated plant.")
+    parser.add_argument("--duration", type=float, default=30.0, help="measurement time per runtime model [s]")
+    args = parser.parse_args()
+
+    # each model runs in a fresh process (independent RSS and CPU accounting)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for model in ("threads", "asyncio"):
+        print(f"Running '{model}' model for {args.duration:.0f} s ...")
+        queue = context.Queue()
+        process = context.Process(target=run_model, args=(model, args.duration, queue))
+        process.start()
+        results[model] = queue.get()
+        process.join()
+
+    rows = [
+        ("CPU usage [% of one core]", "cpu_percent", "{:.2f}"),
+        ("RSS at end [MB]",           "rss_mb",      "{:.1f}"),
+        ("Peak RSS [MB]",             "max_rss_mb",  "{:.1f}"),
+        ("Max. OS threads",           "max_threads", "{:d}"),
+        ("Jitter mean [ms]",          "jitter_mean_ms", "{:.2f}"),
+        ("Jitter p99 [ms]",           "jitter_p99_ms",  "{:.2f}"),
+        ("Jitter max [ms]",           "jitter_max_ms",  "{:.2f}"),
+    ]
+    print(f"\n{'':28s} {'threads':>12s} {'asyncio':>12s}")
+    for label, key, fmt in rows:
+        print(f"{label:28s} {fmt.format(results['threads'][key]):>12s} {fmt.format(results['asyncio'][key]):>12s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import contextlib
+import csv
+import datetime
+import io as io_module
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tomllib
+
+import numpy as np
+
+from src import hal
+from src.utils import Sensor, get_file_path
+from src.simulated_hal import SimulatedBackend
+from src.simulation import prepare_work_dir
+from src.routines import routines
+from src.clock import WallClock
+
+
+# Benchmarks on simulated hardware. Each benchmark returns metrics {name: (value, unit)};
+# for all metrics lower values are better.
+BENCHMARKS = {}
+
+def benchmark(name):
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+def time_per_call(function, n, *args):
+    t_start = time.perf_counter()
+    for _ in range(n):
+        function(*args)
+    return (time.perf_counter() - t_start)/n
+
+
+def distribution(samples, prefix, unit="ms", scale=1000):
+    values = np.asarray(samples)*scale
+    return {
+        f"{prefix}.mean": (float(values.mean()), unit),
+        f"{prefix}.p95":  (float(np.percentile(values, 95)), unit),
+        f"{prefix}.max":  (float(values.max()), unit),
+    }
+
+
+class Setup:
+    def __init__(self, latency_scale, repeat):
+        """
+        Routines instance and simulated sensors in the current (prepared) working directory.
+        """
+        self.latency_scale = latency_scale
+        self.repeat = repeat
+
+        self.backend = SimulatedBackend.from_toml(get_file_path("read", "simulation.toml"))
+        self.backend.latency_scale = latency_scale
+        hal.set_backend(self.backend)
+        pxt = self.backend.create_pxt()
+
+        with open(get_file_path("read", "io_list.toml"), "rb") as f:
+            io_list = tomllib.load(f)
+        with contextlib.redirect_stdout(io_module.StringIO()):
+            self.sensors = [Sensor(meta, pxt) for meta in io_list["sensor"]]
+        self.ezo_sensors = [sensor for sensor in self.sensors if sensor.type.startswith("EZO")]
+        self.px_sensors = [sensor for sensor in self.sensors if sensor.type.startswith("PX")]
+
+        self.routines = routines(time.time(), "parameters.toml", "log_file.csv")
+        self.routines.csv_file_path = get_file_path("data", "benchmark_measurement_data.csv")
+
+
+@benchmark("acquisition")
+def acquisition_cycle(setup):
+    """
+    Acquisition cycle (one thread per sensor reading and logging, as in 'data_acquisition' without the start delay)
+    for increasing numbers of EZO and PiXtend sensors.
+    """
+    r = setup.routines
+    metrics = {}
+    for n_ezo in sorted({0, 1, len(setup.ezo_sensors)//2, len(setup.ezo_sensors)}):
+        for n_px in sorted({0, len(setup.px_sensors)}):
+            sensors = setup.ezo_sensors[:n_ezo] + setup.px_sensors[:n_px]
+            if not sensors:
+                continue
+            durations = []
+            for _ in range(setup.repeat):
+                t_start = time.perf_counter()
+                threads = [threading.Thread(target=r._read_and_log_sensor, args=(sensor,)) for sensor in sensors]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                durations.append(time.perf_counter() - t_start)
+            metrics.update(distribution(durations, f"acquisition.ezo{n_ezo}_px{n_px}"))
+    return metrics
+
+
+@benchmark("storage")
+def storage_throughput(setup):
+    """
+    Measurement file writes: one open/append per row (as the logging threads) and buffered writes.
+    """
+    r = setup.routines
+    sensor = setup.px_sensors[0]
+    n = 200*setup.repeat
+    row = [datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "1.00", r.machine_id, "Sensor",
+           sensor.type, sensor.name, sensor.address, 0, 1.234, 0, 0]
+
+    def append_row():
+        with r.file_lock:
+            with open(r.csv_file_path, mode="a", newline="") as f:
+                csv.writer(f).writerow(row)
+
+    per_row = time_per_call(append_row, n)
+
+    t_start = time.perf_counter()
+    with open(r.csv_file_path, mode="a", newline="") as f:
+        writer = csv.writer(f)
+        for _ in range(n):
+            writer.writerow(row)
+    buffered = (time.perf_counter() - t_start)/n
+
+    return {
+        "storage.append_per_row": (per_row*1e6, "us/row"),
+        "storage.buffered_row": (buffered*1e6, "us/row"),
+        "storage.sensor_log": (time_per_call(r._read_and_log_sensor, n, sensor)*1e6, "us/row"),
+    }
+
+
+@benchmark("parameters")
+def parameter_lookup(setup):
+    """
+    Parameter access as done by the routines in every loop (file modification check, dict lookup).
+    """
+    r = setup.routines
+    n = 2000*setup.repeat
+    pl = r.load_parameter_list()
+
+    def reload():
+        r.parameter_file_mtime = None
+        r.load_parameter_list()
+
+    return {
+        "parameters.load_unchanged": (time_per_call(r.load_parameter_list, n)*1e6, "us/call"),
+        "parameters.lookup": (time_per_call(lambda: float(pl.get("threshold_min_B0111")), n)*1e6, "us/call"),
+        "parameters.reload": (time_per_call(reload, n//20)*1e6, "us/call"),
+    }
+
+
+@benchmark("observer")
+def observer_evaluation(setup):
+    """
+    Evaluation of all observer rules for one set of signal values.
+    """
+    rules = setup.routines.observer_rules
+    rules.update_thresholds(setup.routines.load_parameter_list())
+    rng = np.random.default_rng(1)
+    values = rng.uniform(0, 20, size=(100, len(rules.signals)))
+    n = 100*setup.repeat
+
+    def evaluate():
+        for i in range(n):
+            rules.evaluate(values[i % 100], float(i))
+
+    t_start = time.perf_counter()
+    evaluate()
+    return {
+        "observer.evaluate": ((time.perf_counter() - t_start)/n*1e6, "us/call"),
+        "observer.rules": (float(len(rules.rules)), "count"),
+    }
+
+
+@benchmark("jitter")
+def routine_jitter(setup):
+    """
+    Lateness of periodic routines waiting on the clock (shutdown event with timeout, as in the routines),
+    with several routines and an acquisition cycle running at the same time.
+    """
+    clock = WallClock()
+    shutdown_event = threading.Event()
+    period = 0.05
+    n = 20*setup.repeat
+    lateness = []
+    lock = threading.Lock()
+
+    def periodic():
+        t_next = time.perf_counter() + period
+        for _ in range(n):
+            clock.wait(shutdown_event, max(t_next - time.perf_counter(), 0))
+            with lock:
+                lateness.append(time.perf_counter() - t_next)
+            t_next += period
+
+    def load():
+        while not shutdown_event.is_set():
+            threads = [threading.Thread(target=sensor.read_value) for sensor in setup.sensors]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    threads = [threading.Thread(target=periodic) for _ in range(8)]
+    load_thread = threading.Thread(target=load)
+    load_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    shutdown_event.set()
+    load_thread.join()
+
+    return distribution(lateness, "jitter.lateness")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Relative change of each metric against the baseline. Returns a list of (name, baseline, value, change, regression).
+    """
+    rows = []
+    for name, (value, unit) in results["metrics"].items():
+        if name not in baseline["metrics"] or unit == "count":
+            continue
+        reference = baseline["metrics"][name][0]
+        change = (value - reference)/reference if reference else 0.0
+        rows.append((name, reference, value, unit, change, change > tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquisition and control benchmark suite on simulated hardware.")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only these benchmarks (repeatable)")
+    parser.add_argument("--repeat", type=int, default=10, help="repetitions per measurement")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="scale of the simulated EZO latencies (1: real devices)")
+    parser.add_argument("--output", help="write the results to this JSON file (e.g. to store a baseline)")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative increase counted as regression")
+    args = parser.parse_args()
+
+    source_dir = str(get_file_path("read", ""))
+    cwd = os.getcwd()
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "latency_scale": args.latency_scale,
+        },
+        "metrics": {},
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_work_dir(work_dir, {"hal_backend": "simulated"}, source_dir)
+        os.chdir(work_dir)
+        try:
+            with contextlib.redirect_stdout(io_module.StringIO()):
+                setup = Setup(args.latency_scale, args.repeat)
+            for name in args.only or BENCHMARKS:
+                t_start = time.perf_counter()
+                with contextlib.redirect_stdout(io_module.StringIO()):
+                    metrics = BENCHMARKS[name](setup)
+                results["metrics"].update(metrics)
+                print(f"{name:12s} {time.perf_counter() - t_start:6.1f} s", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        print(f"\n{'metric':36s} {'value':>12s}")
+        for name, (value, unit) in results["metrics"].items():
+            print(f"{name:36s} {value:12.3f} {unit}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for key in ("latency_scale", "repeat", "machine"):
+        if baseline["meta"].get(key) != results["meta"][key]:
+            print(f"WARNING: '{key}' differs from the baseline ({baseline['meta'].get(key)} / {results['meta'][key]})")
+
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\n{'metric':36s} {'baseline':>12s} {'value':>12s} {'change':>8s}")
+    for name, reference, value, unit, change, regression in rows:
+        print(f"{name:36s} {reference:12.3f} {value:12.3f} {change:+8.1%} {unit}{'  REGRESSION' if regression else ''}")
+
+    regressions = [row for row in rows if row[-1]]
+    print(f"\n{len(regressions)} of {len(rows)} metrics regressed by more than {args.tolerance:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import concurrent.futures
+import datetime
+import os
+import time
+import tomllib
+
+import numpy as np
+
+from src import inflow_events
+from src.utils import get_file_path
+from webgui.history import archive_files, load_day
+
+
+def load_collector(file_path):
+    """
+    Collector level and the times at which the actions were logged on, from one daily measurement file
+    (runs in a worker process, only these signals are sent back).
+    """
+    signals = load_day(file_path, os.path.getmtime(file_path))
+    t, v = signals.get(inflow_events.SIGNAL, (np.zeros(0), np.zeros(0, dtype=np.float32)))
+    action_times = {}
+    for name in inflow_events.ACTIONS:
+        times, states = signals.get(name, (np.zeros(0), np.zeros(0)))
+        action_times[name] = times[states == 1.0]
+    return t, v, action_times
+
+
+def load_archive(files, workers):
+    """
+    Concatenated collector level and action times of the daily files (parsed in parallel, in date order).
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        days = list(pool.map(load_collector, files))
+    t = np.concatenate([day[0] for day in days]) if days else np.zeros(0)
+    v = np.concatenate([day[1] for day in days]) if days else np.zeros(0)
+    action_times = {name: np.concatenate([day[2][name] for day in days]) if days else np.zeros(0)
+                    for name in inflow_events.ACTIONS}
+    return t, v, action_times
+
+
+def count_per_day(events):
+    days = {}
+    for start in events["start"]:
+        day = datetime.date.fromtimestamp(float(start))
+        days[day] = days.get(day, 0) + 1
+    return days
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect the inflow events in the archived measurement files (same "
+                                                 "detector as at runtime) and write them to a catalog.")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="last day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes parsing the daily files")
+    parser.add_argument("--catalog", default=str(get_file_path("data", "inflow_events_archive.bin")),
+                        help="catalog file of the detected events")
+    parser.add_argument("--events", action="store_true", help="print each event")
+    args = parser.parse_args()
+
+    with open(get_file_path("read", "parameters.toml"), "rb") as f:
+        parameters = inflow_events.inflow_parameters(tomllib.load(f))
+
+    files = archive_files()
+    days = sorted(day for day in files if (args.date_from is None or day >= args.date_from)
+                  and (args.date_to is None or day <= args.date_to))
+    if not days:
+        print("No measurement files found for the given date(s).")
+        return
+
+    t_start = time.perf_counter()
+    t, v, action_times = load_archive([files[day] for day in days], args.workers)
+    t_load = time.perf_counter() - t_start
+    # one pass over all days: events across midnight are detected as at runtime
+    events = inflow_events.detect_events(t, v, parameters, action_times)
+    t_detect = time.perf_counter() - t_start - t_load
+
+    inflow_events.EventCatalog(args.catalog).write(events)
+    print(f"{len(days)} days, {t.size} samples of {inflow_events.SIGNAL}: {events.size} inflow events "
+          f"(parsing {t_load:.2f} s, detection {t_detect*1000:.1f} ms), catalog: {args.catalog}")
+
+    if args.events:
+        for event in events:
+            actions = ", ".join(inflow_events.action_names(int(event["actions"]))) or "-"
+            print(f"  {datetime.datetime.fromtimestamp(float(event['start'])):%Y-%m-%d %H:%M:%S}  "
+                  f"{event['end'] - event['start']:7.0f} s  peak {event['peak']:7.3f}  volume {event['volume']:7.3f}  {actions}")
+
+    # comparison with the events detected at runtime
+    runtime = inflow_events.EventCatalog(get_file_path("data", "inflow_events.bin"))
+    batch_counts = count_per_day(events)
+    runtime_counts = count_per_day(runtime.query(t[0], t[-1] + 1) if t.size else runtime.load()[:0])
+    print(f"\n{'day':10s} {'archive':>8s} {'runtime':>8s}")
+    for day in days:
+        batch, live = batch_counts.get(day, 0), runtime_counts.get(day, 0)
+        print(f"{day.isoformat():10s} {batch:8d} {live:8d}{'' if batch == live else '  differs'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import http.client
+import io as io_module
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from src import hal
+from src.commands import CommandBus
+from src.simulated_hal import SimulatedBackend
+from src.simulation import prepare_work_dir
+from src.utils import load_ios_from_toml, get_file_path
+from webgui import shared_state
+from webgui.ipc import SharedImage, GuiProcess
+
+
+# scenarios: name, path, conditional requests (If-None-Match with the last ETag, as a polling browser)
+SCENARIOS = (
+    ("/api/data", "/api/data", False),
+    ("/api/data, current", "/api/data", True),
+    ("/ (page)", "/", False),
+    ("/ (page), current", "/", True),
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_clients(port, path, conditional, duration, clients, result_queue):
+    """
+    HTTP clients with keep-alive connections requesting 'path' as fast as possible (runs in its own process).
+    """
+    latencies, statuses, body_bytes = [], {}, [0]
+    lock = threading.Lock()
+    t_end = time.monotonic() + duration
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        etag = None
+        own_latencies, own_statuses, own_bytes = [], {}, 0
+        while time.monotonic() < t_end:
+            headers = {"Accept-Encoding": "gzip"}
+            if conditional and etag:
+                headers["If-None-Match"] = etag
+            t_start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                own_statuses["error"] = own_statuses.get("error", 0) + 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                continue
+            own_latencies.append(time.perf_counter() - t_start)
+            own_statuses[response.status] = own_statuses.get(response.status, 0) + 1
+            own_bytes += len(body)
+            etag = response.getheader("ETag", etag)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            for status, n in own_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+            body_bytes[0] += own_bytes
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result_queue.put((latencies, statuses, body_bytes[0]))
+
+
+def acquisition(sensors, publisher, cycle_time, stop_event):
+    """
+    Acquisition cycles of the controller: read all sensors, then publish the process image once.
+    """
+    while not stop_event.is_set():
+        t_start = time.monotonic()
+        for sensor in sensors:
+            sensor.read_value()
+        publisher.notify()
+        stop_event.wait(max(cycle_time - (time.monotonic() - t_start), 0))
+
+
+def run_scenario(port, name, path, conditional, duration, clients):
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    load = context.Process(target=run_clients, args=(port, path, conditional, duration, clients, result_queue))
+    load.start()
+    latencies, statuses, body_bytes = result_queue.get()
+    load.join()
+
+    values = np.asarray(latencies)*1000
+    n = max(len(latencies), 1)
+    return {"scenario": name, "requests": len(latencies), "requests_per_s": len(latencies)/duration,
+            "p50_ms": float(np.percentile(values, 50)) if len(values) else None,
+            "p99_ms": float(np.percentile(values, 99)) if len(values) else None,
+            "bytes_per_request": body_bytes/n, "statuses": {str(status): count for status, count in statuses.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the web GUI (GUI process with the shared process image "
+                                                 "of a simulated controller): requests/s and latency per endpoint.")
+    parser.add_argument("--duration", type=float, default=10.0, help="duration of each scenario [s]")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients (keep-alive connections)")
+    parser.add_argument("--workers", type=int, default=8, help="worker threads of the GUI server")
+    parser.add_argument("--cycle-time", type=float, default=1.0, help="acquisition cycle of the simulated controller [s]")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if os.cpu_count() == 1:
+        print("WARNING: single CPU core, the HTTP clients compete with the GUI process for the CPU", file=sys.stderr)
+
+    source_dir = str(get_file_path("read", ""))
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_work_dir(work_dir, {"hal_backend": "simulated"}, source_dir)
+        os.chdir(work_dir)
+        try:
+            backend = SimulatedBackend.from_toml(get_file_path("read", "simulation.toml"))
+            backend.latency_scale = 0.0
+            hal.set_backend(backend)
+            with contextlib.redirect_stdout(io_module.StringIO()):
+                sensors, actuators = load_ios_from_toml("read", "io_list.toml", backend.create_pxt())
+            shared_state.sensor_map = {s.name: s for s in sensors}
+            shared_state.actuator_map = {a.name: a for a in actuators}
+            shared_state.is_running = True
+
+            image = SharedImage([s.name for s in sensors], [a.name for a in actuators], sorted(shared_state.available_routines))
+            port = free_port()
+            gui = GuiProcess(image, CommandBus(), host="127.0.0.1", port=port, workers=args.workers)
+            stop_event = threading.Event()
+            cycles = threading.Thread(target=acquisition, args=(sensors, gui.publisher, args.cycle_time, stop_event), daemon=True)
+            try:
+                with contextlib.redirect_stdout(io_module.StringIO()):
+                    gui.start()
+                    gui.ready_event.wait()
+                    cycles.start()
+                    time.sleep(0.5)
+                for name, path, conditional in SCENARIOS:
+                    print(f"{name} ...", file=sys.stderr)
+                    results.append(run_scenario(port, name, path, conditional, args.duration, args.clients))
+            finally:
+                stop_event.set()
+                gui.stop()
+                image.close()
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"\n{'scenario':20s} {'req/s':>8s} {'p50 [ms]':>9s} {'p99 [ms]':>9s} {'bytes/req':>10s}  statuses")
+    for r in results:
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(r["statuses"].items()))
+        print(f"{r['scenario']:20s} {r['requests_per_s']:8.0f} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f} "
+              f"{r['bytes_per_request']:10.0f}  {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import csv
+import time
+import tomllib
+
+import numpy as np
+
+from scripts.runtime_estimation import estimate_runtimes
+from src.plant_twin import PLANT_DEFAULTS
+from src.utils import get_file_path
+
+
+# swept quantities: name, command line option, default range, unit conversion to SI, description
+SWEEP = [
+    ("inflow",        "--inflow",              "5:15:11",    1/(24*3600.),   "inflow [kg/d]"),
+    ("evaporation",   "--evaporation",         "0.6:1.4:9",  1/3600.,        "evaporation rate [kg/h]"),
+    ("m_dot_M0102",   "--feed-pump",           "450:650:5",  1/(1000*60.),   "evaporator feed pump M0102 [g/min]"),
+    ("m_dot_M0203",   "--discharge-pump",      "1200:1600:5",1/(1000*60.),   "concentrate discharge pump M0203 [g/min]"),
+    ("N_f_evi",       "--feed-intervals",      "2,3,4,6,8,12", 1.0,          "evaporator feed cycles per day"),
+    ("N_f_conc",      "--discharge-intervals", "1,2,3",      1.0,            "concentrate discharge cycles per day"),
+    ("phi_OF_evi",    "--overflow",            "0:0.4:9",    1.0,            "evaporator overflow fraction"),
+]
+
+
+def parse_range(text):
+    """
+    'start:stop:num' (evenly spaced, including stop) or a comma separated list of values.
+    """
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in text.split(",")])
+
+
+def sweep(values, plant):
+    """
+    Evaluate the mass balance on the full grid (one array axis per swept quantity, combined by broadcasting).
+    Returns a dict of arrays with the grid shape.
+    """
+    n = len(values)
+    axes = {}
+    for i, (name, grid) in enumerate(values.items()):
+        shape = [1]*n
+        shape[i] = grid.size
+        axes[name] = grid.reshape(shape)
+
+    tau_M0102_runtime, tau_M0102_interval, tau_M0203_runtime, tau_M0203_interval = estimate_runtimes(
+        axes["inflow"], axes["evaporation"], axes["m_dot_M0102"], axes["m_dot_M0203"],
+        axes["N_f_evi"], axes["N_f_conc"], axes["phi_OF_evi"])
+
+    # mass moved per pump cycle [kg]
+    feed_batch = axes["m_dot_M0102"]*tau_M0102_runtime
+    discharge_batch = axes["m_dot_M0203"]*np.maximum(tau_M0203_runtime, 0)
+
+    # level margins [kg]: evaporator receives one feed batch above its minimum level,
+    # stabilizer collects the inflow of one feed interval above its minimum level
+    evaporator_margin = plant["evaporator_capacity"] - plant["evaporator_min"] - feed_batch
+    stabilizer_margin = plant["stabilizer_capacity"] - plant["stabilizer_min"] - axes["inflow"]*tau_M0102_interval
+
+    # days until the concentrate tank is full
+    with np.errstate(divide="ignore"):
+        concentrate_days = plant["concentrate_capacity"]/(axes["N_f_conc"]*discharge_batch)
+
+    feasible = (
+        (tau_M0203_runtime >= 0)                        # feed covers evaporation and overflow
+        & (tau_M0102_runtime > 0)
+        & (tau_M0102_interval - tau_M0102_runtime > 1)  # as required by the routines
+        & (tau_M0203_interval - tau_M0203_runtime > 1)
+        & (evaporator_margin >= 0)
+        & (stabilizer_margin >= 0)
+    )
+
+    # robustness: smallest relative margin
+    score = np.minimum(evaporator_margin/plant["evaporator_capacity"], stabilizer_margin/plant["stabilizer_capacity"])
+
+    shape = np.broadcast_shapes(*(axis.shape for axis in axes.values()))
+    results = {name: np.broadcast_to(axis, shape) for name, axis in axes.items()}
+    results.update({
+        "tau_M0102_runtime": tau_M0102_runtime, "tau_M0102_interval": tau_M0102_interval,
+        "tau_M0203_runtime": tau_M0203_runtime, "tau_M0203_interval": tau_M0203_interval,
+        "evaporator_margin": evaporator_margin, "stabilizer_margin": stabilizer_margin,
+        "concentrate_days": concentrate_days, "feasible": feasible, "score": score,
+    })
+    return {name: np.broadcast_to(value, shape) for name, value in results.items()}
+
+
+def simulate_levels(candidates, plant, days, dt=60.0):
+    """
+    Level trajectories for the candidates (one array element per candidate, all simulated at once).
+    Pumps run at the beginning of each interval, evaporation stops at the evaporator minimum level.
+    """
+    k = len(candidates["inflow"])
+    stabilizer = np.full(k, plant["stabilizer"])
+    evaporator = np.full(k, plant["evaporator"])
+    effluent = np.zeros(k)
+    stabilizer_range = [stabilizer.copy(), stabilizer.copy()]
+    evaporator_range = [evaporator.copy(), evaporator.copy()]
+
+    for t in np.arange(0.0, days*86400, dt):
+        stabilizer += candidates["inflow"]*dt
+
+        feed_on = (t % candidates["tau_M0102_interval"]) < candidates["tau_M0102_runtime"]
+        fed = np.where(feed_on, np.minimum(stabilizer, candidates["m_dot_M0102"]*dt), 0.0)
+        stabilizer -= fed
+        evaporator += fed
+
+        evaporation_on = evaporator > plant["evaporator_min"]
+        evaporator -= np.where(evaporation_on, np.minimum(evaporator, candidates["evaporation"]*dt), 0.0)
+
+        discharge_on = (t % candidates["tau_M0203_interval"]) < candidates["tau_M0203_runtime"]
+        evaporator -= np.where(discharge_on, np.minimum(evaporator, candidates["m_dot_M0203"]*dt), 0.0)
+
+        # overflows: evaporator back into stabilizer, stabilizer to effluent
+        overflow = np.maximum(evaporator - plant["evaporator_capacity"], 0.0)
+        evaporator -= overflow
+        stabilizer += overflow
+        spill = np.maximum(stabilizer - plant["stabilizer_capacity"], 0.0)
+        stabilizer -= spill
+        effluent += spill
+
+        np.minimum(stabilizer_range[0], stabilizer, out=stabilizer_range[0])
+        np.maximum(stabilizer_range[1], stabilizer, out=stabilizer_range[1])
+        np.minimum(evaporator_range[0], evaporator, out=evaporator_range[0])
+        np.maximum(evaporator_range[1], evaporator, out=evaporator_range[1])
+
+    return {
+        "sim_stabilizer_min": stabilizer_range[0], "sim_stabilizer_max": stabilizer_range[1],
+        "sim_evaporator_min": evaporator_range[0], "sim_evaporator_max": evaporator_range[1],
+        "sim_effluent": effluent,
+    }
+
+
+def plant_limits():
+    """
+    Tank capacities from the plant twin, minimum levels from the thresholds in 'parameters.toml' [kg].
+    """
+    with open(get_file_path("read", "parameters.toml"), "rb") as f:
+        pl = tomllib.load(f)
+
+    plant = dict(PLANT_DEFAULTS)
+    plant["stabilizer_min"] = float(pl.get("threshold_min_B0101"))*plant["stabilizer_kg_per_unit"]
+    plant["evaporator_min"] = float(pl.get("threshold_min_B0201"))*plant["evaporator_kg_per_unit"]
+    return plant
+
+
+COLUMNS = [
+    ("inflow",             "inflow",   "{:8.2f}", 24*3600.),
+    ("evaporation",        "evap",     "{:6.2f}", 3600.),
+    ("m_dot_M0102",        "M0102",    "{:6.0f}", 1000*60.),
+    ("m_dot_M0203",        "M0203",    "{:6.0f}", 1000*60.),
+    ("N_f_evi",            "N_evi",    "{:5.0f}", 1.0),
+    ("N_f_conc",           "N_con",    "{:5.0f}", 1.0),
+    ("phi_OF_evi",         "phi",      "{:5.2f}", 1.0),
+    ("tau_M0102_runtime",  "M0102_rt", "{:8.0f}", 1.0),
+    ("tau_M0102_interval", "M0102_iv", "{:8.0f}", 1.0),
+    ("tau_M0203_runtime",  "M0203_rt", "{:8.0f}", 1.0),
+    ("tau_M0203_interval", "M0203_iv", "{:8.0f}", 1.0),
+    ("evaporator_margin",  "evi_mrg",  "{:7.2f}", 1.0),
+    ("stabilizer_margin",  "stab_mrg", "{:8.2f}", 1.0),
+    ("concentrate_days",   "conc_d",   "{:6.1f}", 1.0),
+]
+
+SIMULATION_COLUMNS = [
+    ("sim_stabilizer_min", "stab_min", "{:8.2f}", 1.0),
+    ("sim_stabilizer_max", "stab_max", "{:8.2f}", 1.0),
+    ("sim_evaporator_min", "evi_min",  "{:7.2f}", 1.0),
+    ("sim_evaporator_max", "evi_max",  "{:7.2f}", 1.0),
+    ("sim_effluent",       "effluent", "{:8.2f}", 1.0),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter study for the pump time parameters (mass balance on a grid).")
+    for name, option, default, _, description in SWEEP:
+        parser.add_argument(option, dest=name, default=default, help=f"{description}, 'start:stop:num' or list (default {default})")
+    parser.add_argument("--top", type=int, default=20, help="number of ranked candidates to show")
+    parser.add_argument("--simulate", type=float, default=0.0, help="simulate level trajectories of the shown candidates for this many days")
+    parser.add_argument("--csv", help="write the ranked candidates to a CSV file")
+    args = parser.parse_args()
+
+    plant = plant_limits()
+    values = {name: parse_range(getattr(args, name))*scale for name, _, _, scale, _ in SWEEP}
+    n_total = int(np.prod([grid.size for grid in values.values()]))
+
+    t_start = time.perf_counter()
+    results = sweep(values, plant)
+
+    # rank feasible combinations by score (partial sort, only the top candidates are ordered)
+    feasible = np.flatnonzero(results["feasible"])
+    scores = results["score"].ravel()[feasible]
+    top = feasible[:0]
+    if scores.size:
+        order = np.argpartition(-scores, min(args.top, scores.size) - 1)[:args.top]
+        top = feasible[order[np.argsort(-scores[order])]]
+    candidates = {name: value.ravel()[top] for name, value in results.items()}
+    t_sweep = time.perf_counter() - t_start
+
+    columns = list(COLUMNS)
+    if args.simulate > 0 and top.size:
+        candidates.update(simulate_levels(candidates, plant, args.simulate))
+        columns += SIMULATION_COLUMNS
+
+    print(f"\n{n_total} combinations evaluated in {t_sweep:.2f} s, {feasible.size} feasible")
+    print("Units: inflow kg/d, evap kg/h, pumps g/min, times s, margins kg, conc_d days until concentrate tank is full\n")
+    print("rank " + " ".join(f"{label:>{len(fmt.format(0))}s}" for _, label, fmt, _ in columns))
+    for rank in range(top.size):
+        print(f"{rank + 1:4d} " + " ".join(fmt.format(candidates[name][rank]*scale) for name, _, fmt, scale in columns))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rank"] + [name for name, _, _, _ in columns])
+            for rank in range(top.size):
+                writer.writerow([rank + 1] + [candidates[name][rank]*scale for name, _, _, scale in columns])
+
+
+if __name__ == "__main__":
+    main()
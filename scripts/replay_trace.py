@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+import tomllib
+
+import numpy as np
+
+from src import hal
+from src.hal_trace import TraceRecorder, RecordingBackend, TraceReplayBackend
+from src.simulated_hal import SimulatedBackend
+from src.signal_store import SignalStore
+from src.utils import load_ios_from_toml, get_file_path
+from src.io_registry import IORegistry
+
+
+def statistics(samples):
+    """
+    Mean, median, 95th percentile and maximum [ms].
+    """
+    if not samples:
+        return {"n": 0}
+    values = np.array(samples)*1000
+    return {"n": len(samples), "mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)), "max_ms": float(values.max())}
+
+
+def run_benchmark(backend, cycles, signal, actuator_name, threshold):
+    """
+    Acquisition cycles as in 'data_acquisition' (one thread per sensor read) and control reaction latency:
+    time from publishing 'signal' until a waiting thread has written the actuator state.
+    """
+    pxt = backend.create_pxt()
+    with open(os.devnull, "w") as out, contextlib.redirect_stdout(out):
+        sensors, actuators = load_ios_from_toml("read", "io_list.toml", pxt)
+    io = IORegistry(sensors, actuators)
+    act = io.actuator(actuator_name)
+    signals = SignalStore()
+
+    reaction_times = []
+    done = threading.Event()
+
+    def read(sensor):
+        value = sensor.read_value()
+        if value is not None:
+            signals.publish(sensor.name, value, time.perf_counter())  # publication time for the reaction latency
+
+    def react():
+        last_seq = 0
+        while not done.is_set():
+            if not signals.wait_until(signal, lambda value: True, timeout=0.5, after_seq=last_seq):
+                continue
+            value, t_publish, last_seq = signals.get_entry(signal)
+            act.set_state(value > threshold)
+            reaction_times.append(time.perf_counter() - t_publish)
+
+    reactor = threading.Thread(target=react)
+    reactor.start()
+
+    cycle_times = []
+    with open(os.devnull, "w") as out, contextlib.redirect_stdout(out):
+        for _ in range(cycles):
+            t_start = time.perf_counter()
+            threads = [threading.Thread(target=read, args=(sensor,)) for sensor in sensors]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if getattr(backend, "exhausted", False):
+                break  # end of the replayed trace (incomplete cycle)
+            cycle_times.append(time.perf_counter() - t_start)
+
+    done.set()
+    reactor.join()
+    return {"acquisition_cycle": statistics(cycle_times), "reaction_latency": statistics(reaction_times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquisition and reaction benchmark on a recorded hardware trace.")
+    parser.add_argument("trace", nargs="?", help="trace file to replay (see 'hal_trace' in parameters.toml)")
+    parser.add_argument("--record", help="run on the simulated backend and record the hardware accesses into this file")
+    parser.add_argument("--speed", type=float, default=0.0, help="replay speed (1: original timing, 0: as fast as possible)")
+    parser.add_argument("--cycles", type=int, default=50, help="maximum number of acquisition cycles")
+    parser.add_argument("--signal", default="B0111", help="sensor whose publication triggers the reaction")
+    parser.add_argument("--actuator", default="M0111", help="actuator written by the reaction")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    with open(get_file_path("read", "parameters.toml"), "rb") as f:
+        threshold = float(tomllib.load(f).get(f"threshold_min_{args.signal}", 0.0))
+
+    if args.record:
+        recorder = TraceRecorder(args.record)
+        backend = RecordingBackend(SimulatedBackend.from_toml(get_file_path("read", "simulation.toml")), recorder)
+    elif args.trace:
+        backend = TraceReplayBackend(args.trace, args.speed)
+    else:
+        parser.error("either a trace file or --record is required")
+
+    hal.set_backend(backend)
+    t_start = time.perf_counter()
+    result = run_benchmark(backend, args.cycles, args.signal, args.actuator, threshold)
+    result["real_time_s"] = time.perf_counter() - t_start
+
+    if args.record:
+        recorder.close()
+        result["trace"] = {"records": recorder.records, "dropped": recorder.dropped, "bytes": recorder.size}
+    else:
+        result["trace"] = {"recorded_s": backend.duration, "command_mismatches": backend.mismatches, "exhausted": backend.exhausted}
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"\nFinished in {result['real_time_s']:.2f} s, trace: {result['trace']}")
+    for name in ("acquisition_cycle", "reaction_latency"):
+        stats = result[name]
+        if stats["n"]:
+            print(f"  {name:18s} n={stats['n']:5d}  mean {stats['mean_ms']:9.3f} ms  p50 {stats['p50_ms']:9.3f} ms  "
+                  f"p95 {stats['p95_ms']:9.3f} ms  max {stats['max_ms']:9.3f} ms")
+        else:
+            print(f"  {name:18s} no samples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import tomllib
+
+from src.simulation import Simulation, prepare_work_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the controller against the plant twin on a virtual clock.")
+    parser.add_argument("--days", type=float, default=7.0, help="simulated plant time [d]")
+    parser.add_argument("--parameters", help="TOML file with parameters overriding 'read/parameters.toml'")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the plant twin (inflow events)")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--keep", help="directory for log and measurement files (default: temporary)")
+    args = parser.parse_args()
+
+    overrides = {"hal_backend": "simulated"}
+    if args.parameters:
+        with open(args.parameters, "rb") as f:
+            overrides.update({key: str(value) for key, value in tomllib.load(f).items()})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = os.path.abspath(args.keep or tmp_dir)
+        prepare_work_dir(work_dir, overrides)
+
+        # routine output goes to a file in the working directory
+        with open(os.path.join(work_dir, "data", "prompt.txt"), "w") as prompt, contextlib.redirect_stdout(prompt):
+            simulation = Simulation(work_dir, seed=args.seed)
+            result = simulation.run(args.days*86400)
+        os.chdir("/")
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"\nSimulated {result['simulated_days']:.2f} days in {result['real_time_s']:.1f} s ({result['speedup']:.0f}x real time)")
+    print(f"Inflow events: {result['inflow_events']} (detected: {result['detected_events']})")
+    print("\nFlows [kg]")
+    for name, value in result["totals_kg"].items():
+        print(f"  {name:22s} {value:10.2f}")
+    print("\nMasses [kg]              final       min       max")
+    for name, value in result["final_kg"].items():
+        low, high = result["level_range_kg"].get(name, (value, value))
+        print(f"  {name:20s} {value:9.2f} {low:9.2f} {high:9.2f}")
+    print("\nPump on-time [h]")
+    for name, value in sorted(result["pump_on_time_s"].items()):
+        print(f"  {name:22s} {value/3600:10.2f}")
+    print("\nSoft sensor (last window)      estimate     plant")
+    for name, value in result["soft_sensor"].items():
+        plant = result["plant_rates_kg_h"].get(name)
+        print(f"  {name:26s} {value:10.3f}" + (f" {plant:9.3f}" if plant is not None else ""))
+    print("\nLog entries")
+    for name, value in sorted(result["log_entries"].items()):
+        print(f"  {name:34s} {value:6d}")
+    print(f"\nMass balance error: {result['mass_balance_error_kg']:.2e} kg")
+
+
+if __name__ == "__main__":
+    main()
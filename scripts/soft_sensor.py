@@ -0,0 +1,100 @@
+import argparse
+import concurrent.futures
+import csv
+import datetime
+import math
+import os
+import time
+import tomllib
+
+import numpy as np
+
+from src.soft_sensor import COLUMNS, Estimate, rolling_estimates, soft_sensor_parameters, suggest_parameters
+from src.utils import get_file_path
+from webgui.history import archive_files, load_day
+
+
+def align(t, times, values, tolerance):
+    """
+    Values of the samples logged in the same acquisition cycle as 't' (within 'tolerance' [s]), NaN if there is none.
+    """
+    if times.size == 0:
+        return np.full(t.shape, math.nan)
+    i = np.searchsorted(times, t + tolerance, side="right") - 1
+    found = (i >= 0) & (np.abs(times[np.maximum(i, 0)] - t) <= tolerance)
+    return np.where(found, values[np.maximum(i, 0)], math.nan)
+
+
+def load_samples(file_path, interval):
+    """
+    Samples of the soft sensor ('COLUMNS', one per logged stabilizer level) from one daily measurement file
+    (runs in a worker process).
+    """
+    signals = load_day(file_path, os.path.getmtime(file_path))
+    t, _ = signals.get("B0101", (np.zeros(0), np.zeros(0)))
+    t = np.unique(t)  # one sample per logged second, as at runtime
+    samples = np.empty((len(COLUMNS), t.size))
+    samples[0] = t
+    for row, name in enumerate(COLUMNS[1:], 1):
+        times, values = signals.get(name, (np.zeros(0), np.zeros(0)))
+        samples[row] = align(t, times, values.astype(np.float64), interval/2)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling evaporation, inflow and feed rates and mass balance residual "
+                                                 "over the archived measurement files (same estimator as at runtime).")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="last day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes parsing the daily files")
+    parser.add_argument("--csv", help="write the estimate after each sample to a CSV file")
+    args = parser.parse_args()
+
+    with open(get_file_path("read", "parameters.toml"), "rb") as f:
+        pl = tomllib.load(f)
+    parameters = soft_sensor_parameters(pl)
+    interval = float(pl.get("dataq_sampling_interval", 10.0))
+
+    files = archive_files()
+    days = sorted(day for day in files if (args.date_from is None or day >= args.date_from)
+                  and (args.date_to is None or day <= args.date_to))
+    if not days:
+        print("No measurement files found for the given date(s).")
+        return
+
+    t_start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        samples = np.concatenate(list(pool.map(load_samples, [files[day] for day in days], [interval]*len(days))), axis=1)
+    t_load = time.perf_counter() - t_start
+    estimates = rolling_estimates(samples, parameters)
+    t_estimate = time.perf_counter() - t_start - t_load
+    print(f"{len(days)} days, {samples.shape[1]} samples, window {parameters.window} samples "
+          f"(parsing {t_load:.2f} s, estimation {t_estimate:.2f} s)")
+
+    # daily medians of the rates [kg/h]
+    sample_days = np.array([datetime.date.fromtimestamp(t) for t in samples[0]])
+    print(f"\n{'day':10s} {'evap':>7s} {'duty':>5s} {'inflow':>7s} {'feed':>7s} {'residual':>8s}")
+    for day in days:
+        selected = sample_days == day
+        medians = Estimate(*(np.nanmedian(values[selected]) if np.isfinite(values[selected]).any() else math.nan
+                             for values in estimates))
+        print(f"{day.isoformat():10s} {medians.evaporation_rate*3600:7.3f} {medians.evaporation_duty:5.2f} "
+              f"{medians.inflow_rate*3600:7.3f} {medians.feed_rate*3600:7.3f} {medians.mass_balance_residual*3600:8.3f}")
+
+    # suggestions from the medians over the selected days
+    overall = Estimate(*(np.nanmedian(values) if np.isfinite(values).any() else math.nan for values in estimates))
+    suggestions = suggest_parameters(overall, pl)
+    print("\nsuggested parameters (medians of the selected days):" if suggestions else "\nno suggestions (rates unknown)")
+    for name, value in suggestions.items():
+        print(f"  {name:20s} = \"{value:.0f}\"   (current: \"{pl.get(name)}\")")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("time",) + Estimate._fields)
+            writer.writerows(zip(samples[0], *estimates))
+        print(f"\nestimates written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
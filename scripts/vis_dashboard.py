@@ -1,10 +1,15 @@
 import numpy as np
 import re
+import tomllib
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 from pathlib import Path
 
+from src.inflow_events import detect_events, inflow_parameters
+from src.utils import get_file_path
+from webgui.history import local_epoch
+
 # Path to the data directory
 data_dir = Path(__file__).resolve().parent.parent / 'data'
 
@@ -93,16 +98,15 @@ M0301 = filter_data(DF, 'io_type', 'Actuator', 'name', 'M0301').sort_values(by='
 # CALCULATIONS
 #---------------------------
 
-# consider only larger than detection threshold
-detect_threshold = .1
-NZ_EVENT = EVENT[EVENT["value_aux1"] > detect_threshold]
-
-# Step 2: Keep only rows where the value differs from the previous row
-NZ_EVENT = NZ_EVENT[NZ_EVENT["value_aux1"] != NZ_EVENT["value_aux1"].shift()]
+# inflow events on the collector level (same detector as at runtime, parameters from 'parameters.toml')
+with open(get_file_path("read", "parameters.toml"), "rb") as f:
+    inflow = inflow_parameters(tomllib.load(f))
+B0111_time = local_epoch(B0111["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist())  # local time, as logged
+INFLOW_EVENTS = detect_events(B0111_time, B0111["value"].to_numpy(dtype=np.float64), inflow)
 
 # extract number of events over considered period and average inflow volume
-num_events = len(NZ_EVENT)
-avg_value = NZ_EVENT["value_aux1"].mean()
+num_events = len(INFLOW_EVENTS)
+avg_value = INFLOW_EVENTS["volume"].mean() if num_events else np.nan
 
 
 #---------------------------
@@ -0,0 +1,149 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.clock import WallClock
+from src.routines import Sleep, Pause, WaitUntil, WaitForUpdate, Blocking, Start, Join
+
+
+class ShutdownRequested(Exception):
+    pass
+
+
+class AsyncRuntime:
+    def __init__(self, routines_, io, max_workers=4):
+        """
+        Runs the routines as coroutines on one event loop (alternative to one thread per routine).
+        The control logic ('<routine>_steps' generators), parameters, state and clock are those of the
+        'routines' instance, only the requested waits are carried out here ('drive'); blocking hardware
+        access (I2C/SPI reads, console input) is passed to a small bounded executor. The waits use the
+        event loop's time, so the routines have to run on the wall clock (virtual time: thread runtime).
+        """
+        if not isinstance(routines_.clock, WallClock):
+            raise ValueError(f"The asyncio runtime requires the wall clock, not {type(routines_.clock).__name__}.")
+        self.r = routines_
+        self.io = io
+        self.max_workers = max_workers
+        self.executor = None
+        self.loop = None
+        self.update_event = None  # replaced on every signal publication (wakes all waiting coroutines)
+        self.stopped_event = None  # set on shutdown (see 'on_shutdown')
+
+
+    async def run(self, routine_names):
+        """
+        Run the routines until shutdown. Leaving the task group cancels all routines
+        (shutdown event, Ctrl+C or an exception in one of the routines).
+        """
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="io")
+        self.update_event = asyncio.Event()
+        self.stopped_event = asyncio.Event()
+        self.r.signals.subscribe(self.on_publish)
+        self.r.shutdown_event.subscribe(self.on_shutdown)
+
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(self.wait_for_shutdown(), name="shutdown")
+                for name in routine_names:
+                    tasks.create_task(self.drive(getattr(self.r, f"{name}_steps")(self.io)), name=name)
+        except* ShutdownRequested:
+            pass
+        finally:
+            self.r.signals.unsubscribe(self.on_publish)
+            self.r.shutdown_event.unsubscribe(self.on_shutdown)
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+    async def wait_for_shutdown(self):
+        if not self.r.shutdown_event.is_set():  # set before the subscription
+            await self.stopped_event.wait()
+        raise ShutdownRequested()
+
+
+    # pass blocking calls (hardware access, console input) to the executor (returns an awaitable future)
+    def run_blocking(self, function, *args):
+        return self.loop.run_in_executor(self.executor, function, *args)
+
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+    # signal store callback (called from the publishing thread)
+    def on_publish(self):
+        self.loop.call_soon_threadsafe(self.notify_update)
+
+    def notify_update(self):
+        self.update_event.set()
+        self.update_event = asyncio.Event()
+
+    # shutdown event callback (called from the stopping thread)
+    def on_shutdown(self):
+        self.loop.call_soon_threadsafe(self.stopped_event.set)
+
+
+    async def wait_until(self, name, predicate, timeout, after_seq=0):
+        """
+        Wait until a value of the signal published after 'after_seq' satisfies the predicate.
+        Returns False on timeout (same semantics as 'SignalStore.wait_until').
+        """
+        deadline = self.loop.time() + timeout
+        while True:
+            entry = self.r.signals.get_entry(name)
+            if entry is not None and entry[2] > after_seq and predicate(entry[0]):
+                return True
+
+            remaining = deadline - self.loop.time()
+            if remaining <= 0 or self.r.signals.closed:
+                return False
+            try:
+                async with asyncio.timeout(remaining):
+                    await self.update_event.wait()
+            except TimeoutError:
+                return False
+
+
+    async def wait_for_update(self, names, last_seq, timeout):
+        """
+        Wait until one of the signals has been published after 'last_seq'. Returns the latest sequence number.
+        """
+        deadline = self.loop.time() + timeout
+        while True:
+            seq = self.r.signals.latest_seq(names)
+            remaining = deadline - self.loop.time()
+            if seq > last_seq or remaining <= 0 or self.r.signals.closed:
+                return seq
+            try:
+                async with asyncio.timeout(remaining):
+                    await self.update_event.wait()
+            except TimeoutError:
+                return self.r.signals.latest_seq(names)
+
+
+    async def drive(self, steps):
+        """
+        Run the steps of a routine, the requested waits on the event loop (see 'routines.run_steps').
+        """
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration:
+                return
+
+            if isinstance(request, (Sleep, Pause)):  # a pause ends with the shutdown (all tasks are cancelled)
+                await self.sleep(request.seconds)
+                result = None
+            elif isinstance(request, WaitUntil):
+                result = await self.wait_until(request.name, request.predicate, request.timeout, request.after_seq)
+            elif isinstance(request, WaitForUpdate):
+                result = await self.wait_for_update(request.names, request.last_seq, request.timeout)
+            elif isinstance(request, Blocking):
+                result = await self.run_blocking(request.function, *request.args)
+            elif isinstance(request, Start):
+                result = self.run_blocking(request.function, *request.args)
+            elif isinstance(request, Join):
+                await asyncio.gather(*request.handles)
+                result = None
+            else:
+                raise TypeError(f"unknown wait request: {request!r}")
@@ -0,0 +1,195 @@
+import contextlib
+import csv
+import datetime
+import os
+import tempfile
+from collections import Counter
+
+from src import inflow_events
+from src.simulation import Simulation, prepare_work_dir
+
+
+# decision logic replayed against archived data (no data acquisition: the archive is the sensor feed,
+# no prompt output and no manual refill procedure)
+BACKTEST_ROUTINES = [
+    "stabilizer_stirrer",
+    "evaporator_feed",
+    "collector_flush",
+    "collector_drain",
+    "evaporation",
+    "concentrate_discharge",
+    "observer",
+]
+
+
+def parse_value(text):
+    """
+    Sensor value as written by the data acquisition (bool for digital inputs, None if not read).
+    """
+    if text == "True":
+        return True
+    if text == "False":
+        return False
+    if text in ("", "None"):
+        return None
+    return float(text)
+
+
+def load_archive(file_paths):
+    """
+    Read archived daily measurement files ('data/<date>_<machine>_measurement_data.csv').
+    Returns the sensor feed as a time ordered list of (timestamp, [(name, value), ...]) and the archived
+    actuator states as a list of (timestamp, name, state).
+    """
+    timestamps = {}  # the rows of one acquisition cycle share few distinct timestamps
+    def parse_time(text):
+        t = timestamps.get(text)
+        if t is None:
+            t = timestamps[text] = datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp()
+        return t
+
+    feed = {}
+    actuator_states = []
+    for file_path in sorted(file_paths):
+        with open(file_path, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 9:
+                    continue
+                if row[3] == "Sensor":
+                    value = parse_value(row[8])
+                    if value is not None:
+                        feed.setdefault(parse_time(row[0]), []).append((row[5], value))
+                elif row[3] == "Actuator":
+                    actuator_states.append((parse_time(row[0]), row[5], row[7] == "True"))
+
+    return sorted(feed.items()), actuator_states
+
+
+def switching_summary(transitions, start_time, end_time):
+    """
+    Number of switch-ons and on-time [s] per actuator from a list of (timestamp, name, state).
+    """
+    switches = Counter()
+    on_time = Counter()
+    on_since = {}
+    for t, name, state in transitions:
+        if state and name not in on_since:
+            on_since[name] = t
+            switches[name] += 1
+        elif not state and name in on_since:
+            on_time[name] += t - on_since.pop(name)
+    for name, t in on_since.items():
+        on_time[name] += end_time - t
+    return {name: {"switches": switches[name], "on_time_s": on_time[name]} for name in sorted(set(switches) | set(on_time))}
+
+
+def archived_decisions(actuator_states):
+    """
+    Transitions of the actuator states recorded in the archive (reference for the replayed decisions).
+    """
+    transitions = []
+    last = {}
+    for t, name, state in actuator_states:
+        if last.get(name, False) != state:
+            transitions.append((t, name, state))
+        last[name] = state
+    return transitions
+
+
+class Replay(Simulation):
+    def __init__(self, work_dir, feed, routine_names=BACKTEST_ROUTINES):
+        """
+        Decision logic of the routines fed with archived sensor values on a virtual clock. 'feed' is the
+        sensor feed from 'load_archive'; the actuator decisions are recorded instead of driving a plant.
+        """
+        super().__init__(work_dir, start_time=feed[0][0], routine_names=routine_names)
+        self.feed = feed
+        self.decisions = []  # (timestamp, actuator, state)
+
+        # record the state changes written by the routines
+        for actuator in self.io.actuators:
+            if actuator.writer is not None:
+                actuator.writer = self.recording_writer(actuator, actuator.writer)
+
+
+    def recording_writer(self, actuator, writer):
+        def write(state):
+            if bool(state) != actuator.state:
+                self.decisions.append((self.clock.time(), actuator.name, bool(state)))
+            writer(state)
+        return write
+
+
+    def drive(self, end_time):
+        """
+        Publish the archived sensor values at their recorded times. The collector level and the replayed
+        drain / flush states go to the inflow detector, as in the data acquisition.
+        """
+        io = self.io
+        r = self.routines
+        signals = r.signals
+        for t, values in self.feed:
+            if t > end_time:
+                break
+            if t > self.clock.time():
+                self.clock.sleep(t - self.clock.time())
+            names = []
+            published = []
+            for name, value in values:
+                sensor_id = io.sensor_ids.get(name)
+                if sensor_id is not None:
+                    io.sensors[sensor_id].value = value
+                    names.append(name)
+                    published.append(value)
+            signals.publish_many(names, published, t)
+            for name, value in values:
+                if name == inflow_events.SIGNAL:
+                    r.detect_inflow(t, value)
+            for name in inflow_events.ACTIONS:
+                if name in io.actuator_ids and io.actuator(name).state:
+                    r.inflow_detector.action(name, t)
+        if end_time > self.clock.time():
+            self.clock.sleep(end_time - self.clock.time())
+
+
+    def summary(self, duration, real_time):
+        with open(self.routines.log_file_path, newline="") as f:
+            log_entries = [(row["datetime"], row["tag"], row["value"]) for row in csv.DictReader(f)]
+        alarm_tags = {rule["log_tag"] for rule in self.routines.observer_rules.rules}
+
+        return {
+            "replayed_days": duration/86400.,
+            "real_time_s": real_time,
+            "speedup": duration/real_time,
+            "detected_events": self.routines.event_nbr,
+            "cumulative_inflow": self.routines.cumulative_inflow,
+            "actuators": switching_summary(self.decisions, self.start_time, self.start_time + duration),
+            "decisions": list(self.decisions),
+            "log_entries": dict(Counter(tag for _, tag, _ in log_entries)),
+            "alarm_edges": [entry for entry in log_entries if entry[1] in alarm_tags],
+        }
+
+
+def run_backtest(name, parameter_overrides, file_paths, source_dir):
+    """
+    Replay the archive with one parameter set in a temporary working directory (runs in a worker process).
+    """
+    feed, _ = load_archive(file_paths)
+    if not feed:
+        raise ValueError("no sensor values in the archive")
+    overrides = {"hal_backend": "simulated"}
+    overrides.update(parameter_overrides)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_work_dir(work_dir, overrides, source_dir)
+        try:
+            with open(os.devnull, "w") as prompt, contextlib.redirect_stdout(prompt):
+                replay = Replay(work_dir, feed)
+                result = replay.run(feed[-1][0] - feed[0][0])
+        finally:
+            os.chdir(cwd)
+
+    result["name"] = name
+    result["parameters"] = dict(parameter_overrides)
+    return result
@@ -0,0 +1,134 @@
+import datetime
+import math
+import threading
+import time
+
+
+class WallClock:
+    """
+    Real time (default clock of the routines).
+    """
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+    def wait_for(self, condition, predicate, timeout=None):
+        with condition:
+            return condition.wait_for(predicate, timeout)
+
+    def notify(self):
+        pass
+
+
+class Waiter:
+    __slots__ = ("deadline", "predicate", "lock")
+
+    def __init__(self, deadline, predicate):
+        self.deadline = deadline
+        self.predicate = predicate
+        self.lock = threading.Lock()  # held until the waiter is woken (cheaper than an event)
+        self.lock.acquire()
+
+
+class VirtualClock:
+    def __init__(self, start_time=0.0, participants=0):
+        """
+        Discrete-event clock for running the routines faster than real time. Time stands still while
+        any participating thread is running; when all participants wait on the clock, it jumps to the
+        earliest deadline. Only participating threads may wait on the clock ('participants' is set
+        before the threads are started, each thread calls 'unregister' when it ends).
+        """
+        self.current_time = float(start_time)
+        self.participants = participants
+        self.waiters = []
+        self.stopped = False
+        self.lock = threading.Lock()
+
+
+    def time(self):
+        return self.current_time
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.current_time)
+
+    def sleep(self, seconds):
+        self.wait_for(None, lambda: False, seconds)
+
+    def wait(self, event, timeout=None):
+        return self.wait_for(None, event.is_set, timeout)
+
+
+    def wait_for(self, condition, predicate, timeout=None):
+        """
+        Wait until the predicate is true or the (virtual) timeout has passed. 'condition' is not used,
+        publishers call 'notify' instead.
+        """
+        with self.lock:
+            if self.stopped or predicate():
+                return predicate()
+            if timeout is not None and timeout <= 0:
+                return False
+
+            deadline = math.inf if timeout is None else self.current_time + timeout
+            waiter = Waiter(deadline, predicate)
+            self.waiters.append(waiter)
+            self.advance()
+
+        waiter.lock.acquire()
+        return predicate()
+
+
+    def advance(self):
+        """
+        Called with the lock held: if all participants are waiting, wake those whose predicate holds,
+        otherwise move time forward to the earliest deadline.
+        """
+        if len(self.waiters) < self.participants:
+            return
+
+        ready = [waiter for waiter in self.waiters if waiter.predicate()]
+        if not ready:
+            next_time = min((waiter.deadline for waiter in self.waiters), default=math.inf)
+            if next_time == math.inf:
+                return  # only a notification can wake a participant
+            self.current_time = max(self.current_time, next_time)
+            ready = [waiter for waiter in self.waiters if waiter.deadline <= self.current_time]
+
+        self.wake(ready)
+
+
+    def wake(self, waiters):
+        for waiter in waiters:
+            self.waiters.remove(waiter)
+            waiter.lock.release()
+
+
+    def notify(self):
+        """
+        Wake the waiting threads whose predicate has become true (e.g. after a signal has been published).
+        """
+        with self.lock:
+            self.wake([waiter for waiter in self.waiters if waiter.predicate()])
+
+
+    def unregister(self):
+        with self.lock:
+            self.participants -= 1
+            self.advance()
+
+
+    def stop(self):
+        """
+        Release all waiting threads, all following waits return immediately (used on shutdown).
+        """
+        with self.lock:
+            self.stopped = True
+            self.wake(list(self.waiters))
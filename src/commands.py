@@ -0,0 +1,95 @@
+import queue
+import time
+
+from src import metrics
+
+
+class Command:
+    __slots__ = ("id", "issued")
+    action = None
+
+    def __init__(self, id=0):
+        self.id = id  # set by the sender to match the acknowledgement (0: not acknowledged)
+        self.issued = time.monotonic()  # system wide clock, comparable between processes
+
+    def __repr__(self):
+        arguments = ", ".join(f"{name}={getattr(self, name)!r}" for name in type(self).__slots__)
+        return f"{type(self).__name__}({arguments})"
+
+
+class Start(Command):
+    __slots__ = ()
+    action = "start"
+
+
+class Stop(Command):
+    __slots__ = ()
+    action = "stop"
+
+
+class EnableRoutine(Command):
+    __slots__ = ("name",)
+    action = "enable_routine"
+
+    def __init__(self, name, id=0):
+        super().__init__(id)
+        self.name = name
+
+
+class DisableRoutine(Command):
+    __slots__ = ("name",)
+    action = "disable_routine"
+
+    def __init__(self, name, id=0):
+        super().__init__(id)
+        self.name = name
+
+
+class SetRoutines(Command):
+    __slots__ = ("names",)
+    action = "set_routines"
+
+    def __init__(self, names, id=0):
+        super().__init__(id)
+        self.names = frozenset(names)
+
+
+class ReloadParameters(Command):
+    __slots__ = ()
+    action = "reload_parameters"
+
+
+class CommandBus:
+    def __init__(self):
+        """
+        Commands for the controller. The controller blocks on the queue and handles each command as soon as it
+        arrives (no polling); after each command the listeners are called with the command and its result
+        (e.g. to share the new status and acknowledge the command to the GUI process).
+        """
+        self.queue = queue.Queue()
+        self.listeners = []
+
+
+    def put(self, command):
+        self.queue.put(command)
+
+
+    def get(self, timeout=None):
+        """
+        Next command, or None if no command arrived within the timeout.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+    def done(self, command, result):
+        """
+        Called by the controller when the command has taken effect: records the latency since it was issued.
+        """
+        metrics.histogram("nh_command_latency_seconds", "Time from issuing a command until it has taken effect",
+                          action=command.action).observe(time.monotonic() - command.issued)
+        metrics.counter("nh_commands_total", "Processed commands", action=command.action, status=result["status"]).inc()
+        for callback in self.listeners:
+            callback(command, result)
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from src.routines import routines
+from src.sampler import create_analog_sampler
+from src.process_image import ProcessImage
+from src.supervisor import RoutineSupervisor
+
+
+class Controller:
+    def __init__(self, pxt, io, selected, available, parameter_file_name="parameters.toml", log_file_name="log_file.csv"):
+        """
+        Executes the commands of the command bus (see 'src/commands.py'). The routines instance is created once
+        and kept between runs (parameters are parsed and the log file is read only once); the routine threads
+        are owned by the supervisor (see 'src/supervisor.py').
+        """
+        self.pxt = pxt
+        self.io = io
+        self.routines = routines(time.time(), parameter_file_name, log_file_name)
+        self.selected = set(selected)
+        self.available = frozenset(available)  # names which can be selected
+        self.running = False
+        self.started = threading.Event()  # set after the first start (startup profile)
+
+        self.supervisor = RoutineSupervisor(self.routines, io)
+        self.process_image = None
+        self.sampler = None
+        self.stopping = None  # thread finishing the last run (waits for the routines, switches the outputs off)
+
+
+    def run(self, bus):
+        """
+        Handle the commands of the bus until interrupted (KeyboardInterrupt).
+        """
+        deferred = []  # commands after a start while the last run is still finishing (in order)
+        while True:
+            command = bus.get(timeout=0.1 if deferred else 1.0)
+            self.supervisor.reap(self.selected if self.running else set())
+            if deferred and not self.stopping.is_alive():
+                for waiting in deferred:
+                    self.handle(bus, waiting)
+                deferred = []
+            if command is None:
+                continue
+            if deferred or (command.action == "start" and self.stopping is not None and self.stopping.is_alive()):
+                if not deferred:
+                    print("Start deferred until the routines of the last run have finished")
+                deferred.append(command)
+                continue
+            self.handle(bus, command)
+
+
+    def handle(self, bus, command):
+        try:
+            result = getattr(self, "on_" + command.action)(command) or {"status": "ok"}
+        except Exception as e:
+            print(f"Command {command} failed: {e}")
+            result = {"status": "error", "message": str(e)}
+        bus.done(command, result)
+
+
+    def on_start(self, command):
+        if self.running:
+            return
+
+        r = self.routines
+        r.reset(time.time())
+
+        # start PiXtend process image and background sampler for analog inputs (filtered values)
+        pl = r.load_parameter_list()
+        self.process_image = ProcessImage(self.pxt, float(pl.get("px_cycle_time", 0.03)))
+        self.process_image.attach(self.io.sensors, self.io.actuators)
+        self.process_image.start()
+        self.sampler = create_analog_sampler(self.io.sensors, self.pxt, pl, self.process_image, r.signals)
+        self.sampler.start()
+
+        self.running = True
+        for name in sorted(self.selected):
+            self.supervisor.start(name)
+        self.started.set()
+
+
+    def on_stop(self, command):
+        if not self.running:
+            return
+        self.running = False
+        r = self.routines
+        r.shutdown_event.set()
+        r.signals.close()
+
+        tasks = self.supervisor.stop_all()
+        self.stopping = threading.Thread(target=self.finish_run, args=(tasks, self.process_image, self.sampler), name="controller_stop")
+        self.stopping.start()
+
+
+    def on_enable_routine(self, command):
+        self.check_name(command.name)
+        self.selected.add(command.name)
+        if self.running:
+            self.supervisor.start(command.name)
+
+
+    def on_disable_routine(self, command):
+        self.check_name(command.name)
+        self.selected.discard(command.name)
+        self.supervisor.stop(command.name)
+
+
+    def on_set_routines(self, command):
+        for name in command.names:
+            self.check_name(name)
+        for name in self.selected - command.names:
+            self.supervisor.stop(name)
+        added = command.names - self.selected
+        self.selected = set(command.names)
+        if self.running:
+            for name in sorted(added):
+                self.supervisor.start(name)
+
+
+    def on_reload_parameters(self, command):
+        r = self.routines
+        r.parameter_file_mtime = None  # parse again even if the modification time has not changed
+        r.load_parameter_list()
+
+
+    def check_name(self, name):
+        if name not in self.available:
+            raise ValueError(f"Unknown routine '{name}'.")
+
+
+    def finish_run(self, tasks, process_image, sampler):
+        for task in tasks:
+            task.thread.join()
+            self.supervisor.ended(task)
+        sampler.stop()
+        process_image.stop()
+        process_image.detach(self.io.sensors, self.io.actuators)
+
+        # switch off all outputs (the PiXtend stays open for the next start)
+        for actuator in self.io.actuators:
+            if actuator.configured:
+                actuator.set_state(False)
+        print("Routines stopped")
+
+
+    def shutdown(self):
+        """
+        Stop all routines and close the PiXtend (end of the program).
+        """
+        self.on_stop(None)
+        if self.stopping is not None:
+            self.stopping.join()
+        self.routines.handle_shutdown(self.pxt)
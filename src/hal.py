@@ -0,0 +1,74 @@
+import abc
+import tomllib
+
+from src.AtlasI2C_orig import AtlasI2C
+
+
+class Backend(abc.ABC):
+    """
+    Hardware abstraction: access to the PiXtend (SPI process data) and to the I2C bus (EZO devices).
+    """
+    name = None
+
+    @abc.abstractmethod
+    def create_pxt(self):
+        """
+        Return a PiXtend instance (inputs, outputs and CRC flags as attributes, 'close()').
+        """
+
+    @abc.abstractmethod
+    def i2c_device(self, address=None):
+        """
+        Return an I2C device with the interface of 'AtlasI2C' ('query', 'list_i2c_devices', 'close').
+        """
+
+
+class HardwareBackend(Backend):
+    name = "hardware"
+
+    def create_pxt(self):
+        from pixtendv2l import PiXtendV2L  # only available on the PiXtend
+        return PiXtendV2L()
+
+    def i2c_device(self, address=None):
+        return AtlasI2C(address)
+
+
+# backend used by the IO drivers (set once at startup, see 'load_backend')
+backend = HardwareBackend()
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+def i2c_device(address=None):
+    return backend.i2c_device(address)
+
+
+def create_backend(name, simulation_file_path=None):
+    if name == "hardware":
+        return HardwareBackend()
+    if name == "simulated":
+        from src.simulated_hal import SimulatedBackend
+        return SimulatedBackend.from_toml(simulation_file_path)
+    raise ValueError(f"Unknown hardware backend '{name}'. Known backends: ['hardware', 'simulated']")
+
+
+def load_backend(parameter_file_path, simulation_file_path):
+    """
+    Select the backend given by 'hal_backend' in the parameter file and make it the active backend.
+    If 'hal_trace' is set, all hardware accesses are recorded into this file in the data folder.
+    """
+    with open(parameter_file_path, "rb") as f:
+        pl = tomllib.load(f)
+
+    new_backend = create_backend(pl.get("hal_backend", "hardware"), simulation_file_path)
+    if pl.get("hal_trace"):
+        from src.hal_trace import TraceRecorder, RecordingBackend
+        from src.utils import get_file_path
+        max_bytes = int(float(pl.get("hal_trace_max_mb", 100))*1e6)
+        new_backend = RecordingBackend(new_backend, TraceRecorder(get_file_path("data", pl["hal_trace"]), max_bytes))
+
+    set_backend(new_backend)
+    return backend
@@ -0,0 +1,320 @@
+import atexit
+import bisect
+import json
+import struct
+import threading
+import time
+
+from src.hal import Backend
+from src.io_drivers import INPUTS, OUTPUTS
+
+
+# Trace file: magic, header (wall clock start time, length of the JSON channel table), channel table,
+# then records: kind, channel, time since start [s], latency [s], kind specific payload.
+MAGIC = b"NHTRACE1"
+HEADER = struct.Struct("<dI")
+RECORD = struct.Struct("<BBdf")
+VALUE = struct.Struct("<d")      # PX_READ, PX_WRITE: register value
+STRINGS = struct.Struct("<BH")   # I2C_QUERY, I2C_ERROR: length of command and response / error message
+
+PX_READ, PX_WRITE, I2C_QUERY, I2C_ERROR, I2C_SCAN = range(1, 6)
+
+# PiXtend attributes recorded by channel number (stored in the trace header)
+PX_CHANNELS = INPUTS + OUTPUTS + ["crc_header_in_error", "crc_data_in_error"]
+
+
+class TraceRecorder:
+    def __init__(self, file_path, max_bytes=100_000_000, buffer_size=65536, changes_only=True):
+        """
+        Writes hardware accesses into a binary trace file. Records are collected in a buffer and written
+        in blocks; recording stops when the trace reaches 'max_bytes' (further records are counted as dropped).
+        With 'changes_only', PiXtend reads are only recorded when the value differs from the last read.
+        """
+        self.file = open(file_path, "wb")
+        self.start = time.perf_counter()
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.changes_only = changes_only
+        self.channels = {name: i for i, name in enumerate(PX_CHANNELS)}
+        self.last_values = {}
+
+        table = json.dumps({"px_channels": PX_CHANNELS}).encode()
+        self.file.write(MAGIC + HEADER.pack(time.time(), len(table)) + table)
+        self.size = len(MAGIC) + HEADER.size + len(table)
+
+        self.buffer = bytearray()
+        self.records = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+
+    def record(self, kind, channel, t_start, latency, payload):
+        with self.lock:
+            if self.file.closed or self.size + len(self.buffer) >= self.max_bytes:
+                self.dropped += 1
+                return
+            self.buffer += RECORD.pack(kind, channel, t_start - self.start, latency)
+            self.buffer += payload
+            self.records += 1
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+
+
+    def record_value(self, kind, channel, t_start, latency, value):
+        if kind == PX_READ and self.changes_only:
+            if self.last_values.get(channel) == value:
+                return
+            self.last_values[channel] = value
+        self.record(kind, channel, t_start, latency, VALUE.pack(float(value)))
+
+
+    def record_strings(self, kind, channel, t_start, latency, command, response):
+        command = command.encode()[:255]
+        response = response.split("\x00")[0].encode()[:65535]
+        self.record(kind, channel, t_start, latency, STRINGS.pack(len(command), len(response)) + command + response)
+
+
+    def flush(self):
+        """
+        Called with the lock held.
+        """
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.size += len(self.buffer)
+            self.buffer.clear()
+
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.flush()
+                self.file.close()
+
+
+class RecordingPiXtend:
+    def __init__(self, pxt, recorder):
+        """
+        Passes all attribute accesses to the PiXtend and records reads and writes of inputs, outputs and CRC flags.
+        """
+        object.__setattr__(self, "_pxt", pxt)
+        object.__setattr__(self, "_recorder", recorder)
+
+    def __getattr__(self, name):
+        t_start = time.perf_counter()
+        value = getattr(self._pxt, name)
+        channel = self._recorder.channels.get(name)
+        if channel is not None:
+            self._recorder.record_value(PX_READ, channel, t_start, time.perf_counter() - t_start, value)
+        return value
+
+    def __setattr__(self, name, value):
+        t_start = time.perf_counter()
+        setattr(self._pxt, name, value)
+        channel = self._recorder.channels.get(name)
+        if channel is not None:
+            self._recorder.record_value(PX_WRITE, channel, t_start, time.perf_counter() - t_start, value)
+
+    def close(self):
+        self._pxt.close()
+        self._recorder.close()
+
+
+class RecordingI2C:
+    def __init__(self, device, recorder, address):
+        """
+        I2C device recording each query (command, response, latency) and bus scan.
+        """
+        self.device = device
+        self.recorder = recorder
+        self.address = address or 0
+
+    def query(self, command):
+        t_start = time.perf_counter()
+        try:
+            response = self.device.query(command)
+        except IOError as e:
+            self.recorder.record_strings(I2C_ERROR, self.address, t_start, time.perf_counter() - t_start, command, str(e))
+            raise
+        self.recorder.record_strings(I2C_QUERY, self.address, t_start, time.perf_counter() - t_start, command, response)
+        return response
+
+    def list_i2c_devices(self):
+        t_start = time.perf_counter()
+        devices = self.device.list_i2c_devices()
+        self.recorder.record(I2C_SCAN, 0, t_start, time.perf_counter() - t_start, bytes([len(devices)] + list(devices)))
+        return devices
+
+    def close(self):
+        self.device.close()
+
+
+class RecordingBackend(Backend):
+    name = "recording"
+
+    def __init__(self, backend, recorder):
+        """
+        Wraps another backend and records all PiXtend and I2C accesses (see 'TraceRecorder').
+        """
+        self.backend = backend
+        self.recorder = recorder
+        self.pxt = None
+
+    def create_pxt(self):
+        if self.pxt is None:
+            self.pxt = RecordingPiXtend(self.backend.create_pxt(), self.recorder)
+        return self.pxt
+
+    def i2c_device(self, address=None):
+        return RecordingI2C(self.backend.i2c_device(address), self.recorder, address)
+
+
+def read_trace(file_path):
+    """
+    Read a trace file. Returns the header (start time, channel table) and the list of records
+    (kind, channel, time [s], latency [s], value or (command, response) or list of addresses).
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"'{file_path}' is not a hardware trace file.")
+
+    offset = len(MAGIC)
+    start_time, table_size = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+    header = json.loads(data[offset:offset + table_size])
+    header["start_time"] = start_time
+    offset += table_size
+
+    records = []
+    while offset + RECORD.size <= len(data):
+        kind, channel, t, latency = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if kind in (PX_READ, PX_WRITE):
+            payload = VALUE.unpack_from(data, offset)[0]
+            offset += VALUE.size
+        elif kind in (I2C_QUERY, I2C_ERROR):
+            n_command, n_response = STRINGS.unpack_from(data, offset)
+            offset += STRINGS.size
+            payload = (data[offset:offset + n_command].decode(), data[offset + n_command:offset + n_command + n_response].decode())
+            offset += n_command + n_response
+        elif kind == I2C_SCAN:
+            n = data[offset]
+            payload = list(data[offset + 1:offset + 1 + n])
+            offset += 1 + n
+        else:
+            raise ValueError(f"Unknown record kind {kind} in '{file_path}'.")
+        records.append((kind, channel, t, latency, payload))
+
+    return header, records
+
+
+class ReplayPiXtend:
+    ON = True
+    OFF = False
+
+    def __init__(self, backend):
+        """
+        PiXtend returning the recorded input values at the current trace time, output writes are kept as attributes.
+        """
+        for address in OUTPUTS:
+            setattr(self, address, self.OFF)
+        self.backend = backend
+        self.closed = False
+
+    def __getattr__(self, name):
+        timeline = self.__dict__["backend"].px_timelines.get(name)
+        if timeline is None:
+            raise AttributeError(name)
+        times, values = timeline
+        i = bisect.bisect_right(times, self.backend.trace_time()) - 1
+        return values[max(i, 0)]
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayI2C:
+    def __init__(self, backend, address=None):
+        self.backend = backend
+        self.address = address or 0
+
+    def query(self, command):
+        return self.backend.next_response(self.address, command)
+
+    def list_i2c_devices(self):
+        return list(self.backend.scan)
+
+    def close(self):
+        pass
+
+
+class TraceReplayBackend(Backend):
+    name = "replay"
+
+    def __init__(self, file_path, speed=1.0):
+        """
+        Feeds a recorded trace back through the IO drivers. I2C responses are returned per device in the
+        recorded order after the recorded latency divided by 'speed' (0: as fast as possible); PiXtend inputs
+        follow the recorded values in trace time (elapsed time times 'speed', or the time of the last replayed
+        I2C response when replaying as fast as possible).
+        """
+        self.header, records = read_trace(file_path)
+        self.speed = float(speed)
+        px_channels = self.header["px_channels"]
+
+        px = {}
+        self.responses = {}
+        self.scan = []
+        for kind, channel, t, latency, payload in records:
+            if kind == PX_READ:
+                times, values = px.setdefault(px_channels[channel], ([], []))
+                times.append(t)
+                values.append(bool(payload) if px_channels[channel].startswith(("digital", "crc")) else payload)
+            elif kind in (I2C_QUERY, I2C_ERROR):
+                self.responses.setdefault(channel, []).append((kind, t, latency, payload))
+            elif kind == I2C_SCAN and not self.scan:
+                self.scan = payload
+        self.px_timelines = px
+        self.duration = records[-1][2] if records else 0.0
+
+        self.cursors = {address: 0 for address in self.responses}
+        self.mismatches = 0  # replayed commands differing from the recorded ones
+        self.exhausted = False
+        self.last_time = 0.0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.pxt = ReplayPiXtend(self)
+
+
+    def trace_time(self):
+        if self.speed > 0:
+            return (time.perf_counter() - self.start)*self.speed
+        return self.last_time
+
+
+    def next_response(self, address, command):
+        with self.lock:
+            queue = self.responses.get(address, [])
+            i = self.cursors.get(address, 0)
+            if i >= len(queue):
+                self.exhausted = True
+                return f"Error  {address}: 255"
+            self.cursors[address] = i + 1
+            kind, t, latency, (recorded_command, response) = queue[i]
+            if recorded_command != command:
+                self.mismatches += 1
+            self.last_time = max(self.last_time, t + latency)
+
+        if self.speed > 0:
+            time.sleep(latency/self.speed)
+        if kind == I2C_ERROR:
+            raise IOError(response)
+        return response
+
+
+    def create_pxt(self):
+        return self.pxt
+
+    def i2c_device(self, address=None):
+        return ReplayI2C(self, address)
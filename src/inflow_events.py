@@ -0,0 +1,199 @@
+import collections
+import os
+import threading
+
+import numpy as np
+
+
+# collector level (signal of the detector)
+SIGNAL = "B0111"
+
+# actions on the collector during an event (bit mask): actuator -> bit
+ACTIONS = {"M0111": 1, "M0112": 2}  # drain pump, flush pump
+ACTION_NAMES = {1: "drain", 2: "flush"}
+
+# catalog record (fixed size, little endian; records ordered by start)
+EVENT_DTYPE = np.dtype([
+    ("start", "<f8"),      # first sample above the threshold [Unix time]
+    ("end", "<f8"),        # first sample below the threshold (after the last one above) [Unix time]
+    ("peak_time", "<f8"),  # first sample with the peak level [Unix time]
+    ("peak", "<f4"),       # peak level (B0111)
+    ("volume", "<f4"),     # estimated inflow volume
+    ("actions", "u1"),     # actions taken (bit mask, see 'ACTIONS')
+])
+
+InflowParameters = collections.namedtuple("InflowParameters", ["baseline", "threshold", "settle_time", "volume_gain"])
+
+
+def inflow_parameters(pl):
+    """
+    Detector parameters from the parameter list (see 'parameters.toml', collector tube).
+    """
+    return InflowParameters(
+        baseline=float(pl.get("inflow_baseline", 0.0)),
+        threshold=float(pl.get("threshold_min_B0111")),
+        settle_time=float(pl.get("inflow_settle_time", 60.0)),
+        volume_gain=float(pl.get("inflow_volume_gain", 1.0)),
+    )
+
+
+class InflowDetector:
+    def __init__(self):
+        """
+        Streaming detector of inflow events on the collector level (one sample at a time, see 'update'). An event
+        starts with the first level above 'baseline' + 'threshold' and ends when the level has stayed below for
+        'settle_time' (shorter dips belong to the same event). The volume is estimated from the peak level
+        ('volume_gain' * (peak - baseline)). 'detect_events' gives the same events for recorded data.
+        """
+        self.parameters = None
+        self.parameter_list = None
+        self.lock = threading.Lock()
+        self.active = False
+        self.start = self.peak_time = self.below_since = None
+        self.peak = None
+        self.actions = 0
+
+
+    def configure(self, pl):
+        """
+        Read the parameters (only if the parameter list has been reloaded).
+        """
+        if pl is not self.parameter_list:
+            self.parameters = inflow_parameters(pl)
+            self.parameter_list = pl
+
+
+    def update(self, t, value):
+        """
+        Next sample of the collector level. Returns the finished event (record of 'EVENT_DTYPE') or None.
+        """
+        if value is None or value != value:
+            return None  # no valid reading
+        p = self.parameters
+        above = value - p.baseline > p.threshold
+        with self.lock:
+            if not self.active:
+                if above:
+                    self.active = True
+                    self.start = self.peak_time = t
+                    self.peak = value
+                    self.below_since = None
+                    self.actions = 0
+                return None
+
+            if value > self.peak:
+                self.peak, self.peak_time = value, t
+            if above:
+                self.below_since = None
+                return None
+            if self.below_since is None:
+                self.below_since = t
+            if t - self.below_since < p.settle_time:
+                return None
+
+            self.active = False
+            return np.array((self.start, self.below_since, self.peak_time, self.peak,
+                             p.volume_gain*(self.peak - p.baseline), self.actions), dtype=EVENT_DTYPE)
+
+
+    def action(self, name, t):
+        """
+        Actuator 'name' is on (logged state); recorded for the running event.
+        """
+        with self.lock:
+            if self.active and name in ACTIONS:
+                self.actions |= ACTIONS[name]
+
+
+def detect_events(t, v, parameters, action_times=None):
+    """
+    Inflow events in a recorded collector level (times 't' ordered, values 'v'), same result as feeding the
+    samples one by one to 'InflowDetector'. Vectorized over the samples; 'action_times' maps actuator names to
+    the times at which they were logged on.
+    """
+    p = parameters
+    t, v = np.asarray(t, dtype=np.float64), np.asarray(v, dtype=np.float64)
+    valid = ~np.isnan(v)
+    t, v = t[valid], v[valid]
+    above = v - p.baseline > p.threshold
+
+    # runs of samples above the threshold: first sample and first sample after the run
+    edges = np.diff(above.astype(np.int8), prepend=0, append=0)
+    rise = np.flatnonzero(edges == 1)
+    fall = np.flatnonzero(edges == -1)
+    if rise.size == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+
+    # a run ends its event if the level stays below for the settle time before the next run (or the end of the data)
+    next_rise = np.append(rise[1:], t.size)
+    closes = fall < t.size
+    closes[closes] = t[next_rise[closes] - 1] - t[fall[closes]] >= p.settle_time
+    last_runs = np.flatnonzero(closes)
+    first_runs = np.concatenate(([0], last_runs[:-1] + 1))  # events still open at the end are left out
+
+    events = np.zeros(last_runs.size, dtype=EVENT_DTYPE)
+    events["start"] = t[rise[first_runs]]
+    events["end"] = t[fall[last_runs]]
+    # sample at which the end is confirmed (streaming detector): first one after the settle time
+    confirmed = np.searchsorted(t, events["end"] + p.settle_time)
+    for i, (first, last) in enumerate(zip(rise[first_runs], confirmed)):
+        peak = first + int(np.argmax(v[first:last + 1]))
+        events["peak_time"][i], events["peak"][i] = t[peak], v[peak]
+    events["volume"] = p.volume_gain*(events["peak"].astype(np.float64) - p.baseline)
+
+    for name, times in (action_times or {}).items():
+        times = np.sort(np.asarray(times, dtype=np.float64))
+        # at least one 'on' sample from the start until the confirmation of the end
+        n_before_start = np.searchsorted(times, events["start"])
+        n_until_end = np.searchsorted(times, t[confirmed])
+        events["actions"][n_until_end > n_before_start] |= ACTIONS[name]
+    return events
+
+
+class EventCatalog:
+    def __init__(self, file_path):
+        """
+        Inflow events in a binary file of fixed size records ('EVENT_DTYPE', ordered by start): appended at
+        runtime, queried by time range with a binary search on the start times of the memory mapped file.
+        """
+        self.file_path = file_path
+        self.lock = threading.Lock()
+
+
+    def append(self, event):
+        with self.lock, open(self.file_path, "ab") as f:
+            f.write(np.asarray(event, dtype=EVENT_DTYPE).tobytes())
+
+
+    def write(self, events):
+        """
+        Replace the catalog (e.g. events of the batch detection).
+        """
+        events = np.sort(np.asarray(events, dtype=EVENT_DTYPE), order="start")
+        with self.lock:
+            temp_path = self.file_path + ".tmp"
+            events.tofile(temp_path)
+            os.replace(temp_path, self.file_path)
+
+
+    def load(self):
+        """
+        All events (memory mapped, read only).
+        """
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) < EVENT_DTYPE.itemsize:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        n = os.path.getsize(self.file_path)//EVENT_DTYPE.itemsize  # a record being appended is left out
+        return np.memmap(self.file_path, dtype=EVENT_DTYPE, mode="r", shape=(n,))
+
+
+    def query(self, t_from, t_to):
+        """
+        Events starting between 't_from' and 't_to' [Unix time].
+        """
+        events = self.load()
+        i, j = np.searchsorted(events["start"], [t_from, t_to])
+        return events[i:j]
+
+
+def action_names(actions):
+    return [name for bit, name in ACTION_NAMES.items() if actions & bit]
@@ -0,0 +1,214 @@
+import threading
+import time
+
+from src import hal, metrics
+
+
+# PiXtend V2-L inputs and outputs (order defines the layout of the process image, see 'src/process_image.py')
+ANALOG_INPUTS  = [f"analog_in{i}" for i in range(6)]
+DIGITAL_INPUTS = [f"digital_in{i}" for i in range(16)]
+INPUTS         = ANALOG_INPUTS + DIGITAL_INPUTS
+OUTPUTS        = [f"digital_out{i}" for i in range(12)] + [f"relay{i}" for i in range(4)]
+
+INPUT_INDEX  = {address: i for i, address in enumerate(INPUTS)}
+OUTPUT_INDEX = {address: i for i, address in enumerate(OUTPUTS)}
+
+
+# IO drivers by device type (as given by 'type' in 'io_list.toml')
+DRIVERS = {}
+
+def register_driver(*device_types):
+    """
+    Class decorator registering an IO driver for one or several device types.
+    """
+    def decorator(cls):
+        for device_type in device_types:
+            DRIVERS[device_type] = cls()
+        return cls
+    return decorator
+
+
+def get_driver(device_type):
+    if device_type not in DRIVERS:
+        raise ValueError(f"Unknown device type '{device_type}'. Known types: {sorted(DRIVERS)}")
+    return DRIVERS[device_type]
+
+
+class IODriver:
+    """
+    Base class for IO drivers. A driver validates the address of an IO at load time and
+    compiles it into a reader (sensors) or writer (actuators) which is called on every access.
+    """
+    addresses = ()
+    bus = None                       # devices on the same bus share one communication channel
+    concurrent_configuration = False # whether devices on the same bus can be configured concurrently
+
+    def check_address(self, io):
+        if io.address not in self.addresses:
+            raise ValueError(f"Address '{io.address}' of '{io.name}' is not valid for device type '{io.type}'.")
+
+    def configure(self, io):
+        io.connected = True
+        io.configured = True
+
+    def compile_reader(self, sensor):
+        raise ValueError(f"Device type '{sensor.type}' can not be used as sensor.")
+
+    def compile_writer(self, actuator):
+        raise ValueError(f"Device type '{actuator.type}' can not be used as actuator.")
+
+
+class PiXtendDriver(IODriver):
+    bus = "SPI"
+
+    def configure(self, io):
+        io.connected = True # PiXtend IOs get a pass for the connection check
+        print(f"Configuring analog / digital IO '{io.name}' on PiXtend.")
+
+        # Check if SPI communication is running and the received data is correct
+        if io.pxt.crc_header_in_error is False and io.pxt.crc_data_in_error is False:
+            io.configured = True
+        else:
+            print(f"SPI communication does not appear to be running. IO '{io.name}' on PiXtend not conifigured.")
+
+    def compile_raw_reader(self, sensor):
+        """
+        Return a function reading the raw input, either from the process image or directly from the PiXtend.
+        """
+        if sensor.process_image is not None:
+            inputs = sensor.process_image.inputs
+            index = INPUT_INDEX[sensor.address]
+            return lambda: inputs[index]
+
+        pxt = sensor.pxt
+        address = sensor.address
+        return lambda: getattr(pxt, address)
+
+
+@register_driver("PX-AI")
+class PiXtendAnalogInput(PiXtendDriver):
+    addresses = tuple(ANALOG_INPUTS)
+
+    def compile_reader(self, sensor):
+        # filtered value from background sampler (falls back to direct read if no samples available yet)
+        sampler = sensor.sampler
+        read_raw = self.compile_raw_reader(sensor)
+
+        def read():
+            if sampler is not None:
+                value = sampler.get_value(sensor.name)
+                if value is not None:
+                    sensor.value = value
+                    return
+            raw = read_raw()
+            sensor.value = sensor.quad_gain*raw**2 + sensor.gain*raw + sensor.offset
+
+        return read
+
+
+@register_driver("PX-DI")
+class PiXtendDigitalInput(PiXtendDriver):
+    addresses = tuple(DIGITAL_INPUTS)
+
+    def compile_reader(self, sensor):
+        read_raw = self.compile_raw_reader(sensor)
+
+        def read():
+            sensor.value = bool(read_raw())
+
+        return read
+
+
+@register_driver("PX-DO", "PX-Rel")
+class PiXtendOutput(PiXtendDriver):
+    addresses = tuple(OUTPUTS)
+
+    def compile_writer(self, actuator):
+        address = actuator.address
+
+        # stage output change in process image (written with the next SPI cycle)
+        if actuator.process_image is not None:
+            stage_output = actuator.process_image.stage_output
+            return lambda state: stage_output(address, state)
+
+        pxt = actuator.pxt
+        levels = (pxt.OFF, pxt.ON)
+        return lambda state: setattr(pxt, address, levels[bool(state)])
+
+
+# configuration commands sent to EZO devices at startup
+EZO_CONFIG_COMMANDS = {
+    "EZO-RTD": ["S,c"],                                   # set temperature scale to Celcius
+    "EZO-pH":  ["T,20"],                                  # temperature compensation for 20°C
+    "EZO-EC":  ["K,1.0", "O,EC,1", "O,TDS,0", "O,S,0", "O,SG,0"], # probe type, EC as only output parameter
+    "EZO-HUM": ["O,HUM,1", "O,T,1", "O,Dew,0"],           # rel. humidity and temperature as output parameters
+}
+
+@register_driver(*EZO_CONFIG_COMMANDS)
+class EzoSensor(IODriver):
+    bus = "I2C"
+    concurrent_configuration = True # EZO devices process commands independently (most time is spent waiting)
+
+    # devices found on the I2C bus (scanned once per hardware backend for all EZO sensors)
+    device_list = None
+    scanned_backend = None
+    scan_lock = threading.Lock()
+
+    @classmethod
+    def connected_devices(cls):
+        with cls.scan_lock:
+            if cls.device_list is None or cls.scanned_backend is not hal.backend:
+                cls.device_list = hal.i2c_device().list_i2c_devices()
+                cls.scanned_backend = hal.backend
+        return cls.device_list
+
+    def check_address(self, io):
+        if not str(io.address).isdigit() or not 1 <= int(io.address) <= 127:
+            raise ValueError(f"Address '{io.address}' of '{io.name}' is not a valid I2C address (1-127).")
+
+    def configure(self, io):
+        # First check whether the sensor is connected
+        if int(io.address) in self.connected_devices():
+            io.connected = True
+        else:
+            print(f"The address '{io.address}' is not listed in the I2C device list.")
+            print(f"Sensor '{io.name}' could not be configured, because it appears not to be connected")
+            return
+
+        print(f"Configuring {io.type} '{io.name}'.")
+        device = hal.i2c_device(int(io.address))
+        query_time = self.query_time(io.address)
+        for command in EZO_CONFIG_COMMANDS[io.type]:
+            t_start = time.perf_counter()
+            device.query(command)
+            query_time.observe(time.perf_counter() - t_start)
+        io.configured = True
+
+    @staticmethod
+    def query_time(address):
+        return metrics.histogram("nh_i2c_query_seconds", "Duration of EZO queries (command, processing time, response)", address=address)
+
+    def compile_reader(self, sensor):
+        address = int(sensor.address)
+        two_values = sensor.type == "EZO-HUM"
+        query_time = self.query_time(address)
+        errors = metrics.counter("nh_i2c_errors_total", "EZO readings with error response", address=address)
+
+        def read():
+            device = hal.i2c_device(address)
+            t_start = time.perf_counter()
+            response = device.query('R')
+            query_time.observe(time.perf_counter() - t_start)
+            read_quality = response.split('  ')[0]
+
+            if read_quality == "Success":
+                values = response.split(':')[1].split('\x00')[0].split(',')
+                sensor.value = float(values[0])
+                if two_values:
+                    sensor.value_aux_1 = float(values[1])
+            else:
+                errors.inc()
+                resp_code = response.split(':')[1].split('\x00')[0]
+                print(f'{read_quality} during read of sensor {sensor.name} (type {sensor.type}). Response code {resp_code}. Sensor value not updated.')
+
+        return read
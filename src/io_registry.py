@@ -0,0 +1,53 @@
+class IORegistry:
+    def __init__(self, sensors, actuators):
+        """
+        Registry of all sensors and actuators. Names are resolved once to stable integer IDs
+        (position in the io list) so routines can hold direct handles instead of searching name lists.
+        """
+        self.sensors = list(sensors)
+        self.actuators = list(actuators)
+
+        for i, sensor in enumerate(self.sensors):
+            sensor.id = i
+        for i, actuator in enumerate(self.actuators):
+            actuator.id = i
+
+        self.sensor_ids = {sensor.name: sensor.id for sensor in self.sensors}
+        self.actuator_ids = {actuator.name: actuator.id for actuator in self.actuators}
+
+        if len(self.sensor_ids) != len(self.sensors) or len(self.actuator_ids) != len(self.actuators):
+            raise ValueError("Sensor and actuator names in the io list have to be unique.")
+
+
+    @property
+    def sensor_names(self):
+        return [sensor.name for sensor in self.sensors]
+
+    @property
+    def actuator_names(self):
+        return [actuator.name for actuator in self.actuators]
+
+
+    def sensor(self, name):
+        return self.sensors[self.sensor_ids[name]]
+
+    def actuator(self, name):
+        return self.actuators[self.actuator_ids[name]]
+
+
+    def missing(self, sensor_names=(), actuator_names=()):
+        """
+        Return the names which are not part of the io list.
+        """
+        missing = [name for name in sensor_names if name not in self.sensor_ids]
+        missing += [name for name in actuator_names if name not in self.actuator_ids]
+        return missing
+
+
+    def require(self, sensor_names=(), actuator_names=(), user=""):
+        """
+        Raise an error if any of the given sensors or actuators is not part of the io list.
+        """
+        missing = self.missing(sensor_names, actuator_names)
+        if missing:
+            raise ValueError(f"IOs required by '{user}' are missing in the io list: {missing}")
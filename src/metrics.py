@@ -0,0 +1,136 @@
+import bisect
+import math
+import threading
+
+
+# default buckets of latency histograms [s] (from fast PiXtend reads to EZO timeouts)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class Counter:
+    __slots__ = ("value", "lock")
+    type = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()  # one lock per metric (held only for the update, little contention)
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Gauge:
+    __slots__ = ("value",)
+    type = "gauge"
+
+    def __init__(self):
+        self.value = math.nan
+
+    def set(self, value):
+        self.value = value  # single assignment, no lock needed
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+    type = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)  # last bucket: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            le = "+Inf" if bound == math.inf else repr(bound)
+            samples.append((name + "_bucket", labels + (("le", le),), cumulative))
+        samples.append((name + "_sum", labels, total))
+        samples.append((name + "_count", labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        """
+        Metric families by name; each family holds one metric per set of label values. Metrics are created
+        once (e.g. when a sensor is created or a routine starts) and then updated directly on the hot path.
+        """
+        self.families = {}  # name -> (metric class, help text, {labels: metric})
+        self.lock = threading.Lock()
+
+
+    def get(self, cls, name, help, labels, **kwargs):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (cls, help, {}))
+            if family[0] is not cls:
+                raise ValueError(f"Metric '{name}' is already registered as {family[0].type}.")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(**kwargs)
+        return metric
+
+    def counter(self, name, help, **labels):
+        return self.get(Counter, name, help, labels)
+
+    def gauge(self, name, help, **labels):
+        return self.get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self.get(Histogram, name, help, labels, buckets=buckets)
+
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            families = [(name, cls, help, list(metrics.items())) for name, (cls, help, metrics) in self.families.items()]
+
+        lines = []
+        for name, cls, help, metrics in sorted(families, key=lambda family: family[0]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {cls.type}")
+            for labels, metric in metrics:
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in sample_labels)
+                    lines.append(f"{sample_name}{{{label_text}}} {format_value(value)}" if label_text else f"{sample_name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# registry of the process (rendered by the '/metrics' endpoint of the GUI)
+registry = Registry()
+
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
@@ -0,0 +1,99 @@
+import tomllib
+import numpy as np
+
+
+# comparator -> (direction, fixed threshold); digital signals are compared with 0.5
+COMPARATORS = {
+    ">":        (1.0, None),
+    "<":        (-1.0, None),
+    "is_true":  (1.0, 0.5),
+    "is_false": (-1.0, 0.5),
+}
+
+
+class ObserverRules:
+    def __init__(self, file_path):
+        """
+        Observer alarm rules from the configuration file, compiled into arrays (one entry per rule).
+        All rules are evaluated in one vectorized pass over the latest signal values.
+        """
+        with open(file_path, "rb") as f:
+            self.rules = tomllib.load(f).get("rule", [])
+
+        for rule in self.rules:
+            if rule["comparator"] not in COMPARATORS:
+                raise ValueError(f"Unknown comparator '{rule['comparator']}' in observer rule '{rule['name']}'.")
+
+        # signals used by the rules (each signal once, values are passed in this order to 'evaluate')
+        self.signals = list(dict.fromkeys(rule["signal"] for rule in self.rules))
+        signal_index = {name: i for i, name in enumerate(self.signals)}
+
+        n = len(self.rules)
+        self.signal_index = np.array([signal_index[rule["signal"]] for rule in self.rules], dtype=int)
+        self.direction    = np.array([COMPARATORS[rule["comparator"]][0] for rule in self.rules], dtype=float)
+        self.hysteresis   = np.array([float(rule.get("hysteresis", 0.0)) for rule in self.rules], dtype=float)
+        self.debounce     = np.array([float(rule.get("debounce", 0.0)) for rule in self.rules], dtype=float)
+        self.digital      = [COMPARATORS[rule["comparator"]][1] is not None for rule in self.rules]
+        self.mean_window  = np.array([float(rule.get("mean_window", 0.0)) for rule in self.rules], dtype=float)
+
+        # rules on the rolling mean of their signal (see 'track'), values of the last evaluation per rule
+        self.windowed = np.flatnonzero(self.mean_window > 0)
+        self.windows = None
+        self.values = np.full(n, np.nan)
+
+        # thresholds (parameter names are resolved in 'update_thresholds')
+        self.thresholds = np.zeros(n, dtype=float)
+        self.parameter_list = None
+
+        # edge and debounce state
+        self.active = np.zeros(n, dtype=bool)
+        self.pending_since = np.full(n, np.nan)
+
+
+    def update_thresholds(self, pl):
+        """
+        Resolve thresholds from the parameter list (only if the parameter list has been reloaded).
+        """
+        if pl is self.parameter_list:
+            return
+
+        for i, rule in enumerate(self.rules):
+            fixed_threshold = COMPARATORS[rule["comparator"]][1]
+            threshold = rule.get("threshold", fixed_threshold)
+            if isinstance(threshold, str):
+                threshold = pl.get(threshold)
+            self.thresholds[i] = float(threshold)
+
+        self.parameter_list = pl
+
+
+    def track(self, history):
+        """
+        Rolling means of the rules with a 'mean_window' from the signal history (see 'src/signal_history.py'),
+        updated with each sample. Without, these rules use the latest value.
+        """
+        if self.windows is None:
+            self.windows = [history.track(self.rules[i]["signal"], self.mean_window[i]) for i in self.windowed]
+
+
+    def evaluate(self, values, now):
+        """
+        Evaluate all rules for the latest signal values (ordered as 'signals').
+        Returns the indices of the rules with a rising edge (alarm raised).
+        """
+        self.values = np.asarray(values, dtype=float)[self.signal_index]
+        if self.windows:
+            self.values[self.windowed] = [window.mean for window in self.windows]
+        x = self.direction*(self.values - self.thresholds)
+        condition = x > 0
+        cleared = x <= -self.hysteresis
+
+        # debounce timer runs while the condition holds
+        self.pending_since[condition & np.isnan(self.pending_since)] = now
+        self.pending_since[~condition] = np.nan
+
+        raised = condition & ~self.active & (now - self.pending_since >= self.debounce)
+        self.active |= raised
+        self.active &= ~cleared
+
+        return np.flatnonzero(raised)
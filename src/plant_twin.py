@@ -0,0 +1,155 @@
+import math
+import random
+
+
+# plant parameters (defaults, can be overwritten in the [plant] table of 'simulation.toml')
+PLANT_DEFAULTS = {
+    "step_time":              1.0,               # integration step [s]
+    "inflow_per_day":         10.0,              # average inflow [kg/d] (as in 'scripts/runtime_estimation.py')
+    "inflow_event_volume":    0.25,              # mean volume per inflow event [kg] (exponentially distributed)
+    "m_dot_M0111":            1000./(1000*60.),  # collector drain pump [kg/s]
+    "m_dot_M0112":            300./(1000*60.),   # collector flush pump (rinse water into collector tube) [kg/s]
+    "m_dot_M0102":            549./(1000*60.),   # evaporator feed pump [kg/s]
+    "m_dot_M0203":            1430./(1000*60.),  # concentrate discharge pump [kg/s]
+    "m_dot_evap":             1000./(1000*3600.),# evaporation rate with disc motor running [kg/s]
+    "stabilizer_kg_per_unit": 0.5,               # stabilizer mass per unit of level sensor B0101 [kg]
+    "evaporator_kg_per_unit": 0.5,               # evaporator mass per unit of level sensor B0201 [kg]
+    "stabilizer_capacity":    20.0,              # stabilizer mass at overflow position [kg]
+    "evaporator_capacity":    6.0,               # evaporator mass at overflow (back into stabilizer) [kg]
+    "concentrate_capacity":   20.0,              # concentrate tank [kg] (B0401 reports 'full' above)
+    "collector":              0.0,               # initial masses [kg]
+    "stabilizer":             12.5,
+    "evaporator":             2.5,
+    "concentrate":            0.0,
+}
+
+
+def inverse_calibration(sensor, value):
+    """
+    Raw input value for which the sensor calibration gives 'value' (root closest to the 0-10 V range).
+    """
+    a, b, c = sensor.quad_gain, sensor.gain, sensor.offset - value
+    if a == 0:
+        return -c/b
+    discriminant = max(b*b - 4*a*c, 0.0)
+    roots = [(-b + math.sqrt(discriminant))/(2*a), (-b - math.sqrt(discriminant))/(2*a)]
+    return min(roots, key=lambda raw: abs(raw - 5.0))
+
+
+class PlantTwin:
+    def __init__(self, pxt, io, clock, config=None, seed=None):
+        """
+        Mass-balance model of the plant (collector tube, stabilizer, evaporator, concentrate tank).
+        Reacts to the actuator outputs on the (simulated) PiXtend and writes the raw level sensor values.
+        """
+        self.pxt = pxt
+        self.clock = clock
+        self.parameters = dict(PLANT_DEFAULTS, **(config or {}))
+        self.rng = random.Random(seed)
+
+        p = self.parameters
+        self.collector   = p["collector"]
+        self.stabilizer  = p["stabilizer"]
+        self.evaporator  = p["evaporator"]
+        self.concentrate = p["concentrate"]
+
+        # cumulated flows [kg] (mass balance: initial + inflow + rinse = current + evaporated + effluent)
+        self.totals = dict.fromkeys(["inflow", "rinse", "evaporated", "discharged", "effluent", "evaporator_overflow"], 0.0)
+        self.inflow_events = 0
+        self.initial_mass = self.total_mass()
+
+        # actuator outputs and sensors driven by the model (IOs missing in the io list are ignored)
+        self.outputs = {name: io.actuator(name).address for name in ("M0111", "M0112", "M0102", "M0201", "M0203") if name in io.actuator_ids}
+        self.sensors = {name: io.sensor(name) for name in ("B0101", "B0111", "B0201", "B0401") if name in io.sensor_ids}
+        self.write_sensors()
+
+
+    def total_mass(self):
+        return self.collector + self.stabilizer + self.evaporator + self.concentrate
+
+
+    def mass_balance_error(self):
+        t = self.totals
+        return self.initial_mass + t["inflow"] + t["rinse"] - t["evaporated"] - t["effluent"] - self.total_mass()
+
+
+    def output_on(self, name):
+        return name in self.outputs and getattr(self.pxt, self.outputs[name]) == self.pxt.ON
+
+
+    def step(self, dt):
+        p = self.parameters
+        t = self.totals
+
+        # inflow events (Poisson process)
+        event_rate = p["inflow_per_day"]/p["inflow_event_volume"]/86400.
+        if self.rng.random() < event_rate*dt:
+            volume = self.rng.expovariate(1.0/p["inflow_event_volume"])
+            self.collector += volume
+            t["inflow"] += volume
+            self.inflow_events += 1
+
+        # pumps (limited by the available mass)
+        if self.output_on("M0112"):
+            rinse = p["m_dot_M0112"]*dt
+            self.collector += rinse
+            t["rinse"] += rinse
+        if self.output_on("M0111"):
+            drained = min(self.collector, p["m_dot_M0111"]*dt)
+            self.collector -= drained
+            self.stabilizer += drained
+        if self.output_on("M0102"):
+            fed = min(self.stabilizer, p["m_dot_M0102"]*dt)
+            self.stabilizer -= fed
+            self.evaporator += fed
+        if self.output_on("M0203"):
+            discharged = min(self.evaporator, p["m_dot_M0203"]*dt)
+            self.evaporator -= discharged
+            self.concentrate += discharged
+            t["discharged"] += discharged
+        if self.output_on("M0201"):
+            evaporated = min(self.evaporator, p["m_dot_evap"]*dt)
+            self.evaporator -= evaporated
+            t["evaporated"] += evaporated
+
+        # overflows: evaporator back into stabilizer, stabilizer to effluent
+        if self.evaporator > p["evaporator_capacity"]:
+            overflow = self.evaporator - p["evaporator_capacity"]
+            self.evaporator -= overflow
+            self.stabilizer += overflow
+            t["evaporator_overflow"] += overflow
+        if self.stabilizer > p["stabilizer_capacity"]:
+            effluent = self.stabilizer - p["stabilizer_capacity"]
+            self.stabilizer -= effluent
+            t["effluent"] += effluent
+
+        self.write_sensors()
+
+
+    def write_sensors(self):
+        p = self.parameters
+        levels = {
+            "B0101": self.stabilizer/p["stabilizer_kg_per_unit"],
+            "B0111": self.collector,
+            "B0201": self.evaporator/p["evaporator_kg_per_unit"],
+        }
+        for name, level in levels.items():
+            if name in self.sensors:
+                sensor = self.sensors[name]
+                setattr(self.pxt, sensor.address, inverse_calibration(sensor, level))
+
+        # concentrate tank level switch (True: not full)
+        if "B0401" in self.sensors:
+            setattr(self.pxt, self.sensors["B0401"].address, self.concentrate < p["concentrate_capacity"])
+
+
+    def run(self, end_time, on_step=None):
+        """
+        Integrate the model until 'end_time' (clock time). 'on_step' is called after every step.
+        """
+        step_time = self.parameters["step_time"]
+        while self.clock.time() < end_time:
+            self.clock.sleep(step_time)
+            self.step(step_time)
+            if on_step is not None:
+                on_step(self)
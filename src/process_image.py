@@ -0,0 +1,152 @@
+import threading
+import time
+import numpy as np
+
+from src.io_drivers import INPUTS, OUTPUTS, INPUT_INDEX, OUTPUT_INDEX
+
+
+class ProcessImage:
+    def __init__(self, pxt, cycle_time=0.03):
+        """
+        Process image of the PiXtend: all inputs are copied once per SPI cycle into one array,
+        output changes are staged and written together at the beginning of the next cycle.
+        """
+        self.pxt = pxt
+        self.cycle_time = float(cycle_time)
+
+        # input snapshot, cycle counter and time of the last snapshot
+        self.inputs = np.zeros(len(INPUTS), dtype=float)
+        self.cycle = 0
+        self.timestamp = 0.0
+
+        # output image (last committed state) and staged changes (address -> state)
+        self.outputs = np.zeros(len(OUTPUTS), dtype=bool)
+        self.staged = {}
+
+        # cycle time statistics [s]
+        self.last_cycle_duration = 0.0  # time needed for commit + snapshot
+        self.max_cycle_duration = 0.0
+        self.last_cycle_period = 0.0    # time between two snapshots
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+
+    def update(self):
+        """
+        Commit staged outputs and take a new snapshot of all inputs (one SPI cycle).
+        """
+        t_start = time.time()
+        self.commit()
+
+        values = [getattr(self.pxt, address) for address in INPUTS]
+
+        with self.lock:
+            self.inputs[:] = values
+            self.cycle += 1
+            if self.timestamp:
+                self.last_cycle_period = t_start - self.timestamp
+            self.timestamp = t_start
+
+        self.last_cycle_duration = time.time() - t_start
+        self.max_cycle_duration = max(self.max_cycle_duration, self.last_cycle_duration)
+
+
+    def commit(self):
+        """
+        Write all staged output changes to the PiXtend at once.
+        """
+        with self.lock:
+            staged = self.staged
+            self.staged = {}
+
+            for address, state in staged.items():
+                setattr(self.pxt, address, self.pxt.ON if state else self.pxt.OFF)
+                self.outputs[OUTPUT_INDEX[address]] = state
+
+
+    def stage_output(self, address, state):
+        with self.lock:
+            self.staged[address] = bool(state)
+
+
+    def get_input(self, index):
+        return self.inputs[index]
+
+
+    def get_inputs(self, indices):
+        """
+        Return a consistent copy of several inputs (all from the same cycle).
+        """
+        with self.lock:
+            return self.inputs[indices]
+
+
+    def snapshot(self):
+        """
+        Return a consistent copy of all inputs together with cycle counter and timestamp.
+        """
+        with self.lock:
+            return self.inputs.copy(), self.cycle, self.timestamp
+
+
+    def run(self):
+        next_time = time.time()
+
+        while not self.stop_event.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                print(f"Process image could not be updated: {e}")
+
+            next_time += self.cycle_time
+            delay = next_time - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_time = time.time()
+
+
+    def start(self):
+        # first snapshot before sensors are read
+        self.update()
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+            # write outputs which have been staged after the last cycle
+            self.commit()
+
+
+    def detach(self, sensors, actuators):
+        """
+        Let sensors and actuators access the PiXtend directly again.
+        """
+        for io in list(sensors) + list(actuators):
+            if io.process_image is self:
+                io.process_image = None
+                io.compile()
+
+
+    def attach(self, sensors, actuators):
+        """
+        Let PiXtend sensors read from and PiXtend actuators write to the process image.
+        """
+        for sensor in sensors:
+            if "PX" in sensor.type and sensor.address in INPUT_INDEX:
+                sensor.process_image = self
+                sensor.compile()
+
+        for actuator in actuators:
+            if "PX" in actuator.type and actuator.address in OUTPUT_INDEX:
+                actuator.process_image = self
+                actuator.compile()
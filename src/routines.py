@@ -1,24 +1,131 @@
+import collections
 import threading
-import datetime
-import time
 import os
 import csv
+import time
 import tomllib
-import numpy as np
 
+from src import metrics
 from src.utils import get_file_path
+from src.signal_store import SignalStore
+from src.signal_history import SignalHistory
+from src.clock import WallClock
+from src.observer_rules import ObserverRules
+from src import inflow_events
+from src.soft_sensor import SoftSensor, COLUMNS as SOFT_SENSOR_COLUMNS
  
 
+class StopEvents:
+    def __init__(self):
+        """
+        Shutdown flag of the routines with the interface of 'threading.Event'. Each routine thread can register
+        its own event, so that single routines can be stopped ('set' stops all of them). Routines check and
+        wait on the event of the calling thread, other threads on the common one.
+        """
+        self.all = threading.Event()
+        self.events = {}  # thread id -> event of the routine running in the thread
+        self.lock = threading.Lock()
+        self.listeners = []  # callbacks invoked after 'set' (e.g. to wake an event loop)
+
+    def register(self, event):
+        with self.lock:
+            if self.all.is_set():
+                event.set()
+            self.events[threading.get_ident()] = event
+
+    def unregister(self):
+        with self.lock:
+            self.events.pop(threading.get_ident(), None)
+
+    def current(self):
+        return self.events.get(threading.get_ident(), self.all)
+
+    def is_set(self):
+        return self.current().is_set()
+
+    def wait(self, timeout=None):
+        return self.current().wait(timeout)
+
+    def set(self):
+        with self.lock:
+            self.all.set()
+            for event in self.events.values():
+                event.set()
+        for callback in list(self.listeners):
+            callback()
+
+    def subscribe(self, callback):
+        """
+        Register a callback (without arguments) invoked from the stopping thread when all routines are stopped.
+        """
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def clear(self):
+        self.all.clear()
+
+
+# waits requested by the routine steps ('<routine>_steps' generators); the runtime carries them out and sends the
+# result back: 'routines.run_steps' in the routine's thread, 'AsyncRuntime.drive' as a coroutine
+Sleep = collections.namedtuple("Sleep", ["seconds"])
+Pause = collections.namedtuple("Pause", ["seconds"])  # like 'Sleep', but ends on shutdown
+WaitUntil = collections.namedtuple("WaitUntil", ["name", "predicate", "timeout", "after_seq"])  # result: see 'SignalStore.wait_until'
+WaitForUpdate = collections.namedtuple("WaitForUpdate", ["names", "last_seq", "timeout"])  # result: latest sequence number
+Blocking = collections.namedtuple("Blocking", ["function", "args"])  # e.g. console input, result: return value
+Start = collections.namedtuple("Start", ["function", "args"])  # concurrent hardware read, result: handle for 'Join'
+Join = collections.namedtuple("Join", ["handles"])
+
+
+class RoutineStats:
+    __slots__ = ("loops", "last_time", "last_duration")
+
+    def __init__(self):
+        self.loops = 0
+        self.last_time = None      # start of the current loop
+        self.last_duration = None  # duration of the last complete loop [s]
+
+
 class routines:
-    def __init__(self, start_time, parameter_file_name, log_file_name):
+
+    # sensors and actuators used by each routine (checked before the routine threads are started)
+    REQUIRED_IOS = {
+        "data_acquisition":              ([], []),
+        "stabilizer_stirrer":            (["BM101"], ["M0101"]),
+        "evaporator_feed":               (["B0101"], ["M0102"]),
+        "collector_flush":               (["B0111"], ["M0112"]),
+        "collector_drain":               (["B0111"], ["M0111"]),
+        "evaporation":                   (["B0201", "BM201"], ["M0201", "M0204", "M0205", "M0301"]),
+        "concentrate_discharge":         (["B0401", "B0201", "BM202"], ["M0202", "M0203"]),
+        "observer":                      ([], []),  # signals from observer rules (see 'read/observer_rules.toml')
+        "print_sensor_values_to_prompt": ([], []),
+        "CaOH2_refill":                  ([], ["M0101"]),
+    }
+
+    def __init__(self, start_time, parameter_file_name, log_file_name, clock=None):
 
         """
         Constructor to initialize the sensor object from sensor data.
         """
         self.start_time = start_time
 
-        # access parameter file
+        # time source for all routines (real time by default, see 'src/clock.py' for the virtual clock)
+        self.clock = clock or WallClock()
+
+        # instrumentation of file access and acquisition (see 'src/metrics.py')
+        self.parameter_load_time = metrics.histogram("nh_parameter_load_seconds", "Duration of parameter list checks (parsed again if modified)")
+        self.parameter_reloads = metrics.counter("nh_parameter_reloads_total", "Reloads of the modified parameter file")
+        self.row_write_time = metrics.histogram("nh_measurement_write_seconds", "Duration of measurement file writes")
+        self.rows_written = metrics.counter("nh_measurement_rows_total", "Rows written to the measurement files")
+        self.acquisition_cycle_time = metrics.histogram("nh_acquisition_cycle_seconds", "Duration of data acquisition cycles")
+        self.acquisition_overruns = metrics.counter("nh_acquisition_overruns_total", "Acquisition cycles longer than the sampling interval")
+
+        # access parameter file (parsed again only when modified, see 'load_parameter_list')
         self.parameter_file_path = get_file_path("read", parameter_file_name)
+        self.parameter_list = None
+        self.parameter_file_mtime = None
         pl = self.load_parameter_list()
 
         # load log-file
@@ -32,8 +139,16 @@ class routines:
         self.initial_wait_time = float(pl.get("initial_wait_time"))
 
         # create shutdown event and file lock for threading 
-        self.shutdown_event = threading.Event()  # Used to stop threads gracefully
+        self.shutdown_event = StopEvents()  # Used to stop threads gracefully (all or single routines)
         self.file_lock = threading.Lock()
+        self.first_sample_event = threading.Event()  # set after the first data acquisition cycle
+
+        # latest sensor values published by data acquisition and analog sampler
+        self.signals = SignalStore(self.clock)
+
+        # recent history of each sensor (ring buffers over 'history_window_h', kept between runs); the buffer of a
+        # signal is allocated with its first sample, unless a preallocated (shared) history is set (see 'main_NH-25.py')
+        self.history = SignalHistory.for_window(float(pl.get("history_window_h", 24))*3600, self.sampling_interval)
 
         # allocate for sensor measurement data
         self.csv_file_path = None  # initialized on first loop
@@ -45,6 +160,16 @@ class routines:
         self.last_event_inflow = 0
         self.cumulative_inflow = self.read_latest_from_log_file('cumulative_inflow')
 
+        # inflow events detected on the logged collector level (the only place where events are counted) and
+        # their catalog (same detector for the archived data: 'scripts/inflow_events.py')
+        self.inflow_detector = inflow_events.InflowDetector()
+        self.inflow_catalog = inflow_events.EventCatalog(get_file_path("data", "inflow_events.bin"))
+
+        # evaporation, inflow and feed rates from the level signals, updated with each acquisition cycle
+        # (same estimator for the archived data: 'scripts/soft_sensor.py')
+        self.soft_sensor = SoftSensor()
+        self.soft_sensor_readings = {}  # level signal -> (time as logged, value) of the current acquisition cycle
+
         # routine status flags
         self.collector_drain_running       = False
         self.evaporator_feed_running       = False
@@ -54,17 +179,116 @@ class routines:
         # timer for evaporation duty cycle
         self.evaporation_start_time = start_time
 
-        # state tracker for observer
-        self.observer_states = {}
+        # observer alarm rules and IOs required per routine (observer signals given by the rules)
+        self.observer_rules = ObserverRules(get_file_path("read", "observer_rules.toml"))
+        self.required_ios = dict(self.REQUIRED_IOS)
+        self.required_ios["observer"] = (self.observer_rules.signals, [])
+
+        # loops per routine (see 'loop_counter')
+        self.routine_stats = {}
+
+        # callbacks (without arguments) invoked after each acquisition cycle (e.g. to publish the process image)
+        self.acquisition_listeners = []
+
+
+    # prepare a new start of the routines (parameters and values from the log file are kept)
+    def reset(self, start_time):
+        self.start_time = start_time
+        self.evaporation_start_time = start_time
+        self.shutdown_event.clear()
+        self.first_sample_event.clear()
+        self.signals.reopen()
+
+        self.collector_drain_running       = False
+        self.evaporator_feed_running       = False
+        self.evaporation_running           = False
+        self.concentrate_discharge_running = False
+
+
+    # check that all sensors and actuators required by the selected routines are part of the io list
+    def check_required_ios(self, io, routine_names):
+        for routine_name in routine_names:
+            sensor_names, actuator_names = self.required_ios[routine_name]
+            io.require(sensor_names, actuator_names, routine_name)
+
+
+    # routine entry points (one thread per routine): the control logic is in the '<routine>_steps' generators,
+    # shared with the asyncio runtime (see 'src/async_runtime.py')
+    def data_acquisition(self, io):
+        self.run_steps(self.data_acquisition_steps(io))
+
+    def evaporator_feed(self, io):
+        self.run_steps(self.evaporator_feed_steps(io))
+
+    def stabilizer_stirrer(self, io):
+        self.run_steps(self.stabilizer_stirrer_steps(io))
+
+    def collector_drain(self, io):
+        self.run_steps(self.collector_drain_steps(io))
+
+    def collector_flush(self, io):
+        self.run_steps(self.collector_flush_steps(io))
+
+    def evaporation(self, io):
+        self.run_steps(self.evaporation_steps(io))
+
+    def concentrate_discharge(self, io):
+        self.run_steps(self.concentrate_discharge_steps(io))
+
+    def observer(self, io):
+        self.run_steps(self.observer_steps(io))
+
+    def CaOH2_refill(self, io):
+        self.run_steps(self.CaOH2_refill_steps(io))
+
+    def print_sensor_values_to_prompt(self, io):
+        self.run_steps(self.print_sensor_values_to_prompt_steps(io))
+
+
+    def run_steps(self, steps):
+        """
+        Run the steps of a routine in the calling thread, the requested waits on the clock of the routines.
+        """
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration:
+                return
+
+            if isinstance(request, Sleep):
+                self.clock.sleep(request.seconds)
+                result = None
+            elif isinstance(request, Pause):
+                result = self.clock.wait(self.shutdown_event.current(), request.seconds)
+            elif isinstance(request, WaitUntil):
+                result = self.signals.wait_until(request.name, request.predicate, timeout=request.timeout, after_seq=request.after_seq)
+            elif isinstance(request, WaitForUpdate):
+                result = self.signals.wait_for_update(request.names, request.last_seq, timeout=request.timeout)
+            elif isinstance(request, Blocking):
+                result = request.function(*request.args)
+            elif isinstance(request, Start):
+                result = threading.Thread(target=request.function, args=request.args)
+                result.start()
+            elif isinstance(request, Join):
+                for thread in request.handles:
+                    thread.join()
+                result = None
+            else:
+                raise TypeError(f"unknown wait request: {request!r}")
 
 
     # Data acquisition
-    def data_acquisition(self, sensors, actuators):
+    def data_acquisition_steps(self, io):
+        sensors = io.sensors
+        actuators = io.actuators
         current_date = None
 
+        count_loop = self.loop_counter("data_acquisition")
         while not self.shutdown_event.is_set():
+            count_loop()
             # Get current date and compare with the last used one
-            new_date = datetime.datetime.now().strftime("%Y-%m-%d")
+            new_date = self.clock.now().strftime("%Y-%m-%d")
             if new_date != current_date:
                 current_date = new_date
                 file_name = f"{current_date}_{self.machine_id}_measurement_data.csv"
@@ -74,52 +298,56 @@ class routines:
                 if not os.path.exists(self.csv_file_path):
                     open(self.csv_file_path, "a").close()  # create an empty file
 
-            # Start a thread per sensor / actuator reading
-            time_before_logging = time.time()
-            threads = []
+            # Start a read per sensor / actuator (thread or executor, see 'Start')
+            time_before_logging = self.clock.time()
+            reads = []
 
-            # sensor read threads
+            # sensor reads (started with an offset to avoid I2C collisions)
             for sensor in sensors:
-                thread = threading.Thread(target=self._read_and_log_sensor, args=(sensor,))
-                thread.start()
-                time.sleep(0.2)
-                threads.append(thread)
+                reads.append((yield Start(self._read_and_log_sensor, (sensor,))))
+                yield Sleep(0.2)
 
-            # actuator read threads
+            # actuator reads
             for actuator in actuators:
-                thread = threading.Thread(target=self._read_and_log_actuator, args=(actuator,))
-                thread.start()
-                threads.append(thread)
-
-            # event thread
-            thread = threading.Thread(target=self._read_and_log_event)
-            thread.start()
-            threads.append(thread)
-
-            # CPU temperature thread
-            thread = threading.Thread(target=self._read_and_log_CPU_temp)
-            thread.start()
-            threads.append(thread)
-
-            # Wait for all sensor read threads to complete before the next loop
-            for thread in threads:
-                thread.join()
+                reads.append((yield Start(self._read_and_log_actuator, (actuator,))))
+
+            # event and CPU temperature
+            reads.append((yield Start(self._read_and_log_event, ())))
+            reads.append((yield Start(self._read_and_log_CPU_temp, ())))
+
+            # Wait for all reads to complete before the next loop
+            yield Join(reads)
+            self.update_soft_sensor(actuators)
+            self.first_sample_event.set()
+            for callback in list(self.acquisition_listeners):
+                callback()
             
-            delta_time_logging = time.time() - time_before_logging
+            delta_time_logging = self.clock.time() - time_before_logging
+            self.acquisition_cycle_time.observe(delta_time_logging)
             
             if delta_time_logging < self.sampling_interval:
-                time.sleep(self.sampling_interval-delta_time_logging)
+                yield Sleep(self.sampling_interval-delta_time_logging)
             else:
+                self.acquisition_overruns.inc()
                 print("\nWARNING: sampling interval for data acquisition is shorter than required time for reading sensor data (communication with hardware)")
                 
         print(f"\nData logging stopped. Saved file: {self.csv_file_path}")
 
     def _read_and_log_sensor(self, sensor):
         # Prepare row data
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        global_runtime = time.time() - self.start_time
+        now = self.clock.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        global_runtime = self.clock.time() - self.start_time
         io_type = "Sensor"
         value = sensor.read_value()
+        if value is not None:
+            t = self.clock.time()
+            self.signals.publish(sensor.name, value, t)
+            self.history.append(sensor.name, t, float(value))
+        if sensor.name == inflow_events.SIGNAL:
+            self.detect_inflow(float(int(now.timestamp())), value)  # time as logged (full seconds)
+        if sensor.name in SOFT_SENSOR_COLUMNS[1:3]:
+            self.soft_sensor_readings[sensor.name] = (float(int(now.timestamp())), value)
 
         row = [
             timestamp,
@@ -135,16 +363,13 @@ class routines:
             sensor.value_aux_2
         ]
 
-        # Safely write to file
-        with self.file_lock:
-            with open(self.csv_file_path, mode="a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(row)
+        self.write_measurement_row(row)
 
     def _read_and_log_actuator(self, actuator):
         # Prepare row data
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        global_runtime = time.time() - self.start_time
+        now = self.clock.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        global_runtime = self.clock.time() - self.start_time
         io_type = "Actuator"
 
         row = [
@@ -161,16 +386,14 @@ class routines:
             0
         ]
 
-        # Safely write to file
-        with self.file_lock:
-            with open(self.csv_file_path, mode="a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(row)
+        self.write_measurement_row(row)
+        if actuator.state is True:
+            self.inflow_detector.action(actuator.name, float(int(now.timestamp())))
 
     def _read_and_log_event(self):
         # Prepare row data
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        global_runtime = time.time() - self.start_time
+        timestamp = self.clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        global_runtime = self.clock.time() - self.start_time
         io_type = "Event"
 
         row = [
@@ -187,20 +410,18 @@ class routines:
             self.cumulative_inflow,
         ]
         
-        # Safely write to file
-        with self.file_lock:
-            with open(self.csv_file_path, mode="a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(row)
+        self.write_measurement_row(row)
 
     def _read_and_log_CPU_temp(self):
         # Prepare row data
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        global_runtime = time.time() - self.start_time
+        timestamp = self.clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        global_runtime = self.clock.time() - self.start_time
         io_type = "CPU"
         name = "CPU-Temp"
 
-        temp_str = os.popen("vcgencmd measure_temp").readline()
+        temp_str = os.popen("vcgencmd measure_temp 2>/dev/null").readline()
+        if not temp_str.startswith("temp="):
+            return  # not running on a Raspberry Pi (e.g. simulated plant)
         temp_value = float(temp_str.replace("temp=", "").replace("'C\n", ""))
 
         row = [
@@ -217,16 +438,28 @@ class routines:
             0
         ]
 
+        self.write_measurement_row(row)
+
+    def write_measurement_row(self, row):
         # Safely write to file
+        t_start = time.perf_counter()
         with self.file_lock:
             with open(self.csv_file_path, mode="a", newline="") as f:
                 writer = csv.writer(f)
                 writer.writerow(row)
+        self.row_write_time.observe(time.perf_counter() - t_start)
+        self.rows_written.inc()
 
     # cyclic routine: evaporator feed
-    def evaporator_feed(self, actuators, sensors, actuator_name_list, sensor_name_list):
+    def evaporator_feed_steps(self, io):
+
+        # get instance of required S&A
+        act_M0102 = io.actuator("M0102")
+        sen_B0101 = io.sensor("B0101")
 
+        count_loop = self.loop_counter("evaporator_feed")
         while not self.shutdown_event.is_set():
+            count_loop()
 
             # read up-to-date control parameters (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
@@ -238,12 +471,7 @@ class routines:
             if tau_M0102_interval-tau_M0102_runtime <=1:
                 print(f"WARNING: time difference between interval and runtime should be longer than 1 sec.")
 
-            # get instance of required S&A
-            act_M0102 = actuators[actuator_name_list.index("M0102")]
-            sen_B0101 = sensors[sensor_name_list.index("B0101")]
-
-
-            current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+            current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
             if int(current_runtime - tau_M0102_delay) % int(tau_M0102_interval) == 0:
 
                 if sen_B0101.value > threshold_min_B0101:
@@ -251,19 +479,25 @@ class routines:
                     # print(f"[Pump Control] Activating evaporator feed pump at runtime: {current_runtime:.2f}s")
                     act_M0102.set_state(True)
 
-                    time.sleep(tau_M0102_runtime)  # Wait for the specified runtime
+                    yield Sleep(tau_M0102_runtime)  # Wait for the specified runtime
                     
                     # Turn actuator off
                     # print(f"[Pump Control] Deactivating evaporator feed pump at runtime: {current_runtime + tau_M0102_runtime:.2f}s")
                     act_M0102.set_state(False)
 
-            time.sleep(0.1)
+            yield Sleep(0.1)
 
 
     # cyclic routine: stabilizer stirrer 
-    def stabilizer_stirrer(self, actuators, sensors, actuator_name_list, sensor_name_list):
+    def stabilizer_stirrer_steps(self, io):
 
+        # get instance of required S&A
+        act_M0101 = io.actuator("M0101")
+        sen_BM101 = io.sensor("BM101")
+
+        count_loop = self.loop_counter("stabilizer_stirrer")
         while not self.shutdown_event.is_set():
+            count_loop()
             pl = self.load_parameter_list()
             tau_M0101_interval = float(pl.get("tau_M0101_interval"))
             tau_M0101_runtime  = float(pl.get("tau_M0101_runtime"))
@@ -273,11 +507,7 @@ class routines:
             if tau_M0101_interval-tau_M0101_runtime <=1:
                 print(f"WARNING: time difference between interval and runtime should be longer than 1 sec.")
 
-            # get instance of required S&A
-            act_M0101 = actuators[actuator_name_list.index("M0101")]
-            sen_BM101 = sensors[sensor_name_list.index("BM101")]
-        
-            current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+            current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
             if int(current_runtime - tau_M0101_delay) % int(tau_M0101_interval) == 0 and refill_flag == "False":
                 # Turn actuator on
                 # print(f"[Pump Control] Activating stabilizer stirrer at runtime: {current_runtime:.2f}s")
@@ -286,24 +516,32 @@ class routines:
                 if sen_BM101.value == False:
                     act_M0101.set_state(True) # disc motor
                 else:
-                    time.sleep(12) # give observer some time to detect
+                    yield Sleep(12) # give observer some time to detect
                     act_M0101.set_state(False)
                     self.relaunch_motor(act_M0101) # relaunch depends on flag in parameters file
 
 
-                time.sleep(tau_M0101_runtime)  # Wait for the specified runtime
+                yield Sleep(tau_M0101_runtime)  # Wait for the specified runtime
                 
                 # Turn actuator off
                 # print(f"[Pump Control] Deactivating stabilizer stirrer at runtime: {current_runtime + tau_M0101_runtime:.2f}s")
                 act_M0101.set_state(False)
 
-            time.sleep(0.1)
+            yield Sleep(0.1)
 
 
     # triggered routine: collector drain
-    def collector_drain(self, actuators, sensors, actuator_name_list, sensor_name_list):
+    def collector_drain_steps(self, io):
+
+        # get instance of required S&A
+        act_M0111 = io.actuator("M0111")
+
+        # only values published after the last pump cycle can trigger the pump again
+        last_seq = 0
         
+        count_loop = self.loop_counter("collector_drain")
         while not self.shutdown_event.is_set():
+            count_loop()
 
             # read up-to-date control parameters (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
@@ -311,37 +549,40 @@ class routines:
             tau_M0111_delay     = float(pl.get("tau_M0111_delay"))
             threshold_min_B0111 = float(pl.get("threshold_min_B0111"))
 
-            # get instance of required S&A
-            act_M0111 = actuators[actuator_name_list.index("M0111")]
-            sen_B0111 = sensors[sensor_name_list.index("B0111")]
-
-            if sen_B0111.read_value() > threshold_min_B0111:
+            # wait for a published collector level above threshold (timeout for parameter update and shutdown)
+            if (yield WaitUntil("B0111", lambda value: value > threshold_min_B0111, timeout=1.0, after_seq=last_seq)):
 
                 # Wait for the specified pre-delay
-                time.sleep(tau_M0111_delay)
+                yield Sleep(tau_M0111_delay)
 
-                current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+                current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
                 # Turn actuator on
                 print(f"[Pump Control] Activating collector tube drain pump at runtime: {current_runtime:.2f}s")
                 act_M0111.set_state(True)
                 self.collector_drain_running = True
 
                 # Wait for the specified runtime
-                time.sleep(tau_M0111_runtime)
+                yield Sleep(tau_M0111_runtime)
                 
                 # Turn actuator off
                 print(f"[Pump Control] Deactivating collector tube drain pump at runtime: {current_runtime + tau_M0111_runtime:.2f}s")
                 act_M0111.set_state(False)
                 self.collector_drain_running = False
+                last_seq = self.signals.seq
 
 
-            time.sleep(1)
+    # triggered routine: collector flush
+    def collector_flush_steps(self, io):
 
+        # get instance of required S&A
+        act_M0112 = io.actuator("M0112")
 
-    # triggered routine: collector flush
-    def collector_flush(self, actuators, sensors, actuator_name_list, sensor_name_list):
+        # only values published after the last pump cycle can trigger the pump again
+        last_seq = 0
         
+        count_loop = self.loop_counter("collector_flush")
         while not self.shutdown_event.is_set():
+            count_loop()
 
             # read up-to-date control parameters (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
@@ -349,39 +590,45 @@ class routines:
             tau_M0112_delay     = float(pl.get("tau_M0112_delay"))
             threshold_min_B0111 = float(pl.get("threshold_min_B0111"))
 
-            # get instance of required S&A
-            act_M0112 = actuators[actuator_name_list.index("M0112")]
-            sen_B0111 = sensors[sensor_name_list.index("B0111")]
-
-            if sen_B0111.value > threshold_min_B0111 and not(self.collector_drain_running):
+            # wait for a published collector level above threshold (timeout for parameter update and shutdown)
+            inflow = yield WaitUntil("B0111", lambda value: value > threshold_min_B0111, timeout=1.0, after_seq=last_seq)
+            if inflow and not(self.collector_drain_running):
 
                 # Wait for the specified pre-delay
-                time.sleep(tau_M0112_delay)
-
-                # get inflow volume from collector tube sensor and update inflow event data
-                self.last_event_inflow = sen_B0111.read_value()
-                self.update_inflow_data(self.last_event_inflow)
+                yield Sleep(tau_M0112_delay)
 
-                current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+                current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
                 # Turn actuator on
                 print(f"[Pump Control] Activating collector tube flush pump at runtime: {current_runtime:.2f}s")
                 act_M0112.set_state(True)
 
                 # Wait for the specified runtime
-                time.sleep(tau_M0112_runtime)
+                yield Sleep(tau_M0112_runtime)
                 
                 # Turn actuator off
                 print(f"[Pump Control] Deactivating collector tube flush pump at runtime: {current_runtime + tau_M0112_runtime:.2f}s")
                 act_M0112.set_state(False)
+                last_seq = self.signals.seq
 
-
-            time.sleep(1)
+            elif inflow:
+                # drain pump is running, wait for the next value
+                last_seq = self.signals.get_entry("B0111")[2]
 
 
     # running routine: evaporation
-    def evaporation(self, actuators, sensors, actuator_name_list, sensor_name_list):
+    def evaporation_steps(self, io):
+
+        # get instance of required S&A
+        act_M0201 = io.actuator("M0201")
+        act_M0204 = io.actuator("M0204")
+        act_M0205 = io.actuator("M0205")
+        act_M0301 = io.actuator("M0301")
+        sen_B0201 = io.sensor("B0201")
+        sen_BM201 = io.sensor("BM201")
         
+        count_loop = self.loop_counter("evaporation")
         while not self.shutdown_event.is_set():
+            count_loop()
 
             # read up-to-date control parameters (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
@@ -389,26 +636,18 @@ class routines:
             tau_M0201_runtime   = float(pl.get("tau_M0201_runtime"))
             tau_M0201_interval = float(pl.get("tau_M0201_interval"))
 
-            # get instance of required S&A
-            act_M0201 = actuators[actuator_name_list.index("M0201")]
-            act_M0204 = actuators[actuator_name_list.index("M0204")]
-            act_M0205 = actuators[actuator_name_list.index("M0205")]
-            act_M0301 = actuators[actuator_name_list.index("M0301")]
-            sen_B0201 = sensors[sensor_name_list.index("B0201")]
-            sen_BM201 = sensors[sensor_name_list.index("BM201")]
-
-            current_runtime = time.time() - self.evaporation_start_time
+            current_runtime = self.clock.time() - self.evaporation_start_time
             evap_duty_cycle = int(current_runtime/tau_M0201_runtime) % int(tau_M0201_interval/tau_M0201_runtime) == 0
             if sen_B0201.value > threshold_min_B0201 and not(self.evaporation_running) and evap_duty_cycle:
 
                 # start timer for evaporation duty cycle
-                self.evaporation_start_time = time.time()
+                self.evaporation_start_time = self.clock.time()
 
                 # Turn actuators ON (depending on over-current management settings)
                 if sen_BM201.value == False:
                     act_M0201.set_state(True) # disc motor
                 else:
-                    time.sleep(12) # give observer some time to detect
+                    yield Sleep(12) # give observer some time to detect
                     act_M0201.set_state(False)
                     self.relaunch_motor(act_M0201) # relaunch depends on flag in parameters file
 
@@ -435,7 +674,7 @@ class routines:
                 self.add_log_file_entry("evaporation_run", 0)
                 print("Evaporation process stopped")
 
-            time.sleep(1)
+            yield Sleep(1)
 
 
     def relaunch_motor(self, actuator):
@@ -447,9 +686,18 @@ class routines:
 
 
     # cyclic routine: concentrate discharge
-    def concentrate_discharge(self, actuators, sensors, actuator_name_list, sensor_name_list):
+    def concentrate_discharge_steps(self, io):
+
+        # get instance of required S&A
+        act_M0202 = io.actuator("M0202")
+        act_M0203 = io.actuator("M0203")
+        sen_B0401 = io.sensor("B0401")
+        sen_B0201 = io.sensor("B0201")
+        sen_BM202 = io.sensor("BM202")
 
+        count_loop = self.loop_counter("concentrate_discharge")
         while not self.shutdown_event.is_set():
+            count_loop()
             pl = self.load_parameter_list()
             tau_M0203_interval  = float(pl.get("tau_M0203_interval"))
             tau_M0203_runtime   = float(pl.get("tau_M0203_runtime"))
@@ -459,14 +707,7 @@ class routines:
             if tau_M0203_interval-tau_M0203_runtime <=1:
                 print(f"WARNING: time difference between interval and runtime should be longer than 1 sec.")
 
-            # get instance of required S&A
-            act_M0202 = actuators[actuator_name_list.index("M0202")]
-            act_M0203 = actuators[actuator_name_list.index("M0203")]
-            sen_B0401 = sensors[sensor_name_list.index("B0401")]
-            sen_B0201 = sensors[sensor_name_list.index("B0201")]
-            sen_BM202 = sensors[sensor_name_list.index("BM202")]
-        
-            current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+            current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
             if int(current_runtime - tau_M0203_delay) % int(tau_M0203_interval) == 0:
 
                 # only discharge when concentrate tank is not full (check whether sensor is NO or NC)
@@ -476,109 +717,69 @@ class routines:
                     if sen_BM202.value == False:
                         act_M0202.set_state(True) # fans
                     else:
-                        time.sleep(12) # give observer some time to detect
+                        yield Sleep(12) # give observer some time to detect
                         act_M0202.set_state(False)
                         self.relaunch_motor(act_M0202) # relaunch depends on flag in parameters file
 
-                    time.sleep(5) # let screw run for some seconds before pump is activated
+                    yield Sleep(5) # let screw run for some seconds before pump is activated
                     act_M0203.set_state(True)
 
-                    time.sleep(tau_M0203_runtime)  # Wait for the specified runtime
+                    yield Sleep(tau_M0203_runtime)  # Wait for the specified runtime
                     
                     act_M0202.set_state(False)
                     act_M0203.set_state(False)
 
-            time.sleep(0.1)
+            yield Sleep(0.1)
 
 
-    def observer(self, sensors, sensor_name_list):
-        while not self.shutdown_event.is_set():
-            # Load latest parameters
-            pl = self.load_parameter_list()
-            threshold_min_B0101 = float(pl.get("threshold_min_B0101"))
-            threshold_max_B0101 = float(pl.get("threshold_max_B0101"))
-            threshold_max_B0102 = float(pl.get("threshold_max_B0102"))
-            threshold_max_B0202 = float(pl.get("threshold_max_B0202"))
-            threshold_min_B0201 = float(pl.get("threshold_min_B0201"))
-            threshold_min_B0111 = float(pl.get("threshold_min_B0111"))
-
-            # Get sensor instances
-            sen = {name: sensors[sensor_name_list.index(name)] for name in sensor_name_list}
-
-            time.sleep(10)
-            current_runtime = time.time() - (self.start_time + self.initial_wait_time)
-
-            if self.check_and_log_rising_edge("B0102_high_pH", sen["B0102"].value > threshold_max_B0102,
-                                        "B0102_pH_high", sen["B0102"].value):
-                print("\n[[GUI]]")
-                print("pH in Stabilizer is too high.")
-
-            if self.check_and_log_rising_edge("B0202_high_pH", sen["B0202"].value > threshold_max_B0202,
-                                        "B0202_pH_high", sen["B0202"].value):
-                print("\n[[GUI]]")
-                print("pH in Evaporator is too high.")
+    def observer_steps(self, io):
+        rules = self.observer_rules
 
-            if self.check_and_log_rising_edge("B0101_liquid_low", sen["B0101"].value < threshold_min_B0101,
-                                        "B0101_level_low", sen["B0101"].value):
-                print("\n[[GUI]]")
-                print(f"Liquid level ({sen['B0101'].value}) in stabilizer tank below minimum ({threshold_min_B0101}). No feed to evaporator.")
-
-            # if self.check_and_log_rising_edge("B0101_liquid_high", sen["B0101"].value > threshold_max_B0101,
-            #                             "B0101_level_high", sen["B0101"].value):
-            #     print("\n[[GUI]]")
-            #     print(f"Liquid level ({sen['B0101'].value}) in stabilizer tank at maximum ({threshold_max_B0101}). Effluent via overflow!")
+        # Get sensor instances
+        sen = {name: io.sensor(name) for name in rules.signals}
+        last_seq = 0
+        rules.track(self.history)
 
-            if self.check_and_log_rising_edge("B0111_inflow", sen["B0111"].value > threshold_min_B0111,
-                                        "event_number", self.event_nbr):
-                print("\n[[GUI]]")
-                print(f"Inflow detected: Event counter at [{self.event_nbr}]")
+        count_loop = self.loop_counter("observer")
+        while not self.shutdown_event.is_set():
+            count_loop()
+            # Load latest parameters (thresholds are resolved again only if the parameter file has been modified)
+            pl = self.load_parameter_list()
+            observer_min_interval = float(pl.get("observer_min_interval", 1.0))
+            rules.update_thresholds(pl)
 
-            if self.check_and_log_rising_edge("B0401_tank_full", not sen["B0401"].value,
-                                        "B0401_concentrate_full", sen["B0401"].value):
-                print("\n[[GUI]]")
-                print("DETECTION: Concentrate tank is full")
+            # wait for new sensor values (timeout for parameter update and shutdown)
+            seq = yield WaitForUpdate(rules.signals, last_seq, timeout=self.sampling_interval)
+            if seq == last_seq:
+                continue
+            last_seq = seq
 
-            if self.check_and_log_rising_edge("B0201_level_low", sen["B0201"].value < threshold_min_B0201,
-                                        "B0201_level_low", sen["B0201"].value):
-                print("\n[[GUI]]")
-                print(f"Liquid level ({sen['B0201'].value}) in evaporator at minimum ({threshold_min_B0201}). Evaporation and concentrate discharge disabled!")
+            # latest published values (NaN if not yet published: no alarm before the first reading)
+            values = [self.signals.get(name, float("nan")) for name in rules.signals]
 
-            if self.check_and_log_rising_edge("BM101_detected", sen["BM101"].value,
-                                        "overcurrent_detection", sen["BM101"].descr):
-                print("\n[[GUI]]")
-                print(f"DETECTION: {sen['BM101'].descr}")
+            # evaluate all rules at once, log and report the raised alarms
+            for i in rules.evaluate(values, self.clock.time()):
+                rule = rules.rules[i]
+                sensor = sen[rule["signal"]]
+                value = rules.values[i]  # latest value or rolling mean
+                if rules.digital[i]:
+                    value = bool(value)
 
-            if self.check_and_log_rising_edge("BM201_detected", sen["BM201"].value,
-                                        "overcurrent_detection", sen["BM201"].descr):
-                print("\n[[GUI]]")
-                print(f"DETECTION: {sen['BM201'].descr}")
+                log_values = {"value": value, "descr": sensor.descr, "event_number": self.event_nbr}
+                self.add_log_file_entry(rule["log_tag"], log_values[rule.get("log_value", "value")])
 
-            if self.check_and_log_rising_edge("BM202_detected", sen["BM202"].value,
-                                        "overcurrent_detection", sen["BM202"].descr):
                 print("\n[[GUI]]")
-                print(f"DETECTION: {sen['BM202'].descr}")
-
-            time.sleep(0.1)
-
+                print(rule["message"].format(value=value, threshold=float(rules.thresholds[i]), descr=sensor.descr, event_number=self.event_nbr))
 
-    def check_and_log_rising_edge(self, condition_key, current_state, log_tag, log_value):
-        previous_state = self.observer_states.get(condition_key, False)
+            # limit evaluation rate for fast signals (analog sampler)
+            yield Pause(observer_min_interval)
 
-        # Store the current state for the next iteration
-        self.observer_states[condition_key] = current_state
-
-        # Log only if it was False and is now True
-        if not previous_state and current_state:
-            self.add_log_file_entry(log_tag, log_value)
-            return True  # Rising edge detected and logged
-
-        return False  # No rising edge, no log
 
     # write information to log-file
     def add_log_file_entry(self, tag, value):
 
         new_entry = {
-            'datetime': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'datetime': self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
             'tag': tag,
             'value': str(value)
             }
@@ -591,18 +792,20 @@ class routines:
 
 
     # Ca(OH)2 refill procedure
-    def CaOH2_refill(self, actuators, actuator_name_list):
+    def CaOH2_refill_steps(self, io):
+
+        # get instance of required S&A
+        act_M0101 = io.actuator("M0101")
         
+        count_loop = self.loop_counter("CaOH2_refill")
         while not self.shutdown_event.is_set():
+            count_loop()
 
             # read up-to-date control parameters (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
             CaOH2_dosing = float(pl.get("CaOH2_dosing"))
             flag = str(pl.get("CaOH2_refill"))
 
-            # get instance of required S&A
-            act_M0101 = actuators[actuator_name_list.index("M0101")]
-
             if flag == "True":
                 last_CaOH2_refill = self.read_latest_from_log_file('CaOH2_refill')
                 cumulative_inflow_last_CaOH2_added = self.read_latest_from_log_file('cumulative_inflow_last_CaOH2_refill')
@@ -619,25 +822,29 @@ class routines:
                 print(f"Remaining buffer capacity (in L, based on dosing/consumption of {CaOH2_dosing} g/L): {remaining_buffer_cap}\n")
                 print("Procedure: 1) Weigh Ca(OH)2 amount to be added.")
                 print("           2) Open stabilizer tank and add Ca(OH)2 while stirrer is running.")
-                CaOH2_refill = input("           3) Enter added amount of Ca(OH)2 in [g]: ")
-                time.sleep(2)
+                CaOH2_refill = yield Blocking(input, ("           3) Enter added amount of Ca(OH)2 in [g]: ",))
+                yield Sleep(2)
                 act_M0101.set_state(False)
                 self.add_log_file_entry("cumulative_inflow_last_CaOH2_refill", self.cumulative_inflow)
                 self.add_log_file_entry("CaOH2_refill", CaOH2_refill)
-                input("Change 'CaOH2_refill' to 'False' in parameters.toml and save file. (Press any key when done)")
+                yield Blocking(input, ("Change 'CaOH2_refill' to 'False' in parameters.toml and save file. (Press any key when done)",))
                 print("\n*********** End Ca(OH)2 refill procedure *********")
 
-            time.sleep(0.1)
+            yield Sleep(0.1)
 
 
-    def print_sensor_values_to_prompt(self, sensors, sensor_namel_list):
+    def print_sensor_values_to_prompt_steps(self, io):
+        sensors = io.sensors
+        sensor_namel_list = io.sensor_names
             
+        count_loop = self.loop_counter("print_sensor_values_to_prompt")
         while not self.shutdown_event.is_set():
+            count_loop()
             
             # read up-to-date parameter list (do this here in case parameters have been changed in toml file during program run)
             pl = self.load_parameter_list()
 
-            current_runtime = time.time() - (self.start_time + self.initial_wait_time)
+            current_runtime = self.clock.time() - (self.start_time + self.initial_wait_time)
             for sensor, name in zip(sensors, sensor_namel_list):
 
                 # check if there is a corresponding flag in the parameter list
@@ -654,7 +861,7 @@ class routines:
                 else:
                     print(f"No flag for printing / not printing of sensor {name} in parameter file.")
             
-            time.sleep(2)
+            yield Sleep(2)
 
     # read latest event data from log-file
     def read_latest_from_log_file(self, tag):
@@ -672,6 +879,7 @@ class routines:
     def handle_shutdown(self, pxt):
         print("\nShutdown signal received. Cleaning up...")
         self.shutdown_event.set()
+        self.signals.close()
 
         # clean-up and close PiXtend instance
         pxt.digital_out0  = pxt.OFF
@@ -690,24 +898,81 @@ class routines:
         pxt.relay1 = pxt.OFF
         pxt.relay2 = pxt.OFF
         pxt.relay3 = pxt.OFF
-        time.sleep(0.25)
+        self.clock.sleep(0.25)
         pxt.close()
-        time.sleep(0.25)
+        self.clock.sleep(0.25)
         del pxt
         pxt = None
         print("\nPiXtend instance closed and deleted")
         print("Wait while storing measurement data...")
 
-    # Function to load process control parameters from the TOML file
+    # Function to load process control parameters from the TOML file (parsed again only if the file has been modified)
     def load_parameter_list(self):
-        with open(self.parameter_file_path, "rb") as f:
-            parameter_list = tomllib.load(f)
-        return parameter_list
-
-    def update_inflow_data(self, inflow_volume):
+        t_start = time.perf_counter()
+        mtime = os.stat(self.parameter_file_path).st_mtime_ns
+        if mtime != self.parameter_file_mtime:
+            with open(self.parameter_file_path, "rb") as f:
+                self.parameter_list = tomllib.load(f)
+            self.parameter_file_mtime = mtime
+            self.parameter_reloads.inc()
+        self.parameter_load_time.observe(time.perf_counter() - t_start)
+        return self.parameter_list
+
+    def loop_counter(self, routine_name):
+        """
+        Return a function called once per routine loop (number of loops, time and duration of the last loop).
+        """
+        loops = metrics.counter("nh_routine_loops_total", "Loops of each routine", routine=routine_name)
+        last_loop = metrics.gauge("nh_routine_last_loop_timestamp_seconds", "Time of the last loop of each routine", routine=routine_name)
+        last_duration = metrics.gauge("nh_routine_last_loop_seconds", "Duration of the last complete loop of each routine", routine=routine_name)
+        stats = self.routine_stats.setdefault(routine_name, RoutineStats())
+        stats.last_time = None  # (re)start of the routine
+
+        def count_loop():
+            now = self.clock.time()
+            loops.inc()
+            last_loop.set(now)
+            if stats.last_time is not None:
+                stats.last_duration = now - stats.last_time
+                last_duration.set(stats.last_duration)
+            stats.last_time = now
+            stats.loops += 1
+
+        return count_loop
+
+    def update_soft_sensor(self, actuators):
+        """
+        Add the levels and pump states of the last acquisition cycle to the soft sensor, as they were logged
+        (time of the stabilizer level; a missing evaporator level is NaN, cycles without a stabilizer level are
+        left out), so that the samples are the same as those of 'scripts/soft_sensor.py'.
+        """
+        readings, self.soft_sensor_readings = self.soft_sensor_readings, {}
+        t, stabilizer = readings.get("B0101", (None, None))
+        if stabilizer is None:
+            return
+        evaporator = readings.get("B0201", (None, None))[1]
+        states = {actuator.name: actuator.state for actuator in actuators}
+        sample = [t, stabilizer, float("nan") if evaporator is None else evaporator]
+        sample += [float("nan") if states.get(name) is None else float(states[name]) for name in SOFT_SENSOR_COLUMNS[3:]]
+        self.soft_sensor.configure(self.load_parameter_list())
+        self.soft_sensor.update(sample)
+
+    def detect_inflow(self, t, value):
+        self.inflow_detector.configure(self.load_parameter_list())
+        event = self.inflow_detector.update(t, value)
+        if event is not None:
+            self.update_inflow_data(event)
+
+    def update_inflow_data(self, event):
 
         self.event_nbr += 1
-        self.cumulative_inflow += inflow_volume
+        self.last_event_inflow = float(event["volume"])
+        self.cumulative_inflow += self.last_event_inflow
+        self.inflow_catalog.append(event)
 
         self.add_log_file_entry('cumulative_inflow', self.cumulative_inflow)
-        # logging of event numbe in 'observer'
+        self.add_log_file_entry('event_number', self.event_nbr)
+
+        actions = ", ".join(inflow_events.action_names(int(event["actions"]))) or "none"
+        print("\n[[GUI]]")
+        print(f"Inflow event [{self.event_nbr}]: {self.last_event_inflow:.3f} L (peak {float(event['peak']):.3f}, actions: {actions})")
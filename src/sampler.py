@@ -0,0 +1,189 @@
+import threading
+import time
+import numpy as np
+
+from src.process_image import INPUT_INDEX
+
+
+class AnalogSampler:
+    def __init__(self, sensors, pxt, sampling_rate=25.0, buffer_size=64, filter_method="median", ema_alpha=0.1, trim_fraction=0.1, signals=None):
+        """
+        Background sampler for the analog inputs (type 'PX-AI') on the PiXtend.
+        All analog channels are sampled at once and stored in a fixed-size ring buffer (one row per sensor),
+        filtered values are computed vectorized over all channels.
+        """
+        self.pxt = pxt
+        self.sampling_rate = float(sampling_rate)
+        self.buffer_size = int(buffer_size)
+        self.filter_method = filter_method
+        self.ema_alpha = float(ema_alpha)
+        self.trim_fraction = float(trim_fraction)
+
+        # analog sensors handled by the sampler (configured sensors on PiXtend analog inputs only)
+        self.sensors = [s for s in sensors if s.type == "PX-AI" and s.configured]
+        self.names = [s.name for s in self.sensors]
+        self.addresses = [s.address for s in self.sensors]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        # read raw values from the PiXtend process image if available (see 'src/process_image.py')
+        self.process_image = None
+        self.input_indices = None
+
+        # calibration coefficients (one entry per channel)
+        self.quad_gain = np.array([s.quad_gain for s in self.sensors], dtype=float)
+        self.gain      = np.array([s.gain for s in self.sensors], dtype=float)
+        self.offset    = np.array([s.offset for s in self.sensors], dtype=float)
+
+        # ring buffer (channels x samples), write position and number of valid samples
+        self.buffer = np.zeros((len(self.sensors), self.buffer_size), dtype=float)
+        self.position = 0
+        self.count = 0
+
+        # exponential moving average (updated with every sample)
+        self.ema = np.zeros(len(self.sensors), dtype=float)
+
+        # signal store the filtered values are published to (see 'src/signal_store.py')
+        self.signals = signals
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # let the sensors read their filtered value from the sampler
+        for sensor in self.sensors:
+            sensor.sampler = self
+            sensor.compile()
+
+
+    def sample(self):
+        """
+        Read all analog inputs once and add the calibrated values to the ring buffer.
+        """
+        if self.process_image is not None:
+            raw = self.process_image.get_inputs(self.input_indices)
+        else:
+            raw = np.array([getattr(self.pxt, address) for address in self.addresses], dtype=float)
+        values = self.quad_gain*raw**2 + self.gain*raw + self.offset
+
+        with self.lock:
+            self.buffer[:, self.position] = values
+            self.position = (self.position + 1) % self.buffer_size
+
+            if self.count == 0:
+                self.ema[:] = values
+            else:
+                self.ema += self.ema_alpha*(values - self.ema)
+
+            if self.count < self.buffer_size:
+                self.count += 1
+
+        if self.signals is not None:
+            self.signals.publish_many(self.names, self.filtered_values().tolist())
+
+
+    def run(self):
+        """
+        Sampling loop (runs in its own thread until 'stop' is called).
+        """
+        period = 1.0/self.sampling_rate
+        next_time = time.time()
+
+        while not self.stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Analog sampler could not read PiXtend inputs: {e}")
+
+            next_time += period
+            delay = next_time - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_time = time.time() # skip missed samples instead of catching up
+
+
+    def use_process_image(self, process_image):
+        self.process_image = process_image
+        self.input_indices = np.array([INPUT_INDEX[address] for address in self.addresses], dtype=int)
+
+
+    def start(self):
+        if not self.sensors:
+            print("No analog PiXtend sensors configured. Analog sampler not started.")
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        # sensors fall back to direct reads
+        for sensor in self.sensors:
+            if sensor.sampler is self:
+                sensor.sampler = None
+                sensor.compile()
+
+
+    def filtered_values(self, method=None):
+        """
+        Return the filtered values of all channels (array ordered as 'names'), or None if no samples are available yet.
+        """
+        method = method or self.filter_method
+
+        with self.lock:
+            if self.count == 0:
+                return None
+            if method == "ema":
+                return self.ema.copy()
+            if method == "none":
+                return self.buffer[:, (self.position - 1) % self.buffer_size].copy()
+            window = self.buffer[:, :self.count].copy()
+
+        if method == "median":
+            return np.median(window, axis=1)
+
+        elif method == "trimmed_mean":
+            n_trim = int(self.trim_fraction*window.shape[1])
+            window.sort(axis=1)
+            return window[:, n_trim:window.shape[1]-n_trim].mean(axis=1)
+
+        elif method == "mean":
+            return window.mean(axis=1)
+
+        else:
+            print(f"Unknown filter method '{method}'. Using median.")
+            return np.median(window, axis=1)
+
+
+    def get_value(self, name, method=None):
+        """
+        Return the filtered value of a single sensor, or None if no samples are available yet.
+        """
+        values = self.filtered_values(method)
+        if values is None:
+            return None
+        return float(values[self.index[name]])
+
+
+# Create sampler with settings from the parameter list
+def create_analog_sampler(sensors, pxt, pl, process_image=None, signals=None):
+    sampler = AnalogSampler(
+        sensors,
+        pxt,
+        sampling_rate = float(pl.get("px_ai_sampling_rate", 25.0)),
+        buffer_size   = int(pl.get("px_ai_buffer_size", 64)),
+        filter_method = str(pl.get("px_ai_filter", "median")),
+        ema_alpha     = float(pl.get("px_ai_ema_alpha", 0.1)),
+        trim_fraction = float(pl.get("px_ai_trim_fraction", 0.1)),
+        signals       = signals,
+    )
+    if process_image is not None:
+        sampler.use_process_image(process_image)
+
+    return sampler
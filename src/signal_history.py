@@ -0,0 +1,241 @@
+import collections
+import math
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# rows of the data of a ring buffer: time, value, sum of the valid values and number of valid values up to the sample
+TIME, VALUE, SUM, COUNT = range(4)
+
+
+class RingBuffer:
+    def __init__(self, capacity, counter, data):
+        """
+        Latest 'capacity' samples (time, value) of one signal in preallocated arrays. Each sample is written
+        twice (mirrored at 'slots'), so the latest n samples are always one contiguous slice: readers get views
+        without copying. Running sums and counts of the valid (non NaN) values give the sum and mean of the
+        latest n samples in constant time. Single writer ('append'), any number of readers; a view of n samples
+        is not modified by the next 'capacity - n' appends (copy it to keep it longer).
+        """
+        self.capacity = capacity
+        self.slots = capacity + 1  # one more sample for the running sums before the oldest sample
+        self.counter = counter     # number of appended samples (int64 array of length 1)
+        self.data = data           # float64 array (4, 2*slots)
+        self.windows = []
+        self.lock = threading.Lock()
+
+
+    @classmethod
+    def allocate(cls, capacity):
+        return cls(capacity, np.zeros(1, dtype=np.int64), np.full((4, 2*(capacity + 1)), math.nan))
+
+
+    def __len__(self):
+        return min(int(self.counter[0]), self.capacity)
+
+
+    def append(self, t, value):
+        k = int(self.counter[0])
+        p = k % self.slots
+        before = (p - 1) % self.slots + self.slots  # position of the previous sample
+        valid = not math.isnan(value)
+        total, count = (self.data[SUM, before], self.data[COUNT, before]) if k else (0.0, 0.0)
+        column = (t, value, total + value if valid else total, count + 1 if valid else count)
+        self.data[:, p] = column
+        self.data[:, p + self.slots] = column
+        self.counter[0] = k + 1  # sample visible to readers
+        if self.windows:
+            with self.lock:
+                for window in self.windows:
+                    window.update(k, t, value)
+
+
+    def view(self, n=None):
+        """
+        Read-only views of the times and values of the latest n samples (all if None), oldest first.
+        """
+        k = int(self.counter[0])
+        n = min(k, self.capacity) if n is None else min(n, k, self.capacity)
+        end = self.position(k - 1) + 1 if k else 0
+        times, values = self.data[TIME, end - n:end], self.data[VALUE, end - n:end]
+        times.flags.writeable = values.flags.writeable = False
+        return times, values
+
+
+    def since(self, t):
+        """
+        Views of the times and values of the samples at or after 't'.
+        """
+        times, values = self.view()
+        i = int(np.searchsorted(times, t))
+        return times[i:], values[i:]
+
+
+    def position(self, k):
+        return k % self.slots + self.slots
+
+
+    def running(self, k, row):
+        """
+        Running sum or count before sample k (k within the buffer or the sample before the oldest one).
+        """
+        return self.data[row, self.position(k - 1)] if k > 0 else 0.0
+
+
+    def sum(self, n):
+        """
+        Sum and number of the valid values of the latest n samples (constant time).
+        """
+        k = int(self.counter[0])
+        n = min(n, k, self.capacity)
+        last = self.position(k - 1)
+        return (float(self.data[SUM, last] - self.running(k - n, SUM)) if k else 0.0,
+                int(self.data[COUNT, last] - self.running(k - n, COUNT)) if k else 0)
+
+
+    def mean(self, n):
+        total, count = self.sum(n)
+        return total/count if count else math.nan
+
+
+    def track(self, window):
+        """
+        Rolling statistics over the last 'window' seconds, updated with each appended sample (see 'RollingWindow').
+        """
+        with self.lock:
+            rolling = RollingWindow(self, window)
+            k = int(self.counter[0])
+            for i in range(max(k - self.capacity, 0), k):
+                p = self.position(i)
+                rolling.update(i, self.data[TIME, p], self.data[VALUE, p])
+            self.windows.append(rolling)
+        return rolling
+
+
+class RollingWindow:
+    def __init__(self, buffer, window):
+        """
+        Sum, mean, minimum and maximum of the valid values of the last 'window' seconds of a ring buffer (at
+        most its capacity). Updated in amortized constant time per sample: the sum from the running sums of the
+        buffer, minimum and maximum from monotonic queues. Readers use the attributes.
+        """
+        self.buffer = buffer
+        self.window = window
+        self.start = 0  # first sample in the window
+        self.min_queue = collections.deque()  # (sample, value), increasing values
+        self.max_queue = collections.deque()  # (sample, value), decreasing values
+        self.sum = 0.0
+        self.count = 0
+        self.mean = self.min = self.max = math.nan
+
+
+    def update(self, k, t, value):
+        buffer = self.buffer
+        if not math.isnan(value):
+            while self.min_queue and self.min_queue[-1][1] >= value:
+                self.min_queue.pop()
+            self.min_queue.append((k, value))
+            while self.max_queue and self.max_queue[-1][1] <= value:
+                self.max_queue.pop()
+            self.max_queue.append((k, value))
+
+        self.start = max(self.start, k + 1 - buffer.capacity)
+        while self.start <= k and buffer.data[TIME, buffer.position(self.start)] <= t - self.window:
+            self.start += 1
+        while self.min_queue and self.min_queue[0][0] < self.start:
+            self.min_queue.popleft()
+        while self.max_queue and self.max_queue[0][0] < self.start:
+            self.max_queue.popleft()
+
+        last = buffer.position(k)
+        self.sum = float(buffer.data[SUM, last] - buffer.running(self.start, SUM))
+        self.count = int(buffer.data[COUNT, last] - buffer.running(self.start, COUNT))
+        self.mean = self.sum/self.count if self.count else math.nan
+        self.min = self.min_queue[0][1] if self.min_queue else math.nan
+        self.max = self.max_queue[0][1] if self.max_queue else math.nan
+
+
+class SignalHistory:
+    def __init__(self, capacity, names=(), shared=False, name=None):
+        """
+        Ring buffer of the latest 'capacity' samples of each signal (filled by 'data_acquisition'), for trend
+        lines and rolling statistics without reading the measurement files. The buffers of 'names' are allocated
+        at once (size known at startup: 'nbytes'), other signals get a buffer on their first sample. With 'shared',
+        the buffers of 'names' are in one shared memory block which the GUI process attaches ('name', see 'layout').
+        """
+        self.capacity = capacity
+        self.names = list(names)
+        self.buffers = {}
+        self.shm = None
+        self.owner = name is None
+
+        if shared or name is not None:
+            slots = capacity + 1
+            size = 8*len(self.names)*(1 + 4*2*slots)
+            if self.owner:
+                self.shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+            else:
+                self.shm = shared_memory.SharedMemory(name=name)
+            counters = np.ndarray((len(self.names),), dtype=np.int64, buffer=self.shm.buf)
+            data = np.ndarray((len(self.names), 4, 2*slots), dtype=np.float64, buffer=self.shm.buf, offset=8*len(self.names))
+            if self.owner:
+                counters[:] = 0
+                data[:] = math.nan
+            for i, signal in enumerate(self.names):
+                self.buffers[signal] = RingBuffer(capacity, counters[i:i + 1], data[i])
+        else:
+            for signal in self.names:
+                self.buffers[signal] = RingBuffer.allocate(capacity)
+
+
+    @classmethod
+    def for_window(cls, window, interval, names=(), shared=False):
+        """
+        Buffers covering 'window' seconds at the sampling 'interval' [s].
+        """
+        return cls(max(math.ceil(window/interval), 1), names, shared)
+
+
+    @property
+    def layout(self):
+        return {"name": self.shm.name, "capacity": self.capacity, "names": self.names}
+
+
+    @classmethod
+    def attach(cls, layout):
+        return cls(layout["capacity"], layout["names"], name=layout["name"])
+
+
+    @property
+    def nbytes(self):
+        return sum(buffer.data.nbytes + buffer.counter.nbytes for buffer in self.buffers.values())
+
+
+    def append(self, name, t, value):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            if self.shm is not None:
+                return  # not part of the shared block
+            buffer = self.buffers[name] = RingBuffer.allocate(self.capacity)
+        buffer.append(t, value)
+
+
+    def get(self, name):
+        return self.buffers.get(name)
+
+
+    def track(self, name, window):
+        if name not in self.buffers and self.shm is None:
+            self.buffers[name] = RingBuffer.allocate(self.capacity)
+        return self.buffers[name].track(window)
+
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.buffers = {}  # release the views on the buffer before closing
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,112 @@
+import threading
+
+from src.clock import WallClock
+
+
+class SignalStore:
+    def __init__(self, clock=None):
+        """
+        Central store for the latest value of each signal (sensor name). Acquisition publishes into the store,
+        routines block on the condition variable until a new value or a threshold crossing arrives.
+        """
+        self.clock = clock or WallClock()
+        self.condition = threading.Condition()
+        self.entries = {}  # name -> (value, timestamp, sequence number)
+        self.seq = 0       # sequence number of the latest publication (all signals)
+        self.closed = False
+        self.listeners = []  # callbacks invoked after each publication (e.g. to wake an event loop)
+
+
+    def publish(self, name, value, timestamp=None):
+        with self.condition:
+            self.seq += 1
+            self.entries[name] = (value, timestamp or self.clock.time(), self.seq)
+            self.condition.notify_all()
+        self.notify_listeners()
+
+
+    def publish_many(self, names, values, timestamp=None):
+        """
+        Publish several signals at once (one notification for all waiting routines).
+        """
+        timestamp = timestamp or self.clock.time()
+        with self.condition:
+            self.seq += 1
+            for name, value in zip(names, values):
+                self.entries[name] = (value, timestamp, self.seq)
+            self.condition.notify_all()
+        self.notify_listeners()
+
+
+    def subscribe(self, callback):
+        """
+        Register a callback (without arguments) invoked from the publishing thread after each publication.
+        """
+        self.listeners.append(callback)
+
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+
+    def notify_listeners(self):
+        self.clock.notify()
+        for callback in list(self.listeners):
+            callback()
+
+
+    def get(self, name, default=None):
+        entry = self.entries.get(name)
+        return entry[0] if entry is not None else default
+
+
+    def get_entry(self, name):
+        """
+        Return (value, timestamp, sequence number) of the latest publication of a signal, or None.
+        """
+        return self.entries.get(name)
+
+
+    def latest_seq(self, names):
+        return max((self.entries[name][2] for name in names if name in self.entries), default=0)
+
+
+    def wait_for_update(self, names, last_seq, timeout=None):
+        """
+        Block until one of the signals has been published after 'last_seq'.
+        Returns the latest sequence number of these signals (unchanged on timeout).
+        """
+        self.clock.wait_for(self.condition, lambda: self.closed or self.latest_seq(names) > last_seq, timeout)
+        return self.latest_seq(names)
+
+
+    def wait_until(self, name, predicate, timeout=None, after_seq=0):
+        """
+        Block until a value of the signal published after 'after_seq' satisfies the predicate (e.g. threshold crossing).
+        Returns True if the condition is met, False on timeout or when the store is closed.
+        """
+        def condition_met():
+            entry = self.entries.get(name)
+            return entry is not None and entry[2] > after_seq and predicate(entry[0])
+
+        met = self.clock.wait_for(self.condition, lambda: self.closed or condition_met(), timeout)
+        return met and not self.closed
+
+
+    def close(self):
+        """
+        Wake up all waiting routines (used on shutdown).
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.notify_listeners()
+
+
+    def reopen(self):
+        """
+        Accept waiting routines again after 'close' (restart of the routines).
+        """
+        with self.condition:
+            self.closed = False
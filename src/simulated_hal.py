@@ -0,0 +1,199 @@
+import random
+import threading
+import time
+import tomllib
+
+from src.hal import Backend
+from src.io_drivers import INPUTS, OUTPUTS
+
+
+class SimulatedPiXtend:
+    ON = True
+    OFF = False
+
+    def __init__(self, registers=None, crc_error_rate=0.0, rng=None):
+        """
+        PiXtend stand-in: inputs and outputs are plain attributes (register values),
+        a plant model or test writes the inputs and reads the outputs.
+        """
+        for address in INPUTS:
+            setattr(self, address, 0)
+        for address in OUTPUTS:
+            setattr(self, address, self.OFF)
+        for address, value in (registers or {}).items():
+            setattr(self, address, value)
+
+        self.crc_error_rate = crc_error_rate  # fault injection: probability of a CRC error per check
+        self.rng = rng or random.Random()
+        self.closed = False
+
+    @property
+    def crc_header_in_error(self):
+        return self.rng.random() < self.crc_error_rate
+
+    @property
+    def crc_data_in_error(self):
+        return self.rng.random() < self.crc_error_rate
+
+    def close(self):
+        self.closed = True
+
+
+class SimulatedEzoDevice:
+    # processing time of the EZO circuit per command [s] (readings and calibrations take longer)
+    READ_TIME = 0.9
+    COMMAND_TIME = 0.25
+
+    def __init__(self, address, device_type, value=0.0, value_aux=0.0, noise=0.0,
+                 error_rate=0.0, error_code=2, pending_rate=0.0, disconnected=False):
+        """
+        State of one simulated EZO circuit. 'value' (and 'value_aux' for EZO-HUM) can be changed
+        at any time, e.g. by a plant model. Fault injection:
+          error_rate     probability that a command fails with 'error_code' (2: syntax error, 255: no data)
+          pending_rate   probability that processing takes longer than the query timeout (response 254)
+          disconnected   the device does not acknowledge its address (IOError, like a missing device)
+        """
+        self.address = address
+        self.type = device_type
+        self.value = value
+        self.value_aux = value_aux
+        self.noise = noise
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.pending_rate = pending_rate
+        self.disconnected = disconnected
+
+        # last command and time at which its response is available
+        self.command = None
+        self.ready_at = 0.0
+        self.failed = False
+        self.lock = threading.Lock()
+
+
+class SimulatedAtlasI2C:
+    # same timeouts as 'AtlasI2C'
+    LONG_TIMEOUT = 1.7
+    SHORT_TIMEOUT = .3
+    DEFAULT_ADDRESS = 98
+    LONG_TIMEOUT_COMMANDS = ("R", "CAL")
+    SLEEP_COMMANDS = ("SLEEP", )
+
+    def __init__(self, backend, address=None):
+        """
+        I2C device on the simulated bus with the interface of 'AtlasI2C' (responses in the same format).
+        """
+        self.backend = backend
+        self._address = address or self.DEFAULT_ADDRESS
+
+    def device(self):
+        device = self.backend.ezo_devices.get(self._address)
+        if device is None or device.disconnected:
+            raise IOError(f"No I2C device at address {self._address}")
+        return device
+
+    def get_command_timeout(self, command):
+        timeout = None
+        if command.upper().startswith(self.LONG_TIMEOUT_COMMANDS):
+            timeout = self.LONG_TIMEOUT
+        elif not command.upper().startswith(self.SLEEP_COMMANDS):
+            timeout = self.SHORT_TIMEOUT
+        return timeout
+
+    def write(self, cmd):
+        device = self.device()
+        rng = self.backend.rng
+        with device.lock:
+            processing_time = device.READ_TIME if cmd.upper().startswith(self.LONG_TIMEOUT_COMMANDS) else device.COMMAND_TIME
+            if rng.random() < device.pending_rate:
+                processing_time += self.LONG_TIMEOUT
+            device.command = cmd
+            device.ready_at = time.monotonic() + processing_time*self.backend.latency_scale
+            device.failed = rng.random() < device.error_rate
+
+    def read(self, num_of_bytes=31):
+        device = self.device()
+        info = f" {self._address}"
+        with device.lock:
+            if device.command is None:
+                return f"Error {info}: 255"   # no data to send
+            if time.monotonic() < device.ready_at:
+                return f"Error {info}: 254"   # still processing
+            if device.failed:
+                return f"Error {info}: {device.error_code}"
+            payload = self.response(device, device.command)
+
+        return f"Success {info}: {payload}" + "\x00"*(num_of_bytes - 1 - len(payload))
+
+    def response(self, device, command):
+        command = command.upper()
+        if command.startswith("R"):
+            rng = self.backend.rng
+            value = device.value + rng.gauss(0.0, device.noise) if device.noise else device.value
+            if device.type == "EZO-HUM":
+                return f"{value:.2f},{device.value_aux:.2f}"
+            return f"{value:.3f}"
+        if command == "I":
+            return f"?I,{device.type.removeprefix('EZO-')},2.16"
+        return ""
+
+    def query(self, command):
+        self.write(command)
+        current_timeout = self.get_command_timeout(command=command)
+        if not current_timeout:
+            return "sleep mode"
+        time.sleep(current_timeout*self.backend.latency_scale)
+        return self.read()
+
+    def close(self):
+        pass
+
+    def list_i2c_devices(self):
+        return sorted(address for address, device in self.backend.ezo_devices.items() if not device.disconnected)
+
+
+class SimulatedBackend(Backend):
+    name = "simulated"
+
+    def __init__(self, registers=None, ezo_devices=(), latency_scale=1.0, crc_error_rate=0.0, seed=None):
+        """
+        Simulated PiXtend and I2C bus for running the control and acquisition path without hardware.
+        'latency_scale' scales all EZO timeouts and processing times (0: no waiting).
+        """
+        self.rng = random.Random(seed)
+        self.latency_scale = float(latency_scale)
+        self.pxt = SimulatedPiXtend(registers, crc_error_rate, self.rng)
+        self.ezo_devices = {device.address: device for device in ezo_devices}
+
+    @classmethod
+    def from_toml(cls, file_path):
+        with open(file_path, "rb") as f:
+            config = tomllib.load(f)
+
+        ezo_devices = []
+        for device in config.get("ezo", []):
+            settings = dict(device)
+            ezo_devices.append(SimulatedEzoDevice(int(settings.pop("address")), settings.pop("type"), **settings))
+
+        return cls(
+            registers=config.get("pixtend", {}),
+            ezo_devices=ezo_devices,
+            latency_scale=config.get("latency_scale", 1.0),
+            crc_error_rate=config.get("crc_error_rate", 0.0),
+            seed=config.get("seed"),
+        )
+
+    def create_pxt(self):
+        return self.pxt
+
+    def i2c_device(self, address=None):
+        return SimulatedAtlasI2C(self, address)
+
+    def set_fault(self, address, **settings):
+        """
+        Change fault injection settings of an EZO device at runtime (e.g. error_rate=0.1, disconnected=True).
+        """
+        device = self.ezo_devices[address]
+        for key, value in settings.items():
+            if not hasattr(device, key):
+                raise ValueError(f"Unknown fault setting '{key}'.")
+            setattr(device, key, value)
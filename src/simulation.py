@@ -0,0 +1,167 @@
+import csv
+import os
+import re
+import shutil
+import threading
+import time
+import tomllib
+from collections import Counter
+
+from src import hal
+from src.clock import VirtualClock
+from src.utils import Sensor, Actuator, get_file_path
+from src.io_registry import IORegistry
+from src.routines import routines
+from src.simulated_hal import SimulatedBackend
+from src.plant_twin import PlantTwin
+
+
+ROUTINE_NAMES = [
+    "data_acquisition",
+    "stabilizer_stirrer",
+    "evaporator_feed",
+    "collector_flush",
+    "collector_drain",
+    "evaporation",
+    "concentrate_discharge",
+    "observer",
+    "print_sensor_values_to_prompt",
+    "CaOH2_refill",
+]
+
+
+def prepare_work_dir(work_dir, parameter_overrides=None, source_dir=None):
+    """
+    Copy the configuration into a working directory with an empty log file (the plant's log and data files
+    are not touched) and overwrite parameters in 'parameters.toml' (values as strings, like in the file).
+    """
+    source_dir = source_dir or get_file_path("read", "")
+    shutil.copytree(source_dir, os.path.join(work_dir, "read"), dirs_exist_ok=True)
+    os.makedirs(os.path.join(work_dir, "data"), exist_ok=True)
+    with open(os.path.join(work_dir, "data", "log_file.csv"), "w") as f:
+        f.write("datetime,tag,value\n")
+
+    parameter_file = os.path.join(work_dir, "read", "parameters.toml")
+    with open(parameter_file) as f:
+        text = f.read()
+    for key, value in (parameter_overrides or {}).items():
+        text, n = re.subn(rf'^{key}(\s*)= "[^"]*"', rf'{key}\1= "{value}"', text, flags=re.M)
+        if n == 0:
+            text += f'\n{key} = "{value}"\n'
+    with open(parameter_file, "w") as f:
+        f.write(text)
+
+
+class Simulation:
+    def __init__(self, work_dir, start_time=None, seed=None, routine_names=ROUTINE_NAMES):
+        """
+        Complete controller (routine threads, simulated hardware and plant twin) on a virtual clock.
+        'work_dir' has to be prepared with 'prepare_work_dir' and becomes the working directory.
+        """
+        os.chdir(work_dir)
+        self.work_dir = work_dir
+        self.routine_names = routine_names
+
+        with open(get_file_path("read", "simulation.toml"), "rb") as f:
+            simulation_config = tomllib.load(f)
+
+        # simulated hardware without EZO latencies (time only passes on the virtual clock)
+        self.backend = SimulatedBackend.from_toml(get_file_path("read", "simulation.toml"))
+        self.backend.latency_scale = 0.0
+        hal.set_backend(self.backend)
+        self.pxt = self.backend.create_pxt()
+
+        with open(get_file_path("read", "io_list.toml"), "rb") as f:
+            io_list = tomllib.load(f)
+        sensors = [Sensor(meta, self.pxt) for meta in io_list["sensor"]]
+        actuators = [Actuator(meta, self.pxt) for meta in io_list["actuator"]]
+        self.io = IORegistry(sensors, actuators)
+
+        # routine threads and plant twin take part in the virtual clock
+        self.start_time = time.time() if start_time is None else start_time
+        self.clock = VirtualClock(self.start_time, participants=len(routine_names) + 1)
+        self.routines = routines(self.start_time, "parameters.toml", "log_file.csv", clock=self.clock)
+        self.routines.check_required_ios(self.io, routine_names)
+        self.twin = PlantTwin(self.pxt, self.io, self.clock, simulation_config.get("plant"), seed)
+
+        # statistics collected after every plant step
+        self.on_time = Counter()
+        self.level_range = {}
+
+
+    def participant(self, target, *args):
+        try:
+            target(*args)
+        finally:
+            self.clock.unregister()
+
+
+    def record(self, twin):
+        dt = twin.parameters["step_time"]
+        for name in twin.outputs:
+            if twin.output_on(name):
+                self.on_time[name] += dt
+        for name, level in (("collector", twin.collector), ("stabilizer", twin.stabilizer), ("evaporator", twin.evaporator)):
+            low, high = self.level_range.get(name, (level, level))
+            self.level_range[name] = (min(low, level), max(high, level))
+
+
+    def drive(self, end_time):
+        """
+        Advance the plant until 'end_time' (participant of the virtual clock).
+        """
+        self.twin.run(end_time, self.record)
+
+
+    def run_plant(self, end_time):
+        try:
+            self.drive(end_time)
+        finally:
+            # stop all routines (waits on the clock return immediately from now on)
+            self.routines.shutdown_event.set()
+            self.routines.signals.close()
+            self.clock.stop()
+
+
+    def run(self, duration):
+        """
+        Run the controller for 'duration' seconds of plant time and return a summary.
+        """
+        t_start = time.perf_counter()
+        end_time = self.start_time + duration
+
+        threads = [threading.Thread(target=self.participant, args=(getattr(self.routines, name), self.io), name=name)
+                   for name in self.routine_names]
+        threads.append(threading.Thread(target=self.participant, args=(self.run_plant, end_time), name="plant"))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        real_time = time.perf_counter() - t_start
+        return self.summary(duration, real_time)
+
+
+    def summary(self, duration, real_time):
+        with open(self.routines.log_file_path, newline="") as f:
+            log_tags = Counter(row["tag"] for row in csv.DictReader(f))
+
+        twin = self.twin
+        return {
+            "simulated_days": duration/86400.,
+            "real_time_s": real_time,
+            "speedup": duration/real_time,
+            "inflow_events": twin.inflow_events,
+            "detected_events": self.routines.event_nbr,
+            "totals_kg": dict(twin.totals),
+            "final_kg": {"collector": twin.collector, "stabilizer": twin.stabilizer,
+                         "evaporator": twin.evaporator, "concentrate": twin.concentrate},
+            "level_range_kg": dict(self.level_range),
+            "pump_on_time_s": dict(self.on_time),
+            "mass_balance_error_kg": twin.mass_balance_error(),
+            "soft_sensor": dict(self.routines.soft_sensor.values),
+            "plant_rates_kg_h": {"evaporation_kg_h": twin.parameters["m_dot_evap"]*3600,
+                                 "inflow_kg_h": twin.parameters["inflow_per_day"]/24,
+                                 "feed_kg_h": twin.parameters["m_dot_M0102"]*3600},
+            "log_entries": dict(log_tags),
+        }
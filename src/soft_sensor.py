@@ -0,0 +1,215 @@
+import collections
+import math
+import threading
+
+import numpy as np
+
+
+# columns of a sample: time, level signals and actuator states (1 on, 0 off, NaN unknown)
+COLUMNS = ("time", "B0101", "B0201", "M0111", "M0102", "M0201", "M0203")
+
+# estimated rates [kg/s] and the fraction of time with the evaporator disc motor (M0201) running
+Estimate = collections.namedtuple("Estimate", [
+    "evaporation_rate",       # evaporation with M0201 running (evaporator level, feed and discharge masked)
+    "evaporation_duty",       # fraction of the time with M0201 running
+    "inflow_rate",            # inflow into the stabilizer, incl. rinse water (stabilizer level, feed masked)
+    "feed_rate",              # evaporator feed pump M0102 (stabilizer level while feeding, drain masked)
+    "mass_balance_residual",  # change of the stabilizer and evaporator mass not explained by inflow and evaporation
+])
+
+SoftSensorParameters = collections.namedtuple("SoftSensorParameters", [
+    "window", "kg_per_unit_B0101", "kg_per_unit_B0201", "m_dot_M0102", "m_dot_M0203", "phi_OF_evi"])
+
+
+def soft_sensor_parameters(pl):
+    """
+    Parameters from the parameter list (see 'parameters.toml', soft sensor); the window in samples.
+    """
+    window = float(pl.get("soft_sensor_window_h", 6.0))*3600/float(pl.get("dataq_sampling_interval", 10.0))
+    return SoftSensorParameters(
+        window=max(math.ceil(window), 3),
+        kg_per_unit_B0101=float(pl.get("kg_per_unit_B0101", 0.5)),
+        kg_per_unit_B0201=float(pl.get("kg_per_unit_B0201", 0.5)),
+        m_dot_M0102=float(pl.get("m_dot_M0102", 549.))/(1000*60.),
+        m_dot_M0203=float(pl.get("m_dot_M0203", 1430.))/(1000*60.),
+        phi_OF_evi=float(pl.get("phi_OF_evi", 0.2)),
+    )
+
+
+def steps(t, condition):
+    """
+    Steps between consecutive samples (last axis) which both fulfil 'condition'.
+    """
+    ok = condition & np.isfinite(t)
+    return ok[..., 1:] & ok[..., :-1]
+
+
+def step_time(t, condition):
+    return np.where(steps(t, condition), np.diff(t), 0.0).sum(axis=-1)
+
+
+def masked_rate(t, v, condition):
+    """
+    Mean rate over the steps which fulfil 'condition': sum of the changes of 'v' divided by their duration. Suited
+    for a level that rises in steps (inflow); NaN without steps.
+    """
+    selected = steps(t, condition & np.isfinite(v))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(selected, np.diff(v), 0.0).sum(axis=-1)/np.where(selected, np.diff(t), 0.0).sum(axis=-1)
+
+
+def masked_slope(t, v, condition):
+    """
+    Least-squares slope of 'v' over 't' (last axis) using only the steps which fulfil 'condition'. The excluded
+    intervals are cut out and the remaining pieces joined, so level changes during e.g. a pump run do not enter
+    the slope. Suited for a level that changes continuously (evaporation, pumping); NaN with fewer than three samples.
+    """
+    selected = steps(t, condition & np.isfinite(v))
+    zero = np.zeros(t.shape[:-1] + (1,))
+    x = np.concatenate((zero, np.cumsum(np.where(selected, np.diff(t), 0.0), axis=-1)), axis=-1)
+    y = np.concatenate((zero, np.cumsum(np.where(selected, np.diff(v), 0.0), axis=-1)), axis=-1)
+    w = np.zeros(t.shape, dtype=bool)
+    w[..., 1:] |= selected
+    w[..., :-1] |= selected
+
+    n = w.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = np.where(w, x - (w*x).sum(axis=-1, keepdims=True)/n[..., None], 0.0)
+        dy = np.where(w, y - (w*y).sum(axis=-1, keepdims=True)/n[..., None], 0.0)
+        sxx = (dx*dx).sum(axis=-1)
+        slope = (dx*dy).sum(axis=-1)/sxx
+    return np.where((n >= 3) & (sxx > 0), slope, math.nan)
+
+
+def window_estimate(t, B0101, B0201, M0111, M0102, M0201, M0203, parameters):
+    """
+    Rates over windows of samples (last axis; any leading axes, e.g. all windows of the archive at once).
+    """
+    p = parameters
+    stabilizer = B0101*p.kg_per_unit_B0101
+    evaporator = B0201*p.kg_per_unit_B0201
+
+    evaporation = -masked_slope(t, evaporator, (M0102 == 0) & (M0203 == 0) & (M0201 == 1))
+    feed = -masked_slope(t, stabilizer, (M0102 == 1) & (M0111 == 0))
+    inflow = masked_rate(t, stabilizer, M0102 == 0)
+
+    # feed and evaporator overflow move mass between the tanks, the discharge (M0203) is masked
+    total = masked_rate(t, stabilizer + evaporator, M0203 == 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        duty = step_time(t, (M0201 == 1) & (M0203 == 0))/step_time(t, np.isfinite(M0201) & (M0203 == 0))
+    residual = total - (inflow - np.where(duty > 0, evaporation*duty, 0.0))
+    return Estimate(evaporation, duty, inflow, feed, residual)
+
+
+def rolling_estimates(samples, parameters, block=None):
+    """
+    Estimate after each sample of a recorded series ('samples': array (len(COLUMNS), n)), same result as the
+    streaming 'SoftSensor'. The windows are strided views on the samples (no copies), evaluated block-wise.
+    """
+    n_window = parameters.window
+    n = samples.shape[1]
+    padded = np.concatenate((np.full((len(COLUMNS), n_window - 1), math.nan), samples), axis=1)  # partial first windows
+    windows = np.lib.stride_tricks.sliding_window_view(padded, n_window, axis=1)  # (columns, n, window)
+    block = block or max(2**20//n_window, 1)
+    parts = [window_estimate(*windows[:, i:i + block], parameters) for i in range(0, n, block)]
+    if not parts:
+        return Estimate(*(np.zeros(0) for _ in Estimate._fields))
+    return Estimate(*(np.concatenate(values) for values in zip(*parts)))
+
+
+def estimate_runtimes(m_dot_in, m_dot_evap, m_dot_M0102, m_dot_M0203, N_f_evi, N_f_conc, phi_OF_evi):
+    """
+    Pump time parameters [s] from the daily mass balance. Works element-wise on NumPy arrays
+    (all inputs are broadcast against each other, e.g. for parameter sweeps).
+    Returns tau_M0102_runtime, tau_M0102_interval, tau_M0203_runtime, tau_M0203_interval.
+    """
+    # input time parameters for evaporator feed pump (M0102) [s]
+    tau_M0102_runtime  = np.round(24*3600*m_dot_in*(1+phi_OF_evi)/(N_f_evi*m_dot_M0102),0)
+    tau_M0102_interval = np.round(24*3600/N_f_evi,0)
+
+    m_dot_evi = N_f_evi*m_dot_M0102*tau_M0102_runtime/(24*3600)
+
+    # input time parameters for concentrate discharge pump (M0203) [s]
+    tau_M0203_runtime  = np.round(24*3600*(m_dot_evi - m_dot_evap - phi_OF_evi*m_dot_in)/(N_f_conc*m_dot_M0203),0)
+    tau_M0203_interval = np.round(24*3600/N_f_conc,0)
+
+    return tau_M0102_runtime, tau_M0102_interval, tau_M0203_runtime, tau_M0203_interval
+
+
+def suggest_parameters(estimate, pl):
+    """
+    Pump time parameters (tau_*) for the estimated rates, with the feed and discharge intervals of the parameter
+    list. The calibrated feed rate is used while no feed run has been measured. Empty if the rates are not known.
+    """
+    p = soft_sensor_parameters(pl)
+    m_dot_evap = estimate.evaporation_rate*estimate.evaporation_duty  # average over the window
+    if not (estimate.inflow_rate > 0 and m_dot_evap > 0):
+        return {}
+    m_dot_M0102 = estimate.feed_rate if estimate.feed_rate > 0 else p.m_dot_M0102
+    N_f_evi = 24*3600/float(pl.get("tau_M0102_interval"))
+    N_f_conc = 24*3600/float(pl.get("tau_M0203_interval"))
+    runtimes = estimate_runtimes(estimate.inflow_rate, m_dot_evap, m_dot_M0102, p.m_dot_M0203, N_f_evi, N_f_conc,
+                                 p.phi_OF_evi)
+    names = ("tau_M0102_runtime", "tau_M0102_interval", "tau_M0203_runtime", "tau_M0203_interval")
+    return {name: max(float(value), 0.0) for name, value in zip(names, runtimes)}
+
+
+class SoftSensor:
+    # published values (GUI): rates in kg/h, duty cycle and the suggested pump time parameters [s]
+    NAMES = ("evaporation_kg_h", "evaporation_duty", "inflow_kg_h", "feed_kg_h", "mass_balance_residual_kg_h",
+             "tau_M0102_runtime", "tau_M0102_interval", "tau_M0203_runtime", "tau_M0203_interval")
+
+    def __init__(self):
+        """
+        Streaming estimator of the evaporation, inflow and feed rates and the mass balance residual from the
+        stabilizer and evaporator levels: rolling-window slopes with the pump runs masked (see 'window_estimate'),
+        updated with each acquisition cycle ('update'). The latest samples are kept twice (mirrored), so the
+        window is always one contiguous slice. 'rolling_estimates' gives the same values for recorded data.
+        """
+        self.parameters = None
+        self.parameter_list = None
+        self.data = None
+        self.k = 0
+        self.estimate = None
+        self.values = dict.fromkeys(self.NAMES, math.nan)
+        self.lock = threading.Lock()
+
+
+    def configure(self, pl):
+        """
+        Read the parameters (only if the parameter list has been reloaded); a new window size restarts the estimate.
+        """
+        if pl is self.parameter_list:
+            return
+        parameters = soft_sensor_parameters(pl)
+        with self.lock:
+            if self.parameters is None or parameters.window != self.parameters.window:
+                self.data = np.full((len(COLUMNS), 2*parameters.window), math.nan)
+                self.k = 0
+            self.parameters = parameters
+            self.parameter_list = pl
+
+
+    def update(self, sample):
+        """
+        Next sample (values of 'COLUMNS'). Returns the estimate over the window ending with it.
+        """
+        with self.lock:
+            n = self.parameters.window
+            p = self.k % n
+            self.data[:, p] = sample
+            self.data[:, p + n] = sample
+            self.k += 1
+            window = self.data[:, p + 1:p + 1 + n]
+            self.estimate = Estimate(*(float(value) for value in window_estimate(*window, self.parameters)))
+
+        suggestions = suggest_parameters(self.estimate, self.parameter_list)
+        values = {name: rate*3600 for name, rate in zip(("evaporation_kg_h", "inflow_kg_h", "feed_kg_h"),
+                                                      (self.estimate.evaporation_rate, self.estimate.inflow_rate,
+                                                       self.estimate.feed_rate))}
+        values["evaporation_duty"] = self.estimate.evaporation_duty
+        values["mass_balance_residual_kg_h"] = self.estimate.mass_balance_residual*3600
+        for name in self.NAMES[5:]:
+            values[name] = suggestions.get(name, math.nan)
+        self.values = values
+        return self.estimate
@@ -0,0 +1,34 @@
+import time
+
+
+class StartupProfiler:
+    def __init__(self, enabled=True):
+        """
+        Record the duration of the startup phases (time between consecutive calls of 'mark').
+        """
+        self.enabled = enabled
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.phases = []  # (phase, duration, part of the time-to-first-sample)
+
+
+    def mark(self, phase, waiting=False):
+        """
+        Close the current phase and record its duration. A waiting phase (e.g. for the operator's start
+        command) is reported, but not counted in the time-to-first-sample.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last_time, not waiting))
+        self.last_time = now
+
+
+    def report(self):
+        if not self.enabled:
+            return
+
+        print("\n---------- Startup profile ----------")
+        for phase, duration, counted in self.phases:
+            print(f"{phase:28s} {duration*1000:10.1f} ms{'' if counted else '  (not in total)'}")
+        total = sum(duration for _, duration, counted in self.phases if counted)
+        print(f"{'total (time-to-first-sample)':28s} {total*1000:10.1f} ms")
+        print("-------------------------------------\n")
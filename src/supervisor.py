@@ -0,0 +1,175 @@
+import threading
+import time
+import traceback
+
+from src import metrics
+
+
+# selectable routines (names in the GUI) and the routine methods
+ROUTINES = {
+    "data_acquisition":      "data_acquisition",
+    "stabilizer_stirrer":    "stabilizer_stirrer",
+    "evaporator_feed":       "evaporator_feed",
+    "collector_flush":       "collector_flush",
+    "collector_drain":       "collector_drain",
+    "evaporation":           "evaporation",
+    "concentrate_discharge": "concentrate_discharge",
+    "observer":              "observer",
+    "print_to_prompt":       "print_sensor_values_to_prompt",
+    "CaOH2_refill":          "CaOH2_refill",
+}
+
+STATES = ("stopped", "running", "stopping", "backoff")
+
+
+class RoutineTask:
+    __slots__ = ("name", "method", "thread", "event", "state", "stop_time")
+
+    def __init__(self, name, method):
+        self.name = name
+        self.method = method
+        self.thread = None
+        self.event = threading.Event()  # stop request of this routine
+        self.state = "running"
+        self.stop_time = None           # time of the stop request (monotonic)
+
+
+class RoutineSupervisor:
+    def __init__(self, r, io):
+        """
+        Owns the threads of the routines: starts and stops single routines (the other routines are not
+        touched), restarts a routine after an exception with exponential backoff ('routine_restart_delay'
+        doubled up to 'routine_restart_delay_max') and reports the state of each routine.
+        """
+        self.r = r
+        self.io = io
+        self.tasks = {}     # routine name -> task (running, in backoff or stopping)
+        self.restarts = {}  # routine name -> number of restarts after an exception
+        self.lock = threading.Lock()
+        self.stop_time = metrics.histogram("nh_routine_stop_seconds", "Time from a stop request until the routine has ended")
+
+
+    def start(self, name):
+        """
+        Start a routine (no effect if it is running; a stopping routine is started again by 'reap').
+        """
+        with self.lock:
+            if name in self.tasks:
+                return
+            method = ROUTINES[name]
+            self.r.check_required_ios(self.io, [method])
+            task = self.tasks[name] = RoutineTask(name, method)
+        task.thread = threading.Thread(target=self.run, args=(task,), name=method)
+        task.thread.start()
+
+
+    def stop(self, name):
+        with self.lock:
+            task = self.tasks.get(name)
+            if task is not None and task.stop_time is None:
+                task.stop_time = time.monotonic()
+                task.state = "stopping"
+                task.event.set()
+
+
+    def stop_all(self):
+        """
+        Request all routines to stop. Returns the tasks (their threads are joined by the caller).
+        """
+        with self.lock:
+            tasks = list(self.tasks.values())
+            self.tasks = {}
+        t_stop = time.monotonic()
+        for task in tasks:
+            if task.stop_time is None:
+                task.stop_time = t_stop
+                task.state = "stopping"
+                task.event.set()
+        return tasks
+
+
+    def ended(self, task):
+        self.stop_time.observe(time.monotonic() - task.stop_time)
+
+
+    def run(self, task):
+        r = self.r
+        r.shutdown_event.register(task.event)
+        failures = 0
+        try:
+            while not task.event.is_set():
+                t_start = time.monotonic()
+                try:
+                    getattr(r, task.method)(self.io)
+                    return  # stop requested
+                except Exception as e:
+                    if task.event.is_set():
+                        return
+                    pl = r.load_parameter_list()
+                    delay_initial = float(pl.get("routine_restart_delay", 1.0))
+                    delay_max = float(pl.get("routine_restart_delay_max", 300.0))
+                    if time.monotonic() - t_start > delay_max:
+                        failures = 0  # ran without error for a while
+                    failures += 1
+                    delay = min(delay_initial*2**(failures - 1), delay_max)
+
+                    print(f"\nWARNING: routine '{task.name}' failed ({type(e).__name__}: {e}), restart in {delay:.1f} s")
+                    traceback.print_exc()
+                    self.switch_off(task)
+
+                    task.state = "backoff"
+                    if r.clock.wait(task.event, delay):
+                        return
+                    task.state = "running"
+                    self.restarts[task.name] = self.restarts.get(task.name, 0) + 1
+                    metrics.counter("nh_routine_restarts_total", "Restarts of routines after an exception", routine=task.name).inc()
+        finally:
+            r.shutdown_event.unregister()
+
+
+    def switch_off(self, task):
+        """
+        Switch off the actuators of a routine which are not used by another active routine.
+        """
+        with self.lock:
+            in_use = {name for other in self.tasks.values() if other is not task and other.stop_time is None
+                      for name in self.r.required_ios[other.method][1]}
+        for name in self.r.required_ios[task.method][1]:
+            if name not in in_use:
+                self.io.actuator(name).set_state(False)
+
+
+    def reap(self, wanted):
+        """
+        Remove the routines which have ended and switch off their actuators. Routines in 'wanted'
+        (enabled again while stopping) are started again.
+        """
+        with self.lock:
+            ended = [task for task in self.tasks.values() if not task.thread.is_alive()]
+            for task in ended:
+                del self.tasks[task.name]
+        for task in ended:
+            if task.stop_time is not None:
+                self.ended(task)
+            self.switch_off(task)
+            print(f"Routine '{task.name}' stopped")
+            if task.name in wanted:
+                self.start(task.name)
+
+
+    def status(self):
+        """
+        State, number of loops, duration of the last loop [s] and restarts of each routine.
+        """
+        with self.lock:
+            states = {name: task.state for name, task in self.tasks.items()}
+        status = {}
+        for name, method in ROUTINES.items():
+            stats = self.r.routine_stats.get(method)
+            status[name] = {
+                "state": states.get(name, "stopped"),
+                "loops": stats.loops if stats else 0,
+                "last_loop_s": stats.last_duration if stats else None,
+                "restarts": self.restarts.get(name, 0),
+            }
+        return status
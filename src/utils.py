@@ -1,14 +1,21 @@
+import time
 import tomllib
-import numpy as np
 
 from pathlib import Path
-from src.AtlasI2C_orig import AtlasI2C
+from concurrent.futures import ThreadPoolExecutor
+from src import hal, metrics
+from src.io_drivers import get_driver
 
 class Sensor:
-    def __init__(self, sensor_meta_data, pxt):
+    __slots__ = ("id", "name", "descr", "type", "com_prot", "address", "value", "value_aux_1", "value_aux_2",
+                 "quad_gain", "gain", "offset", "connected", "configured", "calibrated",
+                 "sampler", "process_image", "reader", "pxt", "driver", "read_time")
+
+    def __init__(self, sensor_meta_data, pxt, configure=True):
         """
         Constructor to initialize the sensor object from sensor data.
         """
+        self.id          = None   # position in the io list (set by 'IORegistry')
         self.name        = sensor_meta_data["name"]
         self.descr       = sensor_meta_data["descr"]
         self.type        = sensor_meta_data["type"]
@@ -22,6 +29,10 @@ class Sensor:
         self.offset      = float(sensor_meta_data["offset"]) # only needed for sensors on PiXtend analog input interface (set during calibration)
         self.connected   = False  # Default connection status
         self.configured  = False  # Default connection status
+        self.sampler       = None   # background sampler for filtered analog values (see 'src/sampler.py')
+        self.process_image = None   # PiXtend process image (see 'src/process_image.py')
+        self.reader        = None   # compiled read function (see 'src/io_drivers.py')
+        self.read_time     = metrics.histogram("nh_sensor_read_seconds", "Duration of sensor readings", sensor=self.name)
         
         # check whether sensor is calibrated with knonw data
         if sensor_meta_data["calibrated"] == "yes" or sensor_meta_data["calibrated"] == "Yes":
@@ -32,71 +43,28 @@ class Sensor:
         # PiXtend instance (same for all sensors and actuators)
         self.pxt = pxt
 
-        # Perform sensor type-specific configuration
-        self.configure_sensor()
+        # IO driver for the sensor type (unknown types and addresses are rejected here)
+        self.driver = get_driver(self.type)
+        self.driver.check_address(self)
+
+        # Perform sensor type-specific configuration (can be done later, e.g. in parallel by 'configure_ios')
+        if configure:
+            self.configure()
 
 
-    def configure_sensor(self):
+    def configure(self):
         """
         Perform sensor type-specific configuration.
         """
+        self.driver.configure(self)
+        self.compile()
 
-        # First check whether the sensor is connected
-        if "EZO" in self.type:
-            devices = AtlasI2C()
-            device_list = devices.list_i2c_devices()
-            if int(self.address) in device_list:
-                self.connected = True
-            else:
-                print(f"The address '{self.address}' is not listed in the I2C device list.")
-        else:
-            self.connected = True # all non-EZO type sensors get a pass for this check
-
-        # configure all connected sensors
-        if self.connected:
-            if self.type == "EZO-RTD":
-                print(f"Configuring EZO-RTD'{self.name}'.")
-                device = AtlasI2C(int(self.address))
-                res = device.query('S,c') # set temperature scale to Celcius
-                self.configured = True
-
-            elif self.type == "EZO-pH":
-                print(f"Configuring EZO-pH '{self.name}'.")
-                device = AtlasI2C(int(self.address))
-                res = device.query('T,20') # temperature compensation for 20°C
-                self.configured = True
-
-            elif self.type == "EZO-EC":
-                print(f"Configuring EZO-EC '{self.name}'.")
-                device = AtlasI2C(int(self.address))
-                res = device.query('K,1.0') # set probe type
-                res = device.query('O,EC,1')  # set EC as output parameter
-                res = device.query('O,TDS,0') # disable TDS as output parameter
-                res = device.query('O,S,0')   # disable S as output parameter
-                res = device.query('O,SG,0')  # disable SG as output parameter
-                self.configured = True
-
-            elif "EZO-HUM" in  self.type:
-                print(f"Configuring EZO-HUM '{self.name}'.")
-                device = AtlasI2C(int(self.address))
-                res = device.query('O,HUM,1')  # set rel. humidity as output parameter
-                res = device.query('O,T,1')    # set temperature as output parameter
-                res = device.query('O,Dew,0')   # disable S as output parameter
-                self.configured = True
-
-            elif "PX" in self.type:
-                print(f"Configuring analog / digital input '{self.name}' on PiXtend.")
-                # Check if SPI communication is running and the received data is correct
-                if self.pxt.crc_header_in_error is False and self.pxt.crc_data_in_error is False:
-                    self.configured = True
-                else:
-                    print(f"SPI communication does not appear to be running. Sensor on PiXtend not conifigured.")
-
-            else:
-                print(f"Unknown sensor type '{self.type}'. No specific configuration applied.")
 
-        else:
-            print(f"Sensor '{self.name}' could not be configured, because it appears not to be connected")
+    def compile(self):
+        """
+        Compile the sensor address into a reader function (called again when the data source changes).
+        """
+        self.reader = self.driver.compile_reader(self) if self.configured else None
 
 
 
@@ -106,7 +74,7 @@ class Sensor:
         """
         if self.type == "EZO-RTD":
             print(f"Calibrating temperature sensor type EZO-RTD, name '{self.name}'. ---1-point calibration---")
-            device = AtlasI2C(int(self.address))
+            device = hal.i2c_device(int(self.address))
             uinp = input("Put the temperature probe in a reference medium and enter the reference temperature: ")
             calibration_command = "Cal,"+uinp
             device.query(calibration_command)
@@ -117,7 +85,7 @@ class Sensor:
 
         elif self.type == "EZO-pH":
             print(f"Calibrating pH sensor type EZO-pH, name '{self.name}'. ---3-point calibration---")
-            device = AtlasI2C(int(self.address))
+            device = hal.i2c_device(int(self.address))
 
             # calibration at medium pH
             uinp = input("Put the pH probe in the medium pH reference medium and enter the corresponding pH value (e.g 7.00): ")
@@ -141,7 +109,7 @@ class Sensor:
 
         elif self.type == "EZO-EC":
             print(f"Calibrating EC sensor type EZO-EC, name '{self.name}'. ---2-point calibration---")
-            device = AtlasI2C(int(self.address))
+            device = hal.i2c_device(int(self.address))
 
             # calibration at medium pH
             uinp = input("Dry calibration: Is the probe tip dry / not immersed in a liquid? (enter y/n): ")
@@ -217,6 +185,8 @@ class Sensor:
                 dV_high     = float(input("Add an additional amount of water such that the liquid surface rises to a level 30 - 100 mm below the sensor, and enter the volume of the ADDED amount of water (in L): "))
                 U_high = self.read_value()
 
+                import numpy as np # imported here, only needed for calibration
+
                 x = np.array([U_low, U_mid, U_high])
                 y = np.array([V_low, V_low+dV_mid, V_low+dV_mid+dV_high])
 
@@ -249,107 +219,9 @@ class Sensor:
         Acquire and return the measured value.
         """
         if self.configured:
-
-            if "EZO" in self.type:
-                device = AtlasI2C(int(self.address))
-                response = device.query('R')
-                read_quality = response.split('  ')[0]
-                # print(f'sensor type: {self.type}     read quality: {read_quality}')
-
-                if read_quality == "Success":
-
-                    if self.type == "EZO-HUM":
-                        val_1 = float(response.split(':')[1].split('\x00')[0].split(',')[0])
-                        val_2 = float(response.split(':')[1].split('\x00')[0].split(',')[1])
-                        self.value = val_1
-                        self.value_aux_1 = val_2
-
-                    else:
-                        val = float(response.split(':')[1].split('\x00')[0])
-                        self.value = val
-                else:
-                    resp_code = response.split(':')[1].split('\x00')[0]
-                    print(f'{read_quality} during read of sensor {self.name} (type {self.type}). Response code {resp_code}. Sensor value not updated.')
-
-            elif "PX" in self.type:
-                if self.address == "analog_in0":
-                    read_value = self.pxt.analog_in0
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "analog_in1":
-                    read_value = self.pxt.analog_in1
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "analog_in2":
-                    read_value = self.pxt.analog_in2
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "analog_in3":
-                    read_value = self.pxt.analog_in3
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "analog_in4":
-                    read_value = self.pxt.analog_in4
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "analog_in5":
-                    read_value = self.pxt.analog_in5
-                    self.value = self.quad_gain*read_value**2 + self.gain*read_value + self.offset
-
-                elif self.address == "digital_in0":
-                    self.value = self.pxt.digital_in0
-
-                elif self.address == "digital_in1":
-                    self.value = self.pxt.digital_in1
-
-                elif self.address == "digital_in2":
-                    self.value = self.pxt.digital_in2
-
-                elif self.address == "digital_in3":
-                    self.value = self.pxt.digital_in3
-
-                elif self.address == "digital_in4":
-                    self.value = self.pxt.digital_in4
-
-                elif self.address == "digital_in5":
-                    self.value = self.pxt.digital_in5
-
-                elif self.address == "digital_in6":
-                    self.value = self.pxt.digital_in6
-
-                elif self.address == "digital_in7":
-                    self.value = self.pxt.digital_in7
-
-                elif self.address == "digital_in8":
-                    self.value = self.pxt.digital_in8
-
-                elif self.address == "digital_in9":
-                    self.value = self.pxt.digital_in9
-
-                elif self.address == "digital_in10":
-                    self.value = self.pxt.digital_in10
-
-                elif self.address == "digital_in11":
-                    self.value = self.pxt.digital_in11
-
-                elif self.address == "digital_in12":
-                    self.value = self.pxt.digital_in12
-
-                elif self.address == "digital_in13":
-                    self.value = self.pxt.digital_in13
-
-                elif self.address == "digital_in14":
-                    self.value = self.pxt.digital_in14
-
-                elif self.address == "digital_in15":
-                    self.value = self.pxt.digital_in15
-
-                else:
-                    print(f"Sensor address '{self.address}' is either unknown or has not yet been implemented.")
-
-            else:
-                print(f"Unknown sensor type '{self.name}'. Cannot read measurement value.")            
-
+            t_start = time.perf_counter()
+            self.reader()
+            self.read_time.observe(time.perf_counter() - t_start)
             return self.value
         
         else:
@@ -359,37 +231,47 @@ class Sensor:
 
 
 class Actuator:
-    def __init__(self, actuator_meta_data, pxt):
+    __slots__ = ("id", "name", "descr", "type", "address", "com_prot", "connected", "configured", "state",
+                 "process_image", "writer", "pxt", "driver")
+
+    def __init__(self, actuator_meta_data, pxt, configure=True):
         """
         Constructor to initialize the actuator object from actuator data.
         """
+        self.id = None  # position in the io list (set by 'IORegistry')
         self.name = actuator_meta_data["name"]
         self.descr = actuator_meta_data["descr"]
         self.type = actuator_meta_data["type"]
         self.address = actuator_meta_data["address"]
         self.com_prot = actuator_meta_data["com_prot"]
+        self.connected = False  # Default status
         self.configured = False  # Default status
         self.state = False  # Default state
+        self.process_image = None  # PiXtend process image (see 'src/process_image.py')
+        self.writer = None  # compiled write function (see 'src/io_drivers.py')
 
         # PiXtend instance (same for all sensors and actuators)
         self.pxt = pxt
 
-        # perform actuator configuration
-        self.configure()
+        # IO driver for the actuator type (unknown types and addresses are rejected here)
+        self.driver = get_driver(self.type)
+        self.driver.check_address(self)
+
+        # perform actuator configuration (can be done later, e.g. in parallel by 'configure_ios')
+        if configure:
+            self.configure()
 
     
     def configure(self):
-    
-        if "PX" in self.type:
-            print(f"Configuring analog / digital output '{self.name}' on PiXtend.")
-            # Check if SPI communication is running and the received data is correct
-            if self.pxt.crc_header_in_error is False and self.pxt.crc_data_in_error is False:
-                self.configured = True
-            else:
-                print(f"SPI communication does not appear to be running. Actuator on PiXtend not conifigured.")
+        self.driver.configure(self)
+        self.compile()
 
-        else:
-            print(f"Unknown actuator type '{self.type}'. No specific configuration applied.")
+
+    def compile(self):
+        """
+        Compile the actuator address into a writer function (called again when the data target changes).
+        """
+        self.writer = self.driver.compile_writer(self) if self.configured else None
 
 
     def set_state(self, state):
@@ -397,121 +279,8 @@ class Actuator:
         Activate or disactivate actuator
         """
         if self.configured:
-
-            if self.address == "relay0":
-                if state == True:
-                    self.pxt.relay0 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.relay0 = self.pxt.OFF
-                    self.state  = False
-
-            elif self.address == "relay1":
-                if state == True:
-                    self.pxt.relay1 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.relay1 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "relay2":
-                if state == True:
-                    self.pxt.relay2 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.relay2 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "relay3":
-                if state == True:
-                    self.pxt.relay3 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.relay3 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out0":
-                if state == True:
-                    self.pxt.digital_out0 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out0 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out1":
-                if state == True:
-                    self.pxt.digital_out1 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out1 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out2":
-                if state == True:
-                    self.pxt.digital_out2 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out2 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out3":
-                if state == True:
-                    self.pxt.digital_out3 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out3 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out4":
-                if state == True:
-                    self.pxt.digital_out4 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out4 = self.pxt.OFF
-                    self.state = False
-
-            elif self.address == "digital_out5":
-                if state == True:
-                    self.pxt.digital_out5 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out5 = self.pxt.OFF
-                    self.state = False
-                    
-            elif self.address == "digital_out6":
-                if state == True:
-                    self.pxt.digital_out6 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out6 = self.pxt.OFF
-                    self.state = False
-                    
-            elif self.address == "digital_out7":
-                if state == True:
-                    self.pxt.digital_out7 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out7 = self.pxt.OFF
-                    self.state = False
-                    
-            elif self.address == "digital_out8":
-                if state == True:
-                    self.pxt.digital_out8 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out8 = self.pxt.OFF
-                    self.state = False
-                    
-            elif self.address == "digital_out9":
-                if state == True:
-                    self.pxt.digital_out9 = self.pxt.ON
-                    self.state = True
-                else:
-                    self.pxt.digital_out9 = self.pxt.OFF
-                    self.state = False
-                    
-            else:
-                print(f"Actuator address '{self.address}' is unknown.")
+            self.writer(state)
+            self.state = bool(state)
         else:
             print(f"Actuator '{self.name}' is not configured. State cannot be set.")
 
@@ -559,3 +328,48 @@ def load_actuators_from_toml(folder, file_name, pxt):
 
 
 
+
+
+
+# Function to load the io list (sensors and actuators) from the TOML file
+def load_io_list(folder, file_name):
+    file_path = get_file_path(folder, file_name)
+    with open(file_path, "rb") as f:
+        return tomllib.load(f)
+
+
+# Configure sensors and actuators, devices on different busses and independent devices on the same bus concurrently
+def configure_ios(ios, max_workers=4):
+    groups = {}
+    for io in ios:
+        groups.setdefault(io.driver.bus, []).append(io)
+
+    def configure_group(group):
+        for io in group:
+            io.configure()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for bus, group in groups.items():
+            if group[0].driver.concurrent_configuration:
+                futures += [executor.submit(io.configure) for io in group]
+            else:
+                futures.append(executor.submit(configure_group, group))
+
+        for future in futures:
+            future.result()
+
+
+# Function to load sensors and actuators with a single parse of the TOML file
+def load_ios_from_toml(folder, file_name, pxt, max_workers=4):
+    """
+    Load sensor and actuator data from a TOML file, initialize Sensor and Actuator objects and configure them concurrently.
+    """
+    io_list = load_io_list(folder, file_name)
+
+    sensors = [Sensor(sensor_meta_data, pxt, configure=False) for sensor_meta_data in io_list["sensor"]]
+    actuators = [Actuator(actuator_meta_data, pxt, configure=False) for actuator_meta_data in io_list["actuator"]]
+
+    configure_ios(sensors + actuators, max_workers)
+
+    return sensors, actuators
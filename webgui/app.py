@@ -1,50 +1,269 @@
-from flask import Flask, render_template, request, redirect
+from flask import Flask, render_template, request, redirect, g, Response, jsonify
 from webgui import shared_state
+from webgui.live_data import live_data
+from webgui import history
+from src import metrics
+from src import commands
+import gzip
 import subprocess
+import time
 
 app = Flask(__name__)
 
+render_time = metrics.histogram("nh_gui_render_seconds", "Duration of rendering the GUI page")
+
+# last rendered page: (image sequence number, prompt sequence number), HTML, gzip compressed HTML
+page_cache = (None, None, None)
+
+# smaller JSON responses are not compressed (no gain)
+GZIP_MIN_SIZE = 1024
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or "unknown"
+    metrics.histogram("nh_http_request_seconds", "Duration of GUI requests", endpoint=endpoint, method=request.method).observe(
+        time.perf_counter() - g.request_start)
+    metrics.counter("nh_http_responses_total", "GUI responses by status code", endpoint=endpoint, status=response.status_code).inc()
+    return response
+
+
+@app.after_request
+def compress_json(response):
+    """
+    Compress larger JSON responses for clients accepting gzip (cached responses are compressed in advance,
+    see 'cached_response').
+    """
+    if (response.mimetype == "application/json" and response.status_code == 200 and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers and request.accept_encodings.quality("gzip") > 0):
+        body = response.get_data()
+        if len(body) >= GZIP_MIN_SIZE:
+            response.set_data(gzip.compress(body, 6))
+            response.headers["Content-Encoding"] = "gzip"
+            response.vary.add("Accept-Encoding")
+    return response
+
+
+def cached_response(etag, body, gzip_body, mimetype):
+    """
+    Response for an immutable representation: 304 if the client already has it (If-None-Match), the
+    compressed body if the client accepts gzip.
+    """
+    compressed = request.accept_encodings.quality("gzip") > 0
+    if compressed:
+        etag += "-gz"  # different representation
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(gzip_body if compressed else body, mimetype=mimetype)
+        if compressed:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "no-cache"  # revalidate each time (cheap with the ETag)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format (metrics of the GUI process and of the controller)
+    controller_metrics = shared_state.link.request("metrics") or ""
+    return Response(metrics.registry.render() + controller_metrics, mimetype="text/plain; version=0.0.4")
+
+
+def start_routines():
+    return shared_state.link.send(commands.Start())
+
+
+def stop_routines():
+    return shared_state.link.send(commands.Stop())
+
+
+def start_calibration():
+    subprocess.Popen(["python3", "../scripts/calibrate_sensor.py"])
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
 
     if request.method == "POST":
+        # Handle routine toggles (before a start, so that only the selected routines are started)
+        new_active = set()
+        for key in request.form.keys():
+            if key in shared_state.available_routines:
+                new_active.add(key)
+        shared_state.link.send(commands.SetRoutines(new_active))
+
         # Handle Start
         if "start" in request.form:
-            shared_state.is_running = True  # This will signal main to launch threads (already running)
+            start_routines()
         
         # Handle Stop
         elif "stop" in request.form:
-            shared_state.is_running = False
-            if shared_state.routines_instance:
-                shared_state.routines_instance.shutdown_event.set()
-                shared_state.routines_instance.handle_shutdown(None)
+            stop_routines()
 
         # Handle Calibrate
-        elif "calibrate" in request.form and not shared_state.is_running:
-            subprocess.Popen(["python3", "../scripts/calibrate_sensor.py"])
-
-        # Handle routine toggles
-        new_active = set()
-        for key in request.form.keys():
-            if key in shared_state.active_routines:
-                new_active.add(key)
-        shared_state.active_routines = new_active
+        elif "calibrate" in request.form and not shared_state.link.snapshot().is_running:
+            start_calibration()
 
         return redirect("/")
 
-    # Render page
-    sensor_data = {s.name: s.value for s in shared_state.sensors}
-    actuator_data = {a.name: a.state for a in shared_state.actuators}
-
-    return render_template(
-        "index.html",
-        sensors=sensor_data,
-        actuators=actuator_data,
-        is_running=shared_state.is_running,
-        routines=list(shared_state.active_routines),
-        active_routines=shared_state.active_routines,
-        prompt_messages=shared_state.prompt_messages
+    # Render page (from the process image of the controller), only if the image or the prompt log have changed
+    global page_cache
+    key = (shared_state.link.image.sequence(), shared_state.prompt_log.seq)
+    cached_key, page, page_gzip = page_cache
+    if key != cached_key:
+        snapshot = shared_state.link.snapshot()
+
+        t_start = time.perf_counter()
+        page = render_template(
+            "index.html",
+            sensors=snapshot.sensors,
+            actuators=snapshot.actuators,
+            is_running=snapshot.is_running,
+            routines=sorted(shared_state.available_routines),
+            active_routines=snapshot.active_routines,
+            routine_status=snapshot.routine_status,
+            estimates=snapshot.estimates,
+            prompt_messages=[record.message for record in shared_state.prompt_log.after(max(key[1] - 100, 0))[0]]
+        ).encode()
+        render_time.observe(time.perf_counter() - t_start)
+        page_gzip = gzip.compress(page, 6)
+        page_cache = (key, page, page_gzip)
+    return cached_response(f"{live_data.instance}-page-{key[0]}-{key[1]}", page, page_gzip, "text/html")
+
+# JSON API for the Svelte frontend ('webgui/frontend')
+@app.route("/api/data")
+def api_data():
+    """
+    Current values (see 'webgui/live_data.py'); clients which send the ETag of their last response get a 304
+    until the controller has published new values.
+    """
+    live_data.start()
+    snapshot = live_data.refresh()
+    return cached_response(snapshot.etag, snapshot.json, snapshot.gzip, "application/json")
+
+
+@app.route("/api/action", methods=["POST"])
+def api_action():
+    command = request.get_json(silent=True) or {}
+    action = command.get("action")
+    link = shared_state.link
+
+    if action == "start":
+        result = start_routines()
+    elif action == "stop":
+        result = stop_routines()
+    elif action == "calibrate":
+        if link.snapshot().is_running:
+            return jsonify(status="error", message="Calibration is only possible while the routines are stopped."), 409
+        start_calibration()
+        result = {"status": "ok"}
+    elif action in ("set_routines", "enable_routine", "disable_routine"):
+        selected = set(command.get("routines", [])) if action == "set_routines" else {command.get("routine")}
+        unknown = selected - shared_state.available_routines
+        if unknown:
+            return jsonify(status="error", message=f"Unknown routines: {sorted(unknown, key=str)}"), 400
+        if action == "set_routines":
+            result = link.send(commands.SetRoutines(selected))
+        elif action == "enable_routine":
+            result = link.send(commands.EnableRoutine(command["routine"]))
+        else:
+            result = link.send(commands.DisableRoutine(command["routine"]))
+    elif action == "reload_parameters":
+        result = link.send(commands.ReloadParameters())
+    else:
+        return jsonify(status="error", message=f"Unknown action '{action}'."), 400
+
+    if result is None:
+        return jsonify(status="pending", message="The command has not taken effect yet (e.g. start while the routines "
+                                                 "of the last run are finishing)."), 202
+    if result["status"] != "ok":
+        return jsonify(result), 400
+    snapshot = link.snapshot()
+    return jsonify(status="ok", is_running=snapshot.is_running, active_routines=sorted(snapshot.active_routines))
+
+
+@app.route("/api/stream")
+def api_stream():
+    """
+    Server-Sent Events with the changed sensor values and actuator states (see 'webgui/live_data.py').
+    """
+    live_data.start()
+    last_event_id = request.headers.get("Last-Event-ID", request.args.get("since"))
+    last_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    # each stream occupies a worker of the server until the client disconnects
+    slots = shared_state.long_request_slots
+    if slots is not None and not slots.acquire(blocking=False):
+        return jsonify(status="error", message="Too many open streams, poll '/api/data' instead."), 503, {"Retry-After": "30"}
+
+    response = Response(live_data.stream(last_seq), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if slots is not None:
+        response.call_on_close(slots.release)
+    return response
+
+@app.route("/api/prompt")
+def api_prompt():
+    """
+    Prompt log records after sequence number 'after' with at least severity 'level' (debug, info, warning, error).
+    With 'wait' (max. 30 s), the request is held until a new record arrives (long polling). At most 'limit' records
+    (the oldest ones), the rest follow with the next request ('after' = 'seq' of the response).
+    """
+    try:
+        after = int(request.args.get("after", 0))
+        wait = min(float(request.args.get("wait", 0)), 30.0)
+        limit = int(request.args.get("limit", 500))
+    except ValueError as e:
+        return jsonify(status="error", message=str(e)), 400
+    level = request.args.get("level", "debug")
+    if level not in shared_state.LEVELS:
+        return jsonify(status="error", message=f"Unknown level '{level}'. Known levels: {list(shared_state.LEVELS)}"), 400
+
+    prompt_log = shared_state.prompt_log
+    slots = shared_state.long_request_slots
+    if wait > 0 and (slots is None or slots.acquire(blocking=False)):  # answered directly if all slots are in use
+        try:
+            prompt_log.wait(after, wait)
+        finally:
+            if slots is not None:
+                slots.release()
+    records, next_seq = prompt_log.after(after, level, limit)
+    return jsonify(
+        seq=next_seq,                  # next request: 'after' = seq
+        first_seq=prompt_log.first_seq,  # older records have been dropped
+        records=[record._asdict() for record in records],
     )
 
+
+@app.route("/api/history")
+def api_history():
+    """
+    Downsampled time series from the measurement files, e.g. '/api/history?signals=B0101,B0201&from=2025-06-23&points=800'
+    ('from' / 'to' as Unix time or ISO date, default: last 24 h; 'format=binary' for float32 arrays).
+    """
+    signals = [name for name in request.args.get("signals", "").split(",") if name]
+    if not signals:
+        return jsonify(status="error", message="No signals given."), 400
+    try:
+        t_to = history.parse_time(request.args.get("to"), time.time())
+        t_from = history.parse_time(request.args.get("from"), t_to - 86400)
+        points = int(request.args.get("points", 800))
+    except ValueError as e:
+        return jsonify(status="error", message=str(e)), 400
+    if t_from >= t_to:
+        return jsonify(status="error", message="'from' has to be before 'to'."), 400
+
+    result = history.query(signals, t_from, t_to, points)
+    if request.args.get("format") == "binary":
+        return Response(history.to_binary(result), mimetype="application/octet-stream")
+    return jsonify(history.to_json(result))
+
 # if __name__ == "__main__":
 #     app.run(debug=False, port=5050, host="0.0.0.0")
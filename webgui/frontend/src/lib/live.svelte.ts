@@ -0,0 +1,91 @@
+type Values = Record<string, number | boolean | null>;
+
+export type RoutineStatus = {
+  state: "stopped" | "running" | "stopping" | "backoff";
+  loops: number;
+  last_loop_s: number | null;
+  restarts: number;
+};
+
+export type LiveState = {
+  seq: number;
+  sensors: Values;
+  actuators: Values;
+  routines: Record<string, RoutineStatus>;
+  estimates: Record<string, number | null>;
+  is_running: boolean;
+  active_routines: string[];
+  connected: boolean;
+};
+
+// Live values from the server: one snapshot, then only the changed values ('/api/stream', Server-Sent Events).
+// The browser reconnects automatically and resumes from the last sequence number (Last-Event-ID). If the server
+// refuses the stream (all stream slots in use), '/api/data' is polled instead; the browser revalidates with the
+// ETag of its cached response, so unchanged data costs a 304 without body.
+export let live = () => {
+  const state = $state<LiveState>({
+    seq: 0,
+    sensors: {},
+    actuators: {},
+    routines: {},
+    estimates: {},
+    is_running: false,
+    active_routines: [],
+    connected: false,
+  });
+
+  $effect(() => {
+    const source = new EventSource("/api/stream");
+
+    let poller: ReturnType<typeof setInterval> | undefined;
+
+    const applySnapshot = (snapshot: any) => {
+      state.seq = snapshot.seq;
+      state.sensors = snapshot.sensors;
+      state.actuators = snapshot.actuators;
+      state.routines = snapshot.routines;
+      state.estimates = snapshot.estimates;
+      state.is_running = snapshot.is_running;
+      state.active_routines = snapshot.active_routines;
+    };
+
+    const poll = async () => {
+      try {
+        const response = await fetch("/api/data", { cache: "no-cache" });
+        const snapshot = await response.json();
+        if (snapshot.seq !== state.seq) applySnapshot(snapshot);
+        state.connected = true;
+      } catch {
+        state.connected = false;
+      }
+    };
+
+    source.addEventListener("snapshot", (event) => applySnapshot(JSON.parse((event as MessageEvent).data)));
+
+    source.addEventListener("update", (event) => {
+      const update = JSON.parse((event as MessageEvent).data);
+      state.seq = update.seq;
+      Object.assign(state.sensors, update.sensors ?? {});
+      Object.assign(state.actuators, update.actuators ?? {});
+      Object.assign(state.routines, update.routines ?? {});
+      Object.assign(state.estimates, update.estimates ?? {});
+      Object.assign(state, update.status ?? {});
+    });
+
+    source.onopen = () => (state.connected = true);
+    source.onerror = () => {
+      state.connected = false;
+      if (source.readyState === EventSource.CLOSED && poller === undefined) {
+        poll();
+        poller = setInterval(poll, 2000);
+      }
+    };
+
+    return () => {
+      source.close();
+      clearInterval(poller);
+    };
+  });
+
+  return state;
+};
@@ -5,6 +5,9 @@ import path from "path";
 
 export default defineConfig({
   plugins: [tailwindcss(), sveltekit()],
+  server: {
+    proxy: { "/api": "http://localhost:5050" }, // Flask server of main_NH-25.py
+  },
   build: {
     outDir: path.resolve(__dirname, "../frontend/public"), // adjust to match Flask's static folder
     emptyOutDir: true,
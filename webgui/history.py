@@ -0,0 +1,215 @@
+import csv
+import datetime
+import functools
+import json
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+from src.utils import get_file_path
+from webgui import shared_state
+
+
+FILE_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})_.+_measurement_data\.csv$")
+
+DAY_CACHE_SIZE = 14       # parsed daily files kept in memory (about 2-3 MB per day)
+RESPONSE_CACHE_SIZE = 64  # downsampled responses for closed days
+MAX_POINTS = 10000
+
+
+def archive_files():
+    """
+    Daily measurement files in the data folder by date.
+    """
+    data_dir = get_file_path("data", "")
+    files = {}
+    for file_name in os.listdir(data_dir):
+        match = FILE_NAME.match(file_name)
+        if match:
+            files[datetime.date.fromisoformat(match.group(1))] = os.path.join(data_dir, file_name)
+    return files
+
+
+def local_epoch(timestamps):
+    """
+    Local time strings ('%Y-%m-%d %H:%M:%S') to Unix time [s], vectorized (per row conversion only on DST change days).
+    """
+    naive = np.array(timestamps, dtype="datetime64[s]").astype(np.int64).astype(np.float64)
+    if naive.size == 0:
+        return naive
+    first = datetime.datetime.fromisoformat(timestamps[0])
+    last = datetime.datetime.fromisoformat(timestamps[-1])
+    offset_first = time.mktime(first.timetuple()) - naive[0]
+    offset_last = time.mktime(last.timetuple()) - naive[-1]
+    if offset_first == offset_last:
+        return naive + offset_first
+    return np.array([time.mktime(datetime.datetime.fromisoformat(t).timetuple()) for t in timestamps])
+
+
+@functools.lru_cache(maxsize=DAY_CACHE_SIZE)
+def load_day(file_path, mtime):
+    """
+    Parse one daily measurement file into {signal: (times, values)}; sensor values, actuator states (0/1)
+    and CPU temperature. 'mtime' is part of the cache key, the file of the current day is parsed again when modified.
+    """
+    rows = {}
+    with open(file_path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 9:
+                continue
+            io_type = row[3]
+            if io_type == "Sensor" or io_type == "CPU":
+                text = row[8]
+            elif io_type == "Actuator":
+                text = row[7]
+            else:
+                continue
+            if text == "True":
+                value = 1.0
+            elif text == "False":
+                value = 0.0
+            else:
+                try:
+                    value = float(text)
+                except ValueError:
+                    continue
+            timestamps, values = rows.setdefault(row[5], ([], []))
+            timestamps.append(row[0])
+            values.append(value)
+
+    signals = {}
+    for name, (timestamps, values) in rows.items():
+        t = local_epoch(timestamps)
+        order = np.argsort(t, kind="stable")  # rows of one cycle are written by several threads
+        signals[name] = (t[order], np.array(values, dtype=np.float32)[order])
+    return signals
+
+
+def downsample(t, v, t_from, t_to, buckets):
+    """
+    Minimum, maximum and mean per time bucket (empty buckets are left out). Peaks are kept by min / max.
+    """
+    if t.size <= buckets:
+        return t, v, v, v
+    width = (t_to - t_from)/buckets
+    index = ((t - t_from)/width).astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+    counts = np.diff(np.append(starts, t.size))
+    return (
+        t_from + (index[starts] + 0.5)*width,
+        np.minimum.reduceat(v, starts),
+        np.maximum.reduceat(v, starts),
+        np.add.reduceat(v.astype(np.float64), starts)/counts,
+    )
+
+
+def recent(name, t_from, t_to):
+    """
+    Times and values of a signal from the in-memory history of the controller (views, no copy), None if the
+    history does not reach back to 't_from' (within one sampling interval).
+    """
+    buffer = shared_state.history.get(name) if shared_state.history is not None else None
+    if buffer is None:
+        return None
+    t, v = buffer.view()
+    if t.size == 0:
+        return None
+    spacing = (t[-1] - t[0])/(t.size - 1) if t.size > 1 else 0.0
+    if t[0] - spacing > t_from:
+        return None
+    i, j = np.searchsorted(t, [t_from, t_to])
+    return t[i:j], v[i:j]
+
+
+def compute(signals, t_from, t_to, points):
+    """
+    Downsampled time series of the signals between 't_from' and 't_to' (Unix time) with at most 'points' per signal.
+    Recent ranges are taken from the in-memory history, older ones from the daily measurement files.
+    """
+    parts = {name: [] for name in signals}
+    from_files = []
+    for name in signals:
+        values = recent(name, t_from, t_to)
+        if values is None:
+            from_files.append(name)
+        else:
+            parts[name].append(values)
+
+    files = archive_files() if from_files else {}
+    day = datetime.datetime.fromtimestamp(t_from).date()
+    last_day = datetime.datetime.fromtimestamp(t_to).date()
+    while from_files and day <= last_day:
+        file_path = files.get(day)
+        if file_path is not None:
+            data = load_day(file_path, os.stat(file_path).st_mtime_ns)
+            for name in from_files:
+                if name in data:
+                    t, v = data[name]
+                    i, j = np.searchsorted(t, [t_from, t_to])
+                    parts[name].append((t[i:j], v[i:j]))
+        day += datetime.timedelta(days=1)
+
+    result = {}
+    for name, chunks in parts.items():
+        t = np.concatenate([c[0] for c in chunks]) if chunks else np.zeros(0)
+        v = np.concatenate([c[1] for c in chunks]) if chunks else np.zeros(0, dtype=np.float32)
+        result[name] = downsample(t, v, t_from, t_to, points)
+    return {"from": t_from, "to": t_to, "points": points, "signals": result}
+
+
+# responses for closed days do not change
+compute_closed = functools.lru_cache(maxsize=RESPONSE_CACHE_SIZE)(compute)
+
+
+def query(signals, t_from, t_to, points):
+    points = max(1, min(int(points), MAX_POINTS))
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp()
+    if t_to <= today:
+        return compute_closed(tuple(signals), t_from, t_to, points)
+    return compute(tuple(signals), t_from, t_to, points)
+
+
+def parse_time(text, default):
+    """
+    Unix time [s] or ISO date / datetime (local time).
+    """
+    if not text:
+        return default
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def to_json(result):
+    """
+    Columnar JSON: per signal lists of times [s] and min / max / mean values.
+    """
+    signals = {}
+    for name, (t, v_min, v_max, v_mean) in result["signals"].items():
+        signals[name] = {
+            "t": np.round(t).astype(np.int64).tolist(),
+            "min": np.round(v_min.astype(np.float64), 4).tolist(),
+            "max": np.round(v_max.astype(np.float64), 4).tolist(),
+            "mean": np.round(v_mean.astype(np.float64), 4).tolist(),
+        }
+    return {"from": result["from"], "to": result["to"], "points": result["points"], "signals": signals}
+
+
+def to_binary(result):
+    """
+    Binary arrays: length of a JSON header (uint32), the header (signal names and number of points), then per
+    signal float32 arrays of the time offset to 'from' [s], min, max and mean (little endian).
+    """
+    header = {"from": result["from"], "to": result["to"], "columns": ["t", "min", "max", "mean"],
+              "signals": [[name, len(columns[0])] for name, columns in result["signals"].items()]}
+    header = json.dumps(header).encode()
+    header += b" "*(-len(header) % 4)  # arrays start at a multiple of 4 bytes (Float32Array)
+    chunks = [struct.pack("<I", len(header)), header]
+    for t, v_min, v_max, v_mean in result["signals"].values():
+        for column in (t - result["from"], v_min, v_max, v_mean):
+            chunks.append(np.asarray(column, dtype="<f4").tobytes())
+    return b"".join(chunks)
@@ -0,0 +1,437 @@
+import collections
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from webgui import shared_state
+from src import metrics
+from src.commands import Command
+from src.supervisor import STATES
+from src.signal_history import SignalHistory
+from src.soft_sensor import SoftSensor
+
+
+# consistent copy of the shared process image (values of sensors without a reading are None)
+ImageSnapshot = collections.namedtuple("ImageSnapshot", [
+    "seq", "time", "command_seq", "is_running", "active_routines", "routine_status", "sensors", "sensor_times",
+    "actuators", "estimates"])
+
+
+class SharedImage:
+    HEADER = 3  # time of publication, is_running, id of the last processed command
+    ROUTINE_FIELDS = 5  # selected, state (index in 'STATES'), loops, duration of the last loop, restarts
+
+    def __init__(self, sensor_names, actuator_names, routine_names, estimate_names=SoftSensor.NAMES, name=None):
+        """
+        Process image of the controller in shared memory, written by the controller and read by the GUI process.
+        Layout: write counter (int64), then float64 values: header, the status of each routine, sensor values,
+        sensor timestamps, actuator states and the values of the soft sensor ('estimate_names'). Reads need no lock (seqlock): the writer makes the counter odd while
+        writing, readers retry if the counter was odd or has changed during their copy. With 'name', an existing
+        image is attached (GUI process), otherwise a new one is created (controller).
+        """
+        self.sensor_names = list(sensor_names)
+        self.actuator_names = list(actuator_names)
+        self.routine_names = list(routine_names)
+        self.estimate_names = list(estimate_names)
+
+        n_routines, n_sensors = len(self.routine_names), len(self.sensor_names)
+        self.routine_slice = slice(self.HEADER, self.HEADER + n_routines*self.ROUTINE_FIELDS)
+        self.sensor_slice = slice(self.routine_slice.stop, self.routine_slice.stop + n_sensors)
+        self.sensor_time_slice = slice(self.sensor_slice.stop, self.sensor_slice.stop + n_sensors)
+        self.actuator_slice = slice(self.sensor_time_slice.stop, self.sensor_time_slice.stop + len(self.actuator_names))
+        self.estimate_slice = slice(self.actuator_slice.stop, self.actuator_slice.stop + len(self.estimate_names))
+        self.size = self.estimate_slice.stop
+
+        # values which are published as soon as they change (the others with the next acquisition cycle):
+        # is_running, last command, selection, state and restarts of the routines, actuator states
+        self.status_mask = np.zeros(self.size, dtype=bool)
+        self.status_mask[1:self.HEADER] = True
+        routine_mask = self.status_mask[self.routine_slice].reshape(-1, self.ROUTINE_FIELDS)  # view
+        routine_mask[:, [0, 1, 4]] = True
+        self.status_mask[self.actuator_slice] = True
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=8*(1 + self.size))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.counter = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((self.size,), dtype=np.float64, buffer=self.shm.buf, offset=8)
+        if self.owner:
+            self.counter[0] = 0
+            self.data[:] = math.nan
+
+
+    @property
+    def layout(self):
+        """
+        Everything needed to attach to the image from another process.
+        """
+        return {"name": self.shm.name, "sensor_names": self.sensor_names, "actuator_names": self.actuator_names,
+                "routine_names": self.routine_names, "estimate_names": self.estimate_names}
+
+
+    @classmethod
+    def attach(cls, layout):
+        return cls(layout["sensor_names"], layout["actuator_names"], layout["routine_names"], layout["estimate_names"],
+                   name=layout["name"])
+
+
+    def pack(self, t, is_running, command_seq, active_routines, routine_status, sensor_values, sensor_times,
+             actuator_states, estimates):
+        """
+        Complete image as one array (prepared before writing, so that the write is a single copy).
+        'routine_status' as returned by 'RoutineSupervisor.status' (empty: not known).
+        """
+        values = np.empty(self.size)
+        values[:self.HEADER] = (t, is_running, command_seq)
+        routines = values[self.routine_slice].reshape(-1, self.ROUTINE_FIELDS)  # view
+        routines[:] = math.nan
+        for i, name in enumerate(self.routine_names):
+            routines[i, 0] = name in active_routines
+            status = routine_status.get(name)
+            if status is not None:
+                routines[i, 1:] = (STATES.index(status["state"]), status["loops"], to_float(status["last_loop_s"]),
+                                   status["restarts"])
+        values[self.sensor_slice] = sensor_values
+        values[self.sensor_time_slice] = sensor_times
+        values[self.actuator_slice] = actuator_states
+        values[self.estimate_slice] = [estimates.get(name, math.nan) for name in self.estimate_names]
+        return values
+
+
+    def write(self, values):
+        # single writer (see 'ImagePublisher')
+        self.counter[0] += 1  # odd: write in progress
+        self.data[:] = values
+        self.counter[0] += 1
+
+
+    def sequence(self):
+        """
+        Number of the last complete write (cheap check for changes, e.g. for ETags).
+        """
+        return int(self.counter[0])//2
+
+
+    def read(self, max_retries=1000):
+        for _ in range(max_retries):
+            seq = int(self.counter[0])
+            if seq % 2 == 0:
+                data = self.data.copy()
+                if int(self.counter[0]) == seq:
+                    return self.unpack(seq//2, data)
+            time.sleep(0)  # writer active, give up the time slice
+        raise TimeoutError("No consistent read of the shared process image.")
+
+
+    def unpack(self, seq, data):
+        def optional(value):
+            return None if math.isnan(value) else float(value)
+
+        routines = data[self.routine_slice].reshape(-1, self.ROUTINE_FIELDS)
+        actuator_states = data[self.actuator_slice]
+        return ImageSnapshot(
+            seq=seq,
+            time=optional(data[0]),
+            is_running=bool(data[1] == 1.0),
+            command_seq=0 if math.isnan(data[2]) else int(data[2]),
+            active_routines={name for name, fields in zip(self.routine_names, routines) if fields[0] == 1.0},
+            routine_status={name: {"state": STATES[int(state)], "loops": int(loops), "last_loop_s": optional(last_loop),
+                                   "restarts": int(restarts)}
+                            for name, (_, state, loops, last_loop, restarts) in zip(self.routine_names, routines)
+                            if not math.isnan(state)},
+            sensors=dict(zip(self.sensor_names, map(optional, data[self.sensor_slice]))),
+            sensor_times=dict(zip(self.sensor_names, map(optional, data[self.sensor_time_slice]))),
+            actuators={name: None if math.isnan(state) else bool(state == 1.0)
+                       for name, state in zip(self.actuator_names, actuator_states)},
+            estimates=dict(zip(self.estimate_names, map(optional, data[self.estimate_slice]))),
+        )
+
+
+    def close(self):
+        self.counter = self.data = None  # release the views on the buffer before closing
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class ImagePublisher:
+    def __init__(self, image, interval=0.2):
+        """
+        Copies sensor values, actuator states and the routine status of 'shared_state' into the shared image
+        (controller side). A new image is published once per acquisition cycle (see 'notify') and after each
+        processed command; in between, the status is checked every 'interval' and only published if it has
+        changed (e.g. an actuator switched). Unchanged images keep their sequence number, so GUI clients which
+        are up to date get a 304 (see 'webgui/live_data.py').
+        """
+        self.image = image
+        self.interval = interval
+        self.command_seq = 0
+        self.last_values = None
+        self.lock = threading.Lock()
+        self.cycle_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.publish_time = metrics.histogram("nh_image_publish_seconds", "Duration of publishing the shared process image")
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="image_publisher", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def notify(self):
+        """
+        Called after each acquisition cycle (see 'routines.acquisition_listeners').
+        """
+        self.cycle_event.set()
+
+
+    def run(self):
+        while not self.stop_event.is_set():
+            cycle = self.cycle_event.wait(self.interval)
+            self.cycle_event.clear()
+            self.publish(changed_only=not cycle)
+
+
+    def publish(self, changed_only=False):
+        t_start = time.perf_counter()
+        sensor_map, actuator_map = shared_state.sensor_map, shared_state.actuator_map
+        r = shared_state.routines_instance
+        entries = r.signals.entries if r is not None else {}
+        supervisor = shared_state.supervisor
+        routine_status = supervisor.status() if supervisor is not None else {}
+
+        sensor_values = [to_float(getattr(sensor_map.get(name), "value", None)) for name in self.image.sensor_names]
+        sensor_times = [entries[name][1] if name in entries else math.nan for name in self.image.sensor_names]
+        actuator_states = [to_float(getattr(actuator_map.get(name), "state", None)) for name in self.image.actuator_names]
+        estimates = r.soft_sensor.values if r is not None else {}
+
+        with self.lock:
+            values = self.image.pack(time.time(), shared_state.is_running, self.command_seq, shared_state.active_routines,
+                                     routine_status, sensor_values, sensor_times, actuator_states, estimates)
+            mask = self.image.status_mask
+            if changed_only and self.last_values is not None and \
+                    np.array_equal(values[mask], self.last_values[mask], equal_nan=True):
+                return
+            self.image.write(values)
+            self.last_values = values
+        self.publish_time.observe(time.perf_counter() - t_start)
+
+
+class CommandServer:
+    def __init__(self, commands, replies, publisher, bus):
+        """
+        Receives the messages of the GUI process (controller side). Commands (see 'src/commands.py') are passed
+        to the command bus; when a command has taken effect, the image is published and the result is sent on
+        the reply queue. Requests (dicts with 'id' and 'action', e.g. the metrics) are answered directly.
+        """
+        self.commands = commands
+        self.replies = replies
+        self.publisher = publisher
+        self.bus = bus
+        self.thread = None
+        bus.listeners.append(self.acknowledge)
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="command_server", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.commands.put(None)
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def run(self):
+        while True:
+            message = self.commands.get()
+            if message is None:
+                return
+            if isinstance(message, Command):
+                self.bus.put(message)
+            elif message.get("action") == "metrics":
+                self.replies.put((message["id"], metrics.registry.render()))
+            else:
+                self.replies.put((message["id"], None))
+
+
+    def acknowledge(self, command, result):
+        if command.id:
+            self.publisher.command_seq = command.id
+        self.publisher.publish()  # new status visible before the reply
+        if command.id:
+            self.replies.put((command.id, result))
+
+
+class PromptForwarder:
+    def __init__(self, records):
+        """
+        Forwards the prompt log of the controller to the GUI process.
+        """
+        self.records = records
+        self.thread = None
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="prompt_forwarder", daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+        seq = shared_state.prompt_log.seq
+        while True:
+            shared_state.prompt_log.wait(seq, 1.0)
+            records, seq = shared_state.prompt_log.after(seq)
+            for record in records:
+                self.records.put(tuple(record))
+
+
+class ControllerLink:
+    def __init__(self, image, commands, replies):
+        """
+        Access of the GUI to the controller: reads the shared image and sends commands.
+        """
+        self.image = image
+        self.commands = commands
+        self.replies = replies
+        self.command_seq = 0
+        self.lock = threading.Lock()
+        self.request_lock = threading.Lock()
+
+
+    def snapshot(self):
+        return self.image.read()
+
+
+    def next_id(self):
+        with self.lock:
+            self.command_seq += 1
+            return self.command_seq
+
+
+    def send(self, command, timeout=2.0):
+        """
+        Send a command (see 'src/commands.py') and wait until it has taken effect. Returns the result
+        ({"status": "ok"} or {"status": "error", "message": ...}), None on timeout.
+        """
+        command.id = self.next_id()
+        return self.exchange(command, command.id, timeout)
+
+
+    def request(self, action, timeout=2.0, **arguments):
+        """
+        Send a request and return its result (None on timeout).
+        """
+        command_id = self.next_id()
+        return self.exchange(dict(arguments, id=command_id, action=action), command_id, timeout)
+
+
+    def exchange(self, message, message_id, timeout):
+        with self.request_lock:
+            self.commands.put(message)
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    reply_id, result = self.replies.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    return None
+                if reply_id == message_id:
+                    return result  # older replies (after a timeout) are dropped
+
+
+def receive_prompt_records(records):
+    while True:
+        seq, t, level, source, message = records.get()
+        shared_state.prompt_log.append(message, level, source, t)
+
+
+def serve_gui(ready_event, host="0.0.0.0", port=5050, workers=8):
+    try:
+        print("[Flask] Starting Flask server...")
+        from webgui.server import PooledWSGIServer
+        from webgui.app import app
+        server = PooledWSGIServer(host, port, app, workers)
+        shared_state.long_request_slots = server.long_request_slots
+        ready_event.set()  # socket is bound, requests are accepted from now on
+        server.serve_forever()
+    except Exception as e:
+        print(f"[Flask] Failed to start Flask: {e}")
+        ready_event.set()
+
+
+def run_gui(layout, commands, replies, prompt_records, ready_event, host, port, workers, history_layout):
+    """
+    Entry point of the GUI process.
+    """
+    image = SharedImage.attach(layout)
+    if history_layout is not None:
+        shared_state.history = SignalHistory.attach(history_layout)
+    shared_state.link = ControllerLink(image, commands, replies)
+    threading.Thread(target=receive_prompt_records, args=(prompt_records,), name="prompt_receiver", daemon=True).start()
+    threading.Thread(target=exit_with_controller, name="controller_watch", daemon=True).start()
+    serve_gui(ready_event, host, port, workers)
+
+
+def exit_with_controller():
+    # the GUI process is not terminated if the controller is killed (no clean-up), free the port
+    multiprocessing.parent_process().join()
+    os._exit(0)
+
+
+class GuiProcess:
+    def __init__(self, image, bus, host="0.0.0.0", port=5050, publish_interval=0.2, workers=8, history=None):
+        """
+        Web GUI in its own process: HTTP requests do not compete with the control threads for the GIL.
+        The controller publishes its state into the shared 'image' and executes the commands of the GUI
+        (passed to the command 'bus'). Requests are served by a fixed number of 'workers' threads. A shared
+        signal 'history' (see 'src/signal_history.py') is read by the GUI for recent trend lines.
+        """
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.replies = context.Queue()
+        self.prompt_records = context.Queue()
+        self.ready_event = context.Event()
+        self.process = context.Process(target=run_gui, name="gui", daemon=True, args=(
+            image.layout, self.commands, self.replies, self.prompt_records, self.ready_event, host, port, workers,
+            history.layout if history is not None else None))
+
+        self.publisher = ImagePublisher(image, publish_interval)
+        self.command_server = CommandServer(self.commands, self.replies, self.publisher, bus)
+        self.prompt_forwarder = PromptForwarder(self.prompt_records)
+
+
+    def start(self):
+        self.process.start()
+        self.publisher.start()
+        self.command_server.start()
+        self.prompt_forwarder.start()
+
+
+    def stop(self):
+        self.command_server.stop()
+        self.publisher.stop()
+        self.process.terminate()
+        self.process.join()
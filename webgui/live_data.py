@@ -0,0 +1,158 @@
+import collections
+import gzip
+import json
+import math
+import threading
+import time
+import uuid
+
+from webgui import shared_state
+
+
+# immutable state of the GUI after an update: JSON (plain and gzip compressed) and its ETag, shared by all clients
+Snapshot = collections.namedtuple("Snapshot", ["seq", "etag", "json", "gzip"])
+
+
+class LiveData:
+    def __init__(self, interval=1.0, history=60):
+        """
+        Publishes the sensor values and actuator states of the controller (shared process image) to the GUI
+        clients. One sampler thread compares the values once per 'interval' and keeps only the changes (all
+        changes of one interval are coalesced into one update with a sequence number). The JSON of each update
+        and of the complete state ('current') is serialized once and shared by all connected clients; the last
+        'history' updates are kept for reconnecting clients. The shared image is only read when the controller
+        has published a new one.
+        """
+        self.interval = interval
+        self.seq = 0
+        self.values = {"sensors": {}, "actuators": {}, "routines": {}, "estimates": {}, "status": {}}
+        self.image_seq = None  # sequence number of the shared image of the last update
+        self.current = None
+        self.instance = uuid.uuid4().hex[:8]  # ETags of an earlier GUI process do not match
+        self.updates = collections.deque(maxlen=history)  # (seq, JSON of the changes)
+        self.condition = threading.Condition()
+        self.update_lock = threading.Lock()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+
+    def start(self):
+        """
+        Start the sampler thread on first use (called by each API request, cheap when running).
+        """
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is None:
+                self.update()
+                self.thread = threading.Thread(target=self.run, name="live_data", daemon=True)
+                self.thread.start()
+
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.update()
+
+
+    def read_values(self):
+        snapshot = shared_state.link.snapshot()
+        sensors = {}
+        for name, value in snapshot.sensors.items():
+            if value is not None and not math.isfinite(value):
+                value = None  # not valid JSON
+            sensors[name] = value
+        status = {"is_running": snapshot.is_running, "active_routines": sorted(snapshot.active_routines)}
+        return snapshot.seq, {"sensors": sensors, "actuators": snapshot.actuators, "routines": snapshot.routine_status,
+                              "estimates": snapshot.estimates, "status": status}
+
+
+    def update(self):
+        """
+        Compare with the last published values and publish the changes (if any).
+        """
+        with self.update_lock:
+            if self.current is not None and shared_state.link.image.sequence() == self.image_seq:
+                return  # no new image
+            self.image_seq, values = self.read_values()
+            changes = {}
+            for group, current in values.items():
+                last = self.values[group]
+                changed = {name: value for name, value in current.items() if name not in last or last[name] != value}
+                if changed:
+                    changes[group] = changed
+            if not changes and self.current is not None:
+                return
+
+            t = time.time()
+            snapshot = dict(sensors=values["sensors"], actuators=values["actuators"], routines=values["routines"],
+                            estimates=values["estimates"], seq=self.seq + 1, time=t, **values["status"])
+            body = json.dumps(snapshot).encode()
+            current = Snapshot(self.seq + 1, f"{self.instance}-{self.seq + 1}", body, gzip.compress(body, 6))
+
+            with self.condition:
+                self.seq += 1
+                self.values = values
+                self.current = current
+                changes["seq"] = self.seq
+                changes["time"] = t
+                self.updates.append((self.seq, json.dumps(changes)))
+                self.condition.notify_all()
+
+
+    def refresh(self):
+        """
+        Latest state (see 'Snapshot'), updated first if the controller has published a new image.
+        """
+        self.update()
+        return self.current
+
+
+    def updates_after(self, seq):
+        """
+        Serialized updates after 'seq', or None if they are no longer in the history (client needs a new snapshot).
+        """
+        with self.condition:
+            if seq == self.seq:
+                return []
+            if not self.updates or seq < self.updates[0][0] - 1 or seq > self.seq:
+                return None
+            return [update for update in self.updates if update[0] > seq]
+
+
+    def wait(self, seq, timeout):
+        """
+        Block until an update after 'seq' is available or the timeout has passed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq
+
+
+    def stream(self, last_seq=None, heartbeat=15.0):
+        """
+        Server-Sent Events: a snapshot (unless the client can resume from 'last_seq'), then the updates.
+        """
+        if last_seq is None or self.updates_after(last_seq) is None:
+            snapshot = self.current
+            last_seq = snapshot.seq
+            yield f"event: snapshot\nid: {last_seq}\ndata: {snapshot.json.decode()}\n\n"
+
+        while True:
+            seq = self.wait(last_seq, heartbeat)
+            if seq == last_seq:
+                yield ": heartbeat\n\n"  # keeps proxies from closing the connection, detects closed clients
+                continue
+            updates = self.updates_after(last_seq)
+            if updates is None:  # client too slow, start again with a snapshot
+                snapshot = self.current
+                yield f"event: snapshot\nid: {snapshot.seq}\ndata: {snapshot.json.decode()}\n\n"
+                last_seq = snapshot.seq
+                continue
+            for update_seq, data in updates:
+                yield f"event: update\nid: {update_seq}\ndata: {data}\n\n"
+                last_seq = update_seq
+
+
+# one publisher for all clients of the GUI
+live_data = LiveData()
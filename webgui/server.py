@@ -0,0 +1,48 @@
+import queue
+import threading
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+    timeout = 5.0  # idle keep-alive connections are closed after this time [s] (each one occupies a worker)
+
+    def log_request(self, code="-", size="-"):
+        # access log only for failed requests (a log line costs more than answering a cached request)
+        if isinstance(code, int) and code >= 400:
+            super().log_request(code, size)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, workers=8, backlog=64):
+        """
+        WSGI server with a fixed number of worker threads (Flask's development server starts one thread per
+        request). Accepted connections wait in a queue of length 'backlog'; when it is full, the accept loop
+        blocks and further clients wait in the listen queue of the socket. Long-lived requests (event streams,
+        long polling) occupy a worker each, see 'long_request_slots'.
+        """
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+        self.workers = workers
+        self.requests = queue.Queue(maxsize=backlog)
+        # at most half of the workers for long-lived requests, the others stay free for short requests
+        self.long_request_slots = threading.BoundedSemaphore(max(workers//2, 1))
+        for i in range(workers):
+            threading.Thread(target=self.work, name=f"http_worker_{i}", daemon=True).start()
+
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+
+    def work(self):
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
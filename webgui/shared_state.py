@@ -1,5 +1,8 @@
+import collections
+import itertools
 import sys
 import threading
+import time
 
 
 # allows flasl GUI app and main from process control to access the same variables
@@ -24,28 +27,126 @@ active_routines = set([
     "evaporation",
     "concentrate_discharge",
     "observer",
-    "print_to_prompt"
+    "print_to_prompt",
+    "CaOH2_refill",
 ])
 
+# Routines which can be selected (e.g. via '/api/action')
+available_routines = frozenset(active_routines)
 
-# For shutdown from the Flask GUI
+
+# Routines instance of the controller (kept between runs, see 'src/controller.py') and supervisor of the
+# routine threads (state of each routine, see 'src/supervisor.py')
 routines_instance = None
+supervisor = None
+
+# Limit of concurrent long-lived requests (event streams, long polling) of the GUI server, None: no limit
+# (see 'webgui/server.py')
+long_request_slots = None
+
+# Access of the GUI process to the controller (shared process image and commands, see 'webgui/ipc.py')
+link = None
+
+# Recent sensor values of the controller (shared ring buffers, see 'src/signal_history.py'), None: files only
+history = None
+
+# Prompt log (ring buffer of the last messages, see 'PromptLog')
+PromptRecord = collections.namedtuple("PromptRecord", ["seq", "time", "level", "source", "message"])
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class PromptLog:
+    def __init__(self, capacity=1000):
+        """
+        Bounded log of prompt messages with sequence numbers (constant time append, oldest records are dropped).
+        Clients fetch the records after their last seen sequence number and can wait for new ones.
+        """
+        self.records = collections.deque(maxlen=capacity)
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.gui_pending = set()  # sources whose next message follows a '[[GUI]]' marker (observer alarms)
+
+    def set_capacity(self, capacity):
+        with self.condition:
+            if capacity != self.records.maxlen:
+                self.records = collections.deque(self.records, maxlen=capacity)
+
+    def append(self, message, level=None, source=None, timestamp=None):
+        source = source or routine_name(threading.current_thread())
+        with self.condition:
+            if message == "[[GUI]]":
+                self.gui_pending.add(source)
+                return
+            if level is None:
+                if source in self.gui_pending:
+                    level = "warning"
+                else:
+                    level = message_level(message)
+            self.gui_pending.discard(source)
+            self.seq += 1
+            self.records.append(PromptRecord(self.seq, timestamp or time.time(), level, source, message))
+            self.condition.notify_all()
+
+    def after(self, seq, min_level="debug", limit=None):
+        """
+        The oldest 'limit' records (all if None) after sequence number 'seq' with at least the given level, and
+        the sequence number up to which the records have been examined (the 'seq' of the next call, nothing is
+        skipped). Both from one consistent read of the log.
+        """
+        threshold = LEVELS[min_level]
+        with self.condition:
+            # records are ordered by sequence number: skip the ones already seen from the right end
+            n_new = min(max(self.seq - seq, 0), len(self.records))
+            new = list(itertools.islice(reversed(self.records), n_new))[::-1]
+            next_seq = self.seq
+        records = []
+        for record in new:
+            if LEVELS[record.level] >= threshold:
+                records.append(record)
+                if len(records) == limit:
+                    next_seq = record.seq  # later records are returned by the next call
+                    break
+        return records, next_seq
+
+    def wait(self, seq, timeout):
+        """
+        Block until a record after 'seq' exists or the timeout has passed (long polling).
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.seq > seq, timeout)
+
+    @property
+    def first_seq(self):
+        with self.condition:
+            return self.records[0].seq if self.records else self.seq + 1
+
+
+def routine_name(thread):
+    # threads created with a target are named 'Thread-N (target)'
+    name = thread.name
+    if name.endswith(")") and "(" in name:
+        return name[name.rindex("(") + 1:-1]
+    return name
+
+
+def message_level(message):
+    upper = message.upper()
+    if "ERROR" in upper or "FAILED" in upper:
+        return "error"
+    if "WARNING" in upper:
+        return "warning"
+    return "info"
+
+
+prompt_log = PromptLog()
 
-# Prompt message buffer
-prompt_messages = []
-prompt_lock = threading.Lock()
 
 class PromptLogger:
     def write(self, message):
         # Avoid blank lines
         if message.strip():
-            with prompt_lock:
-                prompt_messages.append(message.strip())
-                if len(prompt_messages) > 100:
-                    prompt_messages.pop(0)
+            prompt_log.append(message.strip())
 
     def flush(self):
         pass  # Required for Python's file-like API
-
-
-